@@ -0,0 +1,351 @@
+# coding=utf-8
+"""
+@Desc  : 数据流水线基准测试
+         生成合成 Verilog 语料，逐个阶段计时：提取合并、去注释、编码检测与读取、iverilog 语法检查、
+         各个 score_by_* 打分、切块、掩码、SFT 转换、评测指标，结果写成 JSON（files/sec、MB/sec、峰值 RSS）
+         每个阶段在新启动的子进程中运行，峰值 RSS 互不影响；准备数据的时间不计入阶段耗时
+         指定 --baseline 时与之前的结果比较，耗时或峰值内存超出容忍度的阶段视为退化，退出码为 1
+"""
+import io
+import os
+import sys
+import json
+import time
+import shutil
+import random
+import argparse
+import platform
+import resource
+import contextlib
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+MODULE_DIRS = ['code_sys', 'codeExtraction', 'sft_data', 'eval']
+
+
+class StageSkipped(Exception):
+    """
+    阶段依赖的外部工具 / 可选依赖不存在
+    """
+
+
+def setup_import_paths():
+    for directory in MODULE_DIRS:
+        path = os.path.join(REPO_ROOT, directory)
+        if path not in sys.path:
+            sys.path.insert(0, path)
+
+
+def corpus_files(corpus_dir):
+    paths = []
+    for root, _, files in os.walk(corpus_dir):
+        paths.extend(os.path.join(root, name) for name in files if name.endswith('.v'))
+    return sorted(paths)
+
+
+def load_lines(paths):
+    contents = {}
+    for path in paths:
+        with open(path, 'r', encoding='utf-8') as f:
+            contents[path] = f.readlines()
+    return contents
+
+
+# ------------------------------------------------------------------ 各阶段：setup(ctx) -> state，run(state) 计时
+def setup_extraction(ctx):
+    return ctx['corpus_dir'], os.path.join(ctx['work_dir'], 'merged')
+
+
+def run_extraction(state):
+    from demo02 import VerilogFileProcessor
+
+    VerilogFileProcessor(*state).run()
+
+
+def setup_comment_stripping(ctx):
+    return [''.join(lines) for lines in load_lines(ctx['paths']).values()]
+
+
+def run_comment_stripping(contents):
+    from demo03 import remove_comments_and_extract_verilog
+
+    for content in contents:
+        remove_comments_and_extract_verilog(content)
+
+
+def setup_decoding(ctx):
+    import code_test_mod3_4  # noqa: F401  缺少 chardet 时在 setup 阶段报告跳过
+
+    return ctx['paths']
+
+
+def run_decoding(paths):
+    from code_test_mod3_4 import read_file
+
+    for path in paths:
+        read_file(path)
+
+
+def setup_syntax_check(ctx):
+    if shutil.which('iverilog') is None:
+        raise StageSkipped('iverilog 未安装')
+    import code_test_mod3_4  # noqa: F401
+
+    return ctx['paths']
+
+
+def run_syntax_check(paths):
+    from code_test_mod3_4 import check_verilog_syntax_parallel
+
+    check_verilog_syntax_parallel(paths)
+
+
+def make_score_stage(function_name):
+    def setup(ctx):
+        import code_test_mod3_4  # noqa: F401
+
+        random.seed(0)  # score_by_repetition 随机采样行对
+        return load_lines(ctx['paths'])
+
+    def run(files_content):
+        import code_test_mod3_4
+
+        getattr(code_test_mod3_4, function_name)(files_content)
+
+    return setup, run
+
+
+def setup_line_count(ctx):
+    import code_test_mod3_4  # noqa: F401
+
+    return [len(lines) for lines in load_lines(ctx['paths']).values()]
+
+
+def run_line_count(line_counts):
+    from code_test_mod3_4 import score_by_line_count
+
+    for total_lines in line_counts:
+        score_by_line_count(total_lines)
+
+
+def setup_chunking(ctx):
+    return [(os.path.basename(path), index, lines)
+            for index, (path, lines) in enumerate(load_lines(ctx['paths']).items(), start=1)]
+
+
+def run_chunking(files):
+    from code_cut04_2 import file_rng, split_file_by_random_ratio
+    from verilog_boundary import build_boundary_index
+
+    for file_name, file_index, lines in files:
+        split_file_by_random_ratio(lines, file_name, file_index, rng=file_rng(0, lines),
+                                   boundaries=build_boundary_index(''.join(lines)))
+
+
+def chunk_corpus(paths):
+    """
+    与 code_cut04_2.process_file 相同的切块，返回 [(文件名, 文件下标, 块列表, 随机数流)]
+    """
+    from code_cut04_2 import file_rng, split_file_by_random_ratio
+    from verilog_boundary import build_boundary_index
+
+    chunked = []
+    for file_index, (path, lines) in enumerate(load_lines(paths).items(), start=1):
+        rng = file_rng(0, lines)
+        chunks = split_file_by_random_ratio(lines, os.path.basename(path), file_index, rng=rng,
+                                            boundaries=build_boundary_index(''.join(lines)))
+        chunked.append((os.path.basename(path), file_index, chunks, rng))
+    return chunked
+
+
+def mask_corpus(chunked):
+    from code_cut04_2 import mask_code_blocks
+
+    masked = []
+    for file_name, file_index, chunks, rng in chunked:
+        try:
+            masked.extend(mask_code_blocks(chunks, file_name, file_index, rng=rng))
+        except ValueError:
+            pass  # 与 code_cut04_2.main 一致，掩码失败的文件跳过
+    return masked
+
+
+def setup_masking(ctx):
+    return chunk_corpus(ctx['paths'])
+
+
+def run_masking(chunked):
+    mask_corpus(chunked)
+
+
+def setup_sft_conversion(ctx):
+    input_file = os.path.join(ctx['work_dir'], 'task2.jsonl')
+    with open(input_file, 'w', encoding='utf-8') as f:
+        for record in mask_corpus(chunk_corpus(ctx['paths'])):
+            f.write(json.dumps(record, ensure_ascii=False) + '\n')
+    return input_file, os.path.join(ctx['work_dir'], 'sft.jsonl')
+
+
+def run_sft_conversion(state):
+    from tran import transform_data
+
+    transform_data(*state, seed=0)
+
+
+def setup_eval_metrics(ctx):
+    import eval03  # noqa: F401  缺少 nltk / rouge_score 时在 setup 阶段报告跳过
+
+    rng = random.Random(0)
+    labels = [record['middle'] for record in mask_corpus(chunk_corpus(ctx['paths']))]
+    predictions = []
+    # 模拟模型输出：随机删掉 / 替换一个词
+    for label in labels:
+        words = label.split()
+        if words and rng.random() < 0.5:
+            index = rng.randrange(len(words))
+            words[index] = rng.choice(words) if rng.random() < 0.5 else ''
+        predictions.append(' '.join(words))
+    return predictions, labels
+
+
+def run_eval_metrics(state):
+    from code_metrics import calculate_code_metrics
+    from eval03 import calculate_total_scores
+
+    predictions, labels = state
+    calculate_total_scores(predictions, labels, workers=1)
+    calculate_code_metrics(predictions, labels, workers=1)
+    return len(labels)
+
+
+STAGES = {
+    'extraction': (setup_extraction, run_extraction),
+    'comment_stripping': (setup_comment_stripping, run_comment_stripping),
+    'decoding': (setup_decoding, run_decoding),
+    'syntax_check': (setup_syntax_check, run_syntax_check),
+    'score_by_repetition': make_score_stage('score_by_repetition'),
+    'score_by_keyword_occurrence': make_score_stage('score_by_keyword_occurrence'),
+    'score_by_code_to_comment_ratio': make_score_stage('score_by_code_to_comment_ratio'),
+    'score_by_code_length_diversity': make_score_stage('score_by_code_length_diversity'),
+    'score_by_information_entropy': make_score_stage('score_by_information_entropy'),
+    'score_by_line_count': (setup_line_count, run_line_count),
+    'chunking': (setup_chunking, run_chunking),
+    'masking': (setup_masking, run_masking),
+    'sft_conversion': (setup_sft_conversion, run_sft_conversion),
+    'eval_metrics': (setup_eval_metrics, run_eval_metrics),
+}
+
+
+def peak_rss_mb():
+    # Linux 上 ru_maxrss 的单位是 KB；子进程（如语法检查调用的 iverilog）单独统计
+    self_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    children_rss = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss
+    scale = 1 / (1024 * 1024) if sys.platform == 'darwin' else 1 / 1024
+    return round(max(self_rss, children_rss) * scale, 2)
+
+
+# 在子进程中运行一个阶段
+def run_stage(name, ctx):
+    os.environ['TQDM_DISABLE'] = '1'
+    setup_import_paths()
+    setup, run = STAGES[name]
+    total_bytes = sum(os.path.getsize(path) for path in ctx['paths'])
+    # 屏蔽各脚本的 print 输出
+    with contextlib.redirect_stdout(io.StringIO()):
+        try:
+            state = setup(ctx)
+        except StageSkipped as e:
+            return {'skipped': str(e)}
+        except ImportError as e:
+            return {'skipped': f'缺少依赖: {e}'}
+        start = time.perf_counter()
+        items = run(state)
+        seconds = time.perf_counter() - start
+
+    result = {
+        'seconds': round(seconds, 4),
+        'files': len(ctx['paths']),
+        'bytes': total_bytes,
+        'files_per_sec': round(len(ctx['paths']) / seconds, 2) if seconds > 0 else None,
+        'mb_per_sec': round(total_bytes / (1 << 20) / seconds, 3) if seconds > 0 else None,
+        'peak_rss_mb': peak_rss_mb(),
+    }
+    if items is not None:
+        result['items'] = items
+        result['items_per_sec'] = round(items / seconds, 2) if seconds > 0 else None
+    return result
+
+
+def run_benchmarks(corpus_dir, work_dir, stages=None):
+    ctx = {'corpus_dir': corpus_dir, 'work_dir': work_dir, 'paths': corpus_files(corpus_dir)}
+    results = {}
+    spawn = multiprocessing.get_context('spawn')
+    for name in stages or STAGES:
+        # 每个阶段一个新进程，峰值 RSS 只反映该阶段
+        with ProcessPoolExecutor(max_workers=1, mp_context=spawn) as executor:
+            results[name] = executor.submit(run_stage, name, ctx).result()
+        status = results[name].get('skipped') or f"{results[name]['seconds']:.3f}s"
+        print(f"{name:<34} {status}")
+    return results
+
+
+def compare_results(current, baseline, tolerance=0.2):
+    """
+    :return: 退化的阶段列表 [(阶段, 指标, 基线值, 当前值)]
+    """
+    regressions = []
+    for name, result in current['stages'].items():
+        base = baseline.get('stages', {}).get(name)
+        if not base or 'skipped' in result or 'skipped' in base:
+            continue
+        for metric in ('seconds', 'peak_rss_mb'):
+            if base[metric] and result[metric] > base[metric] * (1 + tolerance):
+                regressions.append((name, metric, base[metric], result[metric]))
+    return regressions
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='数据流水线基准测试')
+    parser.add_argument('--work-dir', default='bench_work')
+    parser.add_argument('--output', default='bench_results.json')
+    parser.add_argument('--netlists', type=int, default=200)
+    parser.add_argument('--rtl', type=int, default=200)
+    parser.add_argument('--testbenches', type=int, default=100)
+    parser.add_argument('--scale', type=float, default=1.0, help='文件大小缩放系数')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--stages', nargs='*', choices=list(STAGES), help='只运行指定阶段')
+    parser.add_argument('--baseline', help='之前的结果 JSON，用于检测退化')
+    parser.add_argument('--tolerance', type=float, default=0.2)
+    args = parser.parse_args()
+
+    from synthetic_verilog import generate_corpus
+
+    if os.path.exists(args.work_dir):
+        shutil.rmtree(args.work_dir)
+    corpus_dir = os.path.join(args.work_dir, 'corpus')
+    generate_corpus(corpus_dir, num_netlists=args.netlists, num_rtl=args.rtl, num_testbenches=args.testbenches,
+                    scale=args.scale, seed=args.seed)
+
+    paths = corpus_files(corpus_dir)
+    report = {
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'corpus': {
+            'netlists': args.netlists, 'rtl': args.rtl, 'testbenches': args.testbenches,
+            'scale': args.scale, 'seed': args.seed,
+            'files': len(paths), 'bytes': sum(os.path.getsize(path) for path in paths),
+        },
+        'stages': run_benchmarks(corpus_dir, args.work_dir, args.stages),
+    }
+    with open(args.output, 'w', encoding='utf-8') as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    print(f"结果已保存至 {args.output}")
+
+    if args.baseline:
+        with open(args.baseline, 'r', encoding='utf-8') as f:
+            regressions = compare_results(report, json.load(f), args.tolerance)
+        for name, metric, base, value in regressions:
+            print(f"退化: {name} {metric} {base} -> {value}")
+        sys.exit(1 if regressions else 0)
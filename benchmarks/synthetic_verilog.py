@@ -0,0 +1,215 @@
+# coding=utf-8
+"""
+@Desc  : 生成合成 Verilog 语料，用于流水线基准测试
+         netlist: ABC 生成的门级网表（与评测集中的 FAU 样本同形）
+         rtl: 带版权注释、参数、always/case 状态机的 RTL
+         testbench: 实例化 RTL 模块的测试平台
+"""
+import os
+import random
+
+LICENSE_HEADER = """// ----------------------------------------------------------------------
+// Copyright (c) {year}, The Regents of the University of California All
+// rights reserved.
+//
+// Redistribution and use in source and binary forms, with or without
+// modification, are permitted provided that the following conditions are
+// met:
+//
+//     * Redistributions of source code must retain the above copyright
+//       notice, this list of conditions and the following disclaimer.
+// ----------------------------------------------------------------------
+"""
+
+
+# 按 ABC 的风格把名字列表折行，每行不超过 width 个字符
+def wrap_names(names, first_prefix, indent='    ', width=75):
+    lines = []
+    current = first_prefix
+    for i, name in enumerate(names):
+        piece = name + (',' if i < len(names) - 1 else '')
+        if len(current) + len(piece) + 1 > width and current.strip():
+            lines.append(current.rstrip())
+            current = indent
+        current += piece + ' '
+    lines.append(current.rstrip())
+    return '\n'.join(lines)
+
+
+def random_expression(rng, operands, depth=0):
+    """
+    随机的与或非 / 三目表达式，子表达式加括号，最外层不加
+    """
+    if depth >= 3 or rng.random() < 0.3:
+        operand = rng.choice(operands)
+        return f'~{operand}' if rng.random() < 0.4 else operand
+    kind = rng.random()
+    if kind < 0.8:
+        operator = ' | ' if kind < 0.4 else ' & '
+        expression = operator.join(random_expression(rng, operands, depth + 1) for _ in range(rng.randint(2, 4)))
+    else:
+        expression = (f'{rng.choice(operands)} ? {random_expression(rng, operands, depth + 1)} : '
+                      f'{random_expression(rng, operands, depth + 1)}')
+    return f'({expression})' if depth > 0 else expression
+
+
+def abc_netlist(rng, name='FAU', n_inputs=9, n_outputs=19, n_gates=300):
+    inputs = [f'x{i}' for i in range(n_inputs)]
+    outputs = [f'z{i:02d}' for i in range(n_outputs)]
+    wires = [f'new_n{i}_' for i in range(n_inputs + n_outputs + 3, n_inputs + n_outputs + 3 + n_gates)]
+
+    parts = [
+        f'// Benchmark "{name}" written by ABC on Sat Aug  1 21:55:10 2020\n',
+        f'module {name} ( ',
+        wrap_names(inputs + outputs, '    ') + '  );',
+        wrap_names(inputs, '  input  ') + ';',
+        wrap_names(outputs, '  output ') + ';',
+        wrap_names(wires, '  wire ') + ';',
+    ]
+    # 每根线只引用输入和之前定义的线，输出由最后若干根线驱动
+    for i, wire in enumerate(wires):
+        operands = inputs + wires[max(0, i - 20):i]
+        parts.append(f'  assign {wire} = {random_expression(rng, operands)};')
+    for output in outputs:
+        operands = rng.sample(wires, min(3, len(wires))) + inputs
+        parts.append(f'  assign {output} = {random_expression(rng, operands)};')
+    parts.append('endmodule\n')
+    return '\n'.join(parts) + '\n'
+
+
+def rtl_module(rng, name, n_states=8, n_regs=6, width=8):
+    states = [f'S_{i}' for i in range(n_states)]
+    regs = [f'r_{i}' for i in range(n_regs)]
+    lines = [LICENSE_HEADER.format(year=rng.randint(2010, 2023)),
+             '`timescale 1ns / 1ps',
+             f'module {name}',
+             f'  #(parameter WIDTH = {width},',
+             f'    parameter DEPTH = {rng.choice([4, 8, 16, 32])})',
+             '  (input clk,',
+             '   input rst,',
+             '   input [WIDTH-1:0] data_in,',
+             '   input valid_in,',
+             '   output reg [WIDTH-1:0] data_out,',
+             '   output reg valid_out);',
+             '',
+             f'  localparam STATE_BITS = {max(1, (n_states - 1).bit_length())};']
+    lines += [f'  localparam {state} = {i};' for i, state in enumerate(states)]
+    lines += ['', '  reg [STATE_BITS-1:0] state, next_state;']
+    lines += [f'  reg [WIDTH-1:0] {reg};' for reg in regs]
+    lines += ['',
+              '  // state register',
+              '  always @(posedge clk) begin',
+              '    if (rst) begin',
+              f'      state <= {states[0]};',
+              '    end else begin',
+              '      state <= next_state;',
+              '    end',
+              '  end',
+              '',
+              '  /* next state logic */',
+              '  always @(*) begin',
+              '    next_state = state;',
+              '    case (state)']
+    for i, state in enumerate(states):
+        target = states[(i + 1) % n_states]
+        lines += [f'      {state}: begin',
+                  f'        if (valid_in && data_in[{rng.randrange(width)}]) begin',
+                  f'          next_state = {target};',
+                  '        end else begin',
+                  f'          next_state = {rng.choice(states)};',
+                  '        end',
+                  '      end']
+    lines += [f'      default: next_state = {states[0]};',
+              '    endcase',
+              '  end',
+              '',
+              '  always @(posedge clk) begin',
+              '    if (rst) begin']
+    lines += [f'      {reg} <= 0;' for reg in regs]
+    lines += ['      data_out <= 0;',
+              '      valid_out <= 0;',
+              '    end else begin',
+              '      case (state)']
+    for state in states:
+        reg = rng.choice(regs)
+        op = rng.choice(['+', '-', '^', '&', '|'])
+        lines.append(f'        {state}: {reg} <= {reg} {op} data_in;')
+    lines += ['        default: ;',
+              '      endcase',
+              f'      data_out <= {" ^ ".join(rng.sample(regs, min(3, n_regs)))};',
+              f'      valid_out <= (state == {states[-1]});',
+              '    end',
+              '  end',
+              'endmodule',
+              '']
+    return '\n'.join(lines)
+
+
+def testbench(rng, dut_name, width=8, n_vectors=20):
+    lines = ['`timescale 1ns / 1ps',
+             '',
+             f'module tb_{dut_name};',
+             '  reg clk;',
+             '  reg rst;',
+             f'  reg [{width - 1}:0] data_in;',
+             '  reg valid_in;',
+             f'  wire [{width - 1}:0] data_out;',
+             '  wire valid_out;',
+             '',
+             f'  {dut_name} #(.WIDTH({width})) dut (',
+             '    .clk(clk), .rst(rst), .data_in(data_in), .valid_in(valid_in),',
+             '    .data_out(data_out), .valid_out(valid_out));',
+             '',
+             '  always #5 clk = ~clk;',
+             '',
+             '  initial begin',
+             '    clk = 0;',
+             '    rst = 1;',
+             '    data_in = 0;',
+             '    valid_in = 0;',
+             '    #20 rst = 0;']
+    for _ in range(n_vectors):
+        lines += [f"    #10 data_in = {width}'h{rng.randrange(1 << width):0{(width + 3) // 4}x};",
+                  f'    valid_in = {rng.randint(0, 1)};']
+    lines += ['    #50;',
+              '    $display("data_out = %h, valid_out = %b", data_out, valid_out);',
+              '    $finish;',
+              '  end',
+              'endmodule',
+              '']
+    return '\n'.join(lines)
+
+
+def generate_corpus(output_dir, num_netlists=100, num_rtl=100, num_testbenches=50, scale=1.0, num_projects=10,
+                    seed=0):
+    """
+    :param scale: 文件大小的缩放系数（网表的门数、RTL 的状态数、测试向量数同比缩放）
+    :param num_projects: 文件分散到多少个项目子目录（模拟下载解压后的仓库结构）
+    :return: 生成的文件路径列表
+    """
+    rng = random.Random(seed)
+    paths = []
+
+    def write(project, file_name, content):
+        directory = os.path.join(output_dir, f'project_{project:03d}')
+        os.makedirs(directory, exist_ok=True)
+        path = os.path.join(directory, file_name)
+        with open(path, 'w', encoding='utf-8') as f:
+            f.write(content)
+        paths.append(path)
+
+    for i in range(num_netlists):
+        content = abc_netlist(rng, 'FAU', n_inputs=rng.randint(5, 16), n_outputs=rng.randint(4, 24),
+                              n_gates=max(10, int(rng.randint(100, 500) * scale)))
+        write(i % num_projects, f'netlist_{i:05d}.v', content)
+    rtl_names = []
+    for i in range(num_rtl):
+        name = f'fsm_{i:05d}'
+        rtl_names.append(name)
+        content = rtl_module(rng, name, n_states=max(2, int(rng.randint(4, 16) * scale)), n_regs=rng.randint(2, 8))
+        write(i % num_projects, f'{name}.v', content)
+    for i in range(num_testbenches):
+        dut_name = rtl_names[i % len(rtl_names)] if rtl_names else f'fsm_{i:05d}'
+        write(i % num_projects, f'tb_{dut_name}_{i:05d}.v',
+              testbench(rng, dut_name, n_vectors=max(2, int(rng.randint(10, 60) * scale))))
+    return paths
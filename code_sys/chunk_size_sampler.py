@@ -0,0 +1,99 @@
+import sys
+import json
+import random
+
+
+class AliasSampler:
+    def __init__(self, values, weights) -> None:
+        """
+        Walker/Vose 别名法采样器：构建 O(n)，每次采样 O(1)
+        :param values: 可取的值（如块行数）
+        :param weights: 对应的权重（如直方图计数），不需要归一化
+        """
+        if len(values) != len(weights) or not values:
+            raise ValueError("values 和 weights 必须非空且长度一致")
+        total = float(sum(weights))
+        if total <= 0:
+            raise ValueError("weights 之和必须大于 0")
+
+        n = len(values)
+        self.values = [int(v) for v in values]
+        self.prob = [0.0] * n
+        self.alias = list(range(n))
+
+        scaled = [w * n / total for w in weights]
+        small = [i for i, p in enumerate(scaled) if p < 1.0]
+        large = [i for i, p in enumerate(scaled) if p >= 1.0]
+        while small and large:
+            s = small.pop()
+            l = large.pop()
+            self.prob[s] = scaled[s]
+            self.alias[s] = l
+            scaled[l] = scaled[l] + scaled[s] - 1.0
+            if scaled[l] < 1.0:
+                small.append(l)
+            else:
+                large.append(l)
+        # 剩余的桶概率为 1（浮点误差）
+        for i in small + large:
+            self.prob[i] = 1.0
+
+    def sample(self, rng=None):
+        """
+        :param rng: random.Random 实例，默认使用全局 random
+        """
+        rng = rng or random
+        i = rng.randrange(len(self.values))
+        return self.values[i] if rng.random() < self.prob[i] else self.values[self.alias[i]]
+
+    def to_dict(self):
+        return {'values': self.values, 'prob': self.prob, 'alias': self.alias}
+
+    @classmethod
+    def from_dict(cls, data):
+        sampler = cls.__new__(cls)
+        sampler.values = list(data['values'])
+        sampler.prob = list(data['prob'])
+        sampler.alias = list(data['alias'])
+        return sampler
+
+    def save(self, path) -> None:
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(self.to_dict(), f, separators=(',', ':'))
+
+    @classmethod
+    def load(cls, path):
+        with open(path, 'r', encoding='utf-8') as f:
+            return cls.from_dict(json.load(f))
+
+
+# 由语料统计摘要拟合块大小分布
+def fit_chunk_size_sampler(summary, min_lines=None, max_lines=None):
+    """
+    README 要求切块大小符合文件长度分布（用户习惯）：
+    取 corpus_stats 摘要中的文件行数直方图，只保留 [min_lines, max_lines] 之间的部分作为经验分布
+    :param summary: CorpusStats.summary() 的结果
+    :param min_lines: 默认取摘要中的 thresholds.min_lines
+    :param max_lines: 默认取摘要中的 thresholds.max_lines
+    """
+    thresholds = summary.get('thresholds', {})
+    min_lines = min_lines if min_lines is not None else (thresholds.get('min_lines') or 1)
+    max_lines = max_lines if max_lines is not None else (thresholds.get('max_lines') or float('inf'))
+
+    values, weights = [], []
+    for value, count in summary['file_lines_hist']:
+        if min_lines <= value <= max_lines and value >= 1:
+            values.append(int(value))
+            weights.append(count)
+    if not values:
+        raise ValueError(f"文件行数直方图在 [{min_lines}, {max_lines}] 内没有数据")
+    return AliasSampler(values, weights)
+
+
+if __name__ == '__main__':
+    summary_path = sys.argv[1] if len(sys.argv) > 1 else 'corpus_stats.json'
+    output_path = sys.argv[2] if len(sys.argv) > 2 else 'chunk_size_sampler.json'
+    with open(summary_path, 'r', encoding='utf-8') as f:
+        sampler = fit_chunk_size_sampler(json.load(f))
+    sampler.save(output_path)
+    print(f"块大小分布共 {len(sampler.values)} 个取值，已保存至 {output_path}")
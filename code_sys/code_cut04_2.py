@@ -2,9 +2,16 @@ import os
 import json
 import glob
 import random
+import hashlib
+import itertools
 import numpy as np
 from tqdm import tqdm  # 导入 tqdm 进度条
 import shutil  # 添加此行以导入 shutil 模块
+import time
+from concurrent.futures import ProcessPoolExecutor
+from pipeline_metrics import METRICS, PipelineMetrics, SamplingProfiler
+from verilog_boundary import load_or_build_boundaries, snap_to_boundary
+from chunk_size_sampler import AliasSampler
 
 
 # 删除并重新创建输出文件夹
@@ -16,8 +23,85 @@ def reset_output3_folders():
     os.makedirs('output3/task2')  # 创建 task2 子文件夹
 
 
+# 为单个文件生成独立的随机数流
+def file_rng(seed, file_lines):
+    """
+    由 (全局种子, 文件内容哈希) 派生该文件专属的 random.Random，
+    使切块/掩码结果与处理顺序、进程数无关，可完全复现
+    """
+    hasher = hashlib.sha256()
+    hasher.update(str(seed).encode('utf-8'))
+    for line in file_lines:
+        hasher.update(line.encode('utf-8', errors='replace'))
+    return random.Random(int.from_bytes(hasher.digest()[:8], 'big'))
+
+
+# 计算行偏移表
+def build_line_offsets(file_lines):
+    """
+    将文件行拼接为一个缓冲区，并计算每行的起始偏移
+    offsets[i] 为第 i 行的起始位置，offsets[-1] 为缓冲区总长度，
+    第 [a, b) 行的内容即 buffer[offsets[a]:offsets[b]]
+    """
+    if isinstance(file_lines, str):
+        file_lines = file_lines.splitlines(keepends=True)
+    buffer = ''.join(file_lines)
+    offsets = [0]
+    offsets.extend(itertools.accumulate(len(line) for line in file_lines))
+    return buffer, offsets
+
+
+# 按行范围取出内容，只在需要写出时才拼出字符串
+def materialize_lines(buffer, offsets, start, end):
+    return buffer[offsets[start]:offsets[end]]
+
+
+# 按概率规划切块的行范围 [(start, end), ...]
+def plan_random_ratio_ranges(num_lines, line_ratios, rng, boundaries=None, size_sampler=None):
+    """
+    boundaries 不为 None 时，把抽样得到的块终点吸附到最近的结构边界，避免把语法块切断
+    单行块保持原样
+    size_sampler 不为 None 时，块大小改为从语料统计拟合的分布（AliasSampler）中 O(1) 抽取，不再使用 line_ratios
+    """
+    ranges = []
+    current = 0
+
+    while current < num_lines:
+        remaining = num_lines - current
+        if size_sampler is not None:
+            # 分布拟合自整文件行数（p5-p95），限制在 11-100 行，与 line_ratios 的上限和 truncating04 的下限一致
+            chunk_size = min(max(size_sampler.sample(rng), 11), 100, remaining)
+        else:
+            chosen_ratio, (min_lines, max_lines) = rng.choice(line_ratios)
+
+            # 如果剩余行数小于最小行数，则将剩余部分作为最后一个块
+            if remaining < min_lines:
+                chunk_size = remaining
+            else:
+                actual_max_lines = min(max_lines, remaining)
+                effective_min_lines = max(min_lines, 1)
+
+                # 确保 chunk_size 在有效范围内，并且不超过最大行数限制
+                chunk_size = min(rng.randint(effective_min_lines, actual_max_lines), 100)
+
+        end = current + chunk_size
+        if boundaries is not None and chunk_size > 1:
+            end = snap_to_boundary(boundaries, current, end, max(chunk_size // 2, 5))
+
+        ranges.append((current, end))
+        current = end
+
+    return ranges
+
+
 # 按概率切文件
-def split_file_by_random_ratio(file_lines, file_name, file_index, line_ratios=None):
+def split_file_by_random_ratio(file_lines, file_name, file_index, line_ratios=None, rng=None, boundaries=None,
+                               size_sampler=None):
+    """
+    boundaries 为 verilog_boundary.build_boundary_index 计算的结构边界，指定后按语法结构切块
+    size_sampler 为 chunk_size_sampler.AliasSampler，指定后按语料统计得到的分布抽取块大小
+    """
+    rng = rng or random  # 未指定时沿用全局 random
     if line_ratios is None:
         line_ratios = [
             (0.05, (1, 1)),  # 新增：0.05 的概率切到单个单词
@@ -35,24 +119,13 @@ def split_file_by_random_ratio(file_lines, file_name, file_index, line_ratios=No
     if len(file_lines) <= 5:  # 舍弃少于等于5行的文件
         return []
 
+    # 整个文件只拼接一次，切块只记录行偏移范围，避免反复复制剩余行列表
+    buffer, offsets = build_line_offsets(file_lines)
+
     chunks = []
     block_id = 1
-    remaining_lines = list(file_lines)  # 使用列表副本以避免修改原始数据
-
-    while remaining_lines:
-        chosen_ratio, (min_lines, max_lines) = random.choice(line_ratios)
-
-        # 如果剩余行数小于最小行数，则将剩余部分作为最后一个块
-        if len(remaining_lines) < min_lines:
-            chunk_size = len(remaining_lines)
-        else:
-            actual_max_lines = min(max_lines, len(remaining_lines))
-            effective_min_lines = max(min_lines, 1)
-
-            # 确保 chunk_size 在有效范围内，并且不超过最大行数限制
-            chunk_size = min(random.randint(effective_min_lines, actual_max_lines), 100)
-
-        chunk = ''.join(remaining_lines[:chunk_size]).strip()
+    for start, end in plan_random_ratio_ranges(len(offsets) - 1, line_ratios, rng, boundaries, size_sampler):
+        chunk = materialize_lines(buffer, offsets, start, end).strip()
         if chunk:
             chunks.append({
                 "language": "verilog",
@@ -62,13 +135,12 @@ def split_file_by_random_ratio(file_lines, file_name, file_index, line_ratios=No
             })
             block_id += 1
 
-        remaining_lines = remaining_lines[chunk_size:]
-
     return chunks
 
 
 # 掩码策略
-def mask_code_blocks(data, file_name, file_index):
+def mask_code_blocks(data, file_name, file_index, rng=None):
+    rng = rng or random  # 未指定时沿用全局 random
     modes = ['mode1', 'mode2', 'mode3', 'mode4', 'mode5']
     output3_data = []
 
@@ -93,21 +165,21 @@ def mask_code_blocks(data, file_name, file_index):
             continue  # 跳过后续的掩码模式
 
         # 否则，随机选择其他掩码模式
-        mode = random.choice(modes)
+        mode = rng.choice(modes)
         prefix, middle, suffix = "", code, ""
 
         if mode == 'mode1':  # 单个单词 (符号)
             words = code.split()
             if words:
-                index = random.randint(0, len(words) - 1)
+                index = rng.randint(0, len(words) - 1)
                 prefix = ' '.join(words[:index])
                 middle = words[index]
                 suffix = ' '.join(words[index + 1:])
         elif mode == 'mode2':  # 多个单词
             words = code.split()
             if len(words) > 1:
-                start = random.randint(0, len(words) - 2)
-                end = random.randint(start + 1, len(words))
+                start = rng.randint(0, len(words) - 2)
+                end = rng.randint(start + 1, len(words))
                 prefix = ' '.join(words[:start])
                 middle = ' '.join(words[start:end])
                 suffix = ' '.join(words[end:])
@@ -117,7 +189,7 @@ def mask_code_blocks(data, file_name, file_index):
         elif mode == 'mode3':  # 整行
             lines = code.split('\n')
             if len(lines) > 1:
-                index = random.randint(0, len(lines) - 1)
+                index = rng.randint(0, len(lines) - 1)
                 prefix = '\n'.join(lines[:index])
                 middle = lines[index]
                 suffix = '\n'.join(lines[index + 1:])
@@ -128,14 +200,14 @@ def mask_code_blocks(data, file_name, file_index):
             lines = code.split('\n')
             if len(lines) > 1:
                 # 随机选择 PSM 或 SPM 模式
-                if random.random() < 0.5:  # PSM 模式
+                if rng.random() < 0.5:  # PSM 模式
                     # PSM 模式：prefix、middle、suffix 都不能为 0
-                    start = random.randint(1, len(lines) - 2)  # prefix 至少 1 行
-                    end = random.randint(start + 1, len(lines) - 1)  # suffix 至少 1 行
+                    start = rng.randint(1, len(lines) - 2)  # prefix 至少 1 行
+                    end = rng.randint(start + 1, len(lines) - 1)  # suffix 至少 1 行
                 else:  # SPM 模式
                     # SPM 模式：prefix 必须为空，middle 和 suffix 不能为 0
                     start = 0  # prefix 必须为空
-                    end = random.randint(1, len(lines) - 1)  # suffix 至少 1 行
+                    end = rng.randint(1, len(lines) - 1)  # suffix 至少 1 行
 
                 prefix = '\n'.join(lines[:start])
                 middle = '\n'.join(lines[start:end])
@@ -147,14 +219,14 @@ def mask_code_blocks(data, file_name, file_index):
             lines = code.split('\n')
             if len(lines) > 1:
                 # 随机选择 PSM 或 SPM 模式
-                if random.random() < 0.5:  # PSM 模式
+                if rng.random() < 0.5:  # PSM 模式
                     # PSM 模式：prefix、middle、suffix 都不能为 0
-                    start = random.randint(1, len(lines) - 2)  # prefix 至少 1 行
-                    end = random.randint(start + 1, len(lines) - 1)  # suffix 至少 1 行
+                    start = rng.randint(1, len(lines) - 2)  # prefix 至少 1 行
+                    end = rng.randint(start + 1, len(lines) - 1)  # suffix 至少 1 行
                 else:  # SPM 模式
                     # SPM 模式：prefix 必须为空，middle 和 suffix 不能为 0
                     start = 0  # prefix 必须为空
-                    end = random.randint(1, len(lines) - 1)  # suffix 至少 1 行
+                    end = rng.randint(1, len(lines) - 1)  # suffix 至少 1 行
 
                 prefix = '\n'.join(lines[:start])
                 middle = '\n'.join(lines[start:end])
@@ -164,7 +236,7 @@ def mask_code_blocks(data, file_name, file_index):
                 suffix = ''
 
         # 确保 PSM 模式下 prefix、middle、suffix 都不为 0
-        if random.random() < 0.5:  # PSM 模式
+        if rng.random() < 0.5:  # PSM 模式
             if not prefix or not middle or not suffix:
                 continue  # 跳过不符合条件的块
         else:  # SPM 模式
@@ -183,9 +255,72 @@ def mask_code_blocks(data, file_name, file_index):
     return output3_data
 
 
+# 读取单个文件的所有行
+def read_file_lines(file):
+    try:
+        with open(file, 'r', encoding='utf-8', errors='replace') as f:
+            return f.readlines()
+    except UnicodeDecodeError:
+        print(f"无法用 utf-8 解码文件 {file}，尝试使用 gbk 编码...")
+        with open(file, 'r', encoding='gbk', errors='replace') as f:
+            return f.readlines()
+
+
+# 处理单个文件（切块 + 掩码），可在子进程中运行
+def process_file(task):
+    """
+    task 为 (file, file_index, seed, syntax_aware, size_sampler)
+    seed 不为 None 时使用该文件专属的随机数流，结果与 worker 数量和调度顺序无关
+    syntax_aware 为 True 时按结构边界切块，边界索引缓存在源文件旁
+    size_sampler 不为 None 时按拟合的分布抽取块大小
+    返回 (file, result1_data, result2_data, error, metrics)，metrics 为该文件的指标快照，由主进程合并
+    """
+    file, file_index, seed, syntax_aware, size_sampler = task
+    metrics = PipelineMetrics()
+    start = time.perf_counter()
+    try:
+        with metrics.stage('read'):
+            all_lines = read_file_lines(file)
+        metrics.inc('bytes_read', os.path.getsize(file))
+    except Exception as e:
+        metrics.inc('read_errors')
+        return file, [], [], f"读取文件 {file} 失败: {e}", metrics.snapshot()
+
+    try:
+        rng = file_rng(seed, all_lines) if seed is not None else None
+        with metrics.stage('boundaries'):
+            boundaries = load_or_build_boundaries(file, ''.join(all_lines), metrics) if syntax_aware else None
+        file_name = os.path.basename(file)  # 获取文件名
+        # 对每个文件按随机比例切割
+        with metrics.stage('split'):
+            result1_data = split_file_by_random_ratio(all_lines, file_name, file_index, rng=rng,
+                                                      boundaries=boundaries, size_sampler=size_sampler)
+        # 对切割后的数据进行掩码操作
+        with metrics.stage('mask'):
+            result2_data = mask_code_blocks(result1_data, file_name, file_index, rng=rng)
+        metrics.inc('chunks', len(result1_data))
+        metrics.observe('process_file', time.perf_counter() - start)
+        return file, result1_data, result2_data, None, metrics.snapshot()
+    except Exception as e:
+        metrics.inc('process_errors')
+        return file, [], [], f"文件 {file} 处理失败: {e}", metrics.snapshot()
+
+
 # 主函数
-def main():
-    input_folder = '评测集'  # 输入文件夹
+def main(input_folder='评测集', seed=None, workers=1, syntax_aware=False, size_sampler_path=None,
+         metrics_prefix=os.path.join('pipeline_metrics', 'code_cut04_2'), profile=False):
+    """
+    :param input_folder: 输入文件夹
+    :param seed: 全局随机种子，指定后每个文件由 (seed, 文件内容哈希) 派生独立随机数流，输出可复现
+    :param workers: 进程数，大于 1 时使用进程池并行切块（需同时指定 seed 才能保证可复现）
+    :param syntax_aware: 是否将块边界吸附到 module/always/begin-end 等结构边界
+    :param size_sampler_path: chunk_size_sampler.py 生成的块大小分布文件，不指定时沿用 line_ratios
+    :param metrics_prefix: 运行结束后将各阶段耗时、计数器、单文件耗时直方图写出到 {metrics_prefix}.json / .prom
+    :param profile: 是否开启采样分析（只采样主进程），调用栈写出到 {metrics_prefix}.folded
+    """
+    METRICS.run_name = 'code_cut04_2'
+    profiler = SamplingProfiler().start() if profile else None
+    size_sampler = AliasSampler.load(size_sampler_path) if size_sampler_path else None
 
     # 删除并重置输出文件夹
     reset_output3_folders()
@@ -193,8 +328,8 @@ def main():
     result1_all_data = []
     result2_all_data = []
 
-    # 获取所有 .v 文件的列表
-    files_to_process = glob.glob(os.path.join(input_folder, '*.v'))
+    # 获取所有 .v 文件的列表（排序，保证 file_index 与运行环境无关）
+    files_to_process = sorted(glob.glob(os.path.join(input_folder, '*.v')))
 
     # 记录无法处理的文件的日志
     error_log_file = 'error_files.log'
@@ -203,58 +338,42 @@ def main():
 
     # 设置最大处理文件数量
     max_files_to_process = 130000  # 控制处理 n 个文件
+    files_to_process = files_to_process[:max_files_to_process]
     processed_files_count = 0  # 已处理的文件数量计数器
 
+    # 文件计数器从1开始
+    tasks = [(file, file_index, seed, syntax_aware, size_sampler) for file_index, file in enumerate(files_to_process, start=1)]
+
     # 使用一个总的 tqdm 来跟踪所有文件的处理进度
-    with tqdm(total=min(len(files_to_process), max_files_to_process), desc="总进度", unit="文件") as pbar:
-        file_index = 1  # 文件计数器从1开始
-        for file in files_to_process:
-            if processed_files_count >= max_files_to_process:
-                break  # 达到最大处理数量后停止
-            try:
-                all_lines = []
-                try:
-                    with open(file, 'r', encoding='utf-8', errors='replace') as f:
-                        all_lines.extend(f.readlines())
-                except UnicodeDecodeError:
-                    print(f"无法用 utf-8 解码文件 {file}，尝试使用 gbk 编码...")
-                    try:
-                        with open(file, 'r', encoding='gbk', errors='replace') as f:
-                            all_lines.extend(f.readlines())
-                    except Exception as e:
-                        print(f"读取文件 {file} 失败: {e}")
-                        with open(error_log_file, 'a', encoding='utf-8') as log_file:
-                            log_file.write(f"{file}\n")
-                        pbar.update(1)  # 更新进度条，即使文件未成功处理
-                        file_index += 1
-                        processed_files_count += 1
-                        continue
-
-                # 对每个文件按随机比例切割
-                file_name = os.path.basename(file)  # 获取文件名
-                result1_data = split_file_by_random_ratio(all_lines, file_name, file_index)
+    # 子进程中各步骤的耗时按文件累加（read / boundaries / split / mask），process_files 为主进程墙钟时间
+    with METRICS.stage('process_files'), tqdm(total=len(tasks), desc="总进度", unit="文件") as pbar:
+        if workers > 1:
+            executor = ProcessPoolExecutor(max_workers=workers)
+            # map 按提交顺序返回结果，输出顺序与 worker 数量无关
+            results = executor.map(process_file, tasks, chunksize=max(1, len(tasks) // (workers * 16)))
+        else:
+            executor = None
+            results = map(process_file, tasks)
+
+        try:
+            for file, result1_data, result2_data, error, file_metrics in results:
+                METRICS.merge(file_metrics)
+                if error:
+                    print(error)
+                    # error 中已包含文件路径和异常信息
+                    with open(error_log_file, 'a', encoding='utf-8') as log_file:
+                        log_file.write(f"{error}\n")
                 result1_all_data.extend(result1_data)
-
-                # 对切割后的数据进行掩码操作
-                result2_data = mask_code_blocks(result1_data, file_name, file_index)
                 result2_all_data.extend(result2_data)
-
                 pbar.update(1)  # 每处理完一个文件更新一次进度条
-                file_index += 1  # 更新文件计数器
-                processed_files_count += 1  # 更新已处理的文件数量
-            except Exception as e:
-                # 记录无法处理的文件的文件名
-                # with open(error_log_file, 'a', encoding='utf-8') as log_file:
-                #     log_file.write(f"{file}\n")
-                # print(f"文件 {file} 处理失败: {e}")
-                pbar.update(1)  # 更新进度条
-                file_index += 1  # 更新文件计数器
                 processed_files_count += 1  # 更新已处理的文件数量
-                continue
+        finally:
+            if executor is not None:
+                executor.shutdown()
 
     print("------------------------------------------------ 开始写入数据 -----------------------------------------------")
     # 写入 task1 的结果，每个块一行，并且每个块之间加个空行，同时格式化JSON对象
-    with tqdm(total=len(result1_all_data), desc="写入 task1", unit="块") as pbar:
+    with METRICS.stage('write_task1'), tqdm(total=len(result1_all_data), desc="写入 task1", unit="块") as pbar:
         with open('output3/task1/result1.jsonl', 'w', encoding='utf-8') as out_file:
             for entry in result1_all_data:
                 # 使用 indent 和 separators 参数使 JSON 输出更易读
@@ -263,7 +382,7 @@ def main():
                 pbar.update(1)  # 更新进度条
 
     # 写入 task2 的结果，每个块一行，并且每个块之间加个空行，同时格式化JSON对象
-    with tqdm(total=len(result2_all_data), desc="写入 task2", unit="块") as pbar:
+    with METRICS.stage('write_task2'), tqdm(total=len(result2_all_data), desc="写入 task2", unit="块") as pbar:
         with open('output3/task2/result2.jsonl', 'w', encoding='utf-8') as out_file:
             for entry in result2_all_data:
                 # 使用 indent 和 separators 参数使 JSON 输出更易读
@@ -271,11 +390,20 @@ def main():
                 out_file.write(formatted_entry + '\n\n')  # 每个块之间加个空行
                 pbar.update(1)  # 更新进度条
 
+    METRICS.inc('bytes_written', os.path.getsize('output3/task1/result1.jsonl'))
+    METRICS.inc('bytes_written', os.path.getsize('output3/task2/result2.jsonl'))
+
     # 所有操作完成后打印消息
     print("已完成本次数据处理！")
     print(f"无法处理的文件已记录到 {error_log_file}")
     print(f"共处理了 {processed_files_count} 个文件")
 
+    if profiler is not None:
+        profiler.stop().write_folded(metrics_prefix + '.folded')
+    METRICS.export(metrics_prefix)
+
 
 if __name__ == '__main__':
-    main()
\ No newline at end of file
+    size_sampler_path = 'chunk_size_sampler.json'
+    main(seed=0, workers=os.cpu_count() or 1, syntax_aware=True,
+         size_sampler_path=size_sampler_path if os.path.exists(size_sampler_path) else None)
\ No newline at end of file
@@ -5,12 +5,14 @@ import shutil
 import subprocess
 import chardet
 import math
+import time
 from tqdm import tqdm
 import pandas as pd
 from difflib import SequenceMatcher
 from collections import Counter
 from statistics import stdev
 from concurrent.futures import ThreadPoolExecutor, as_completed
+from pipeline_metrics import METRICS, SamplingProfiler
 
 # 定义关键词列表
 KEYWORDS = [
@@ -42,6 +44,7 @@ def check_iverilog_installed():
 def detect_encoding(file_path):
     with open(file_path, 'rb') as f:
         raw = f.read()
+        METRICS.inc('bytes_read', len(raw))
         result = chardet.detect(raw)
         return result['encoding']
 
@@ -67,9 +70,15 @@ def check_verilog_syntax(file_path, include_paths=None):
                 cmd.extend(["-I", path])
         cmd.append(file_path)
 
-        process = subprocess.run(cmd, stderr=subprocess.PIPE, text=True, check=True)
+        METRICS.inc('subprocess_calls')
+        start = time.perf_counter()
+        try:
+            subprocess.run(cmd, stderr=subprocess.PIPE, text=True, check=True)
+        finally:
+            METRICS.observe('iverilog', time.perf_counter() - start)
         with open(file_path, "r", encoding=detect_encoding(file_path) or 'utf-8') as file:
             total_lines = sum(1 for _ in file)
+        METRICS.inc('bytes_read', os.path.getsize(file_path))
 
         return {
             "file": file_path,
@@ -80,6 +89,7 @@ def check_verilog_syntax(file_path, include_paths=None):
             "errors": ""
         }
     except subprocess.CalledProcessError as e:
+        METRICS.inc('iverilog_failures')
         error_lines = set()
         for line in e.stderr.splitlines():
             match = re.search(r"(\d+): error:", line)
@@ -88,6 +98,7 @@ def check_verilog_syntax(file_path, include_paths=None):
 
         with open(file_path, "r", encoding=detect_encoding(file_path) or 'utf-8') as file:
             total_lines = sum(1 for _ in file)
+        METRICS.inc('bytes_read', os.path.getsize(file_path))
 
         error_count = len(error_lines)
         error_ratio = error_count / total_lines if total_lines > 0 else 0
@@ -101,6 +112,7 @@ def check_verilog_syntax(file_path, include_paths=None):
             "errors": e.stderr.strip()
         }
     except Exception as e:
+        METRICS.inc('syntax_check_errors')
         return {
             "file": file_path,
             "success": False,
@@ -112,6 +124,7 @@ def check_verilog_syntax(file_path, include_paths=None):
 
 
 # 并行化语法检查
+@METRICS.stage('check_verilog_syntax')
 def check_verilog_syntax_parallel(files, include_paths=None):
     with ThreadPoolExecutor() as executor:
         futures = {executor.submit(check_verilog_syntax, file, include_paths): file for file in files}
@@ -134,9 +147,10 @@ def normalize_code(line):
     return line
 
 
+@METRICS.stage('score_by_repetition')
 def score_by_repetition(files_content, n=10, sampleRate=0.3, max_pairs=100):
     scores = {}
-    for filename, lines in files_content.items():
+    for filename, lines in METRICS.iter_timed('score_by_repetition', files_content.items()):
         # 过滤空行和注释行
         lines = [line.strip() for line in lines if
                  line.strip() and not line.strip().startswith("//") and "/*" not in line]
@@ -173,11 +187,12 @@ def score_by_repetition(files_content, n=10, sampleRate=0.3, max_pairs=100):
 
 
 # 根据关键字出现率打分
+@METRICS.stage('score_by_keyword_occurrence')
 def score_by_keyword_occurrence(files_content):
     scores = {}
     keyword_pattern = re.compile('|'.join(re.escape(kw) for kw in KEYWORDS))
 
-    for filename, lines in files_content.items():
+    for filename, lines in METRICS.iter_timed('score_by_keyword_occurrence', files_content.items()):
         cleaned_lines = [re.sub(r'//.*|/\*.*?\*/', '', line) for line in lines if line.strip()]
         content = ' '.join(cleaned_lines).lower()
         words = re.findall(r'\b\w+\b', content)
@@ -218,9 +233,10 @@ def score_by_keyword_occurrence(files_content):
 
 
 # 根据代码与注释比例打分
+@METRICS.stage('score_by_code_to_comment_ratio')
 def score_by_code_to_comment_ratio(files_content):
     scores = {}
-    for filename, lines in files_content.items():
+    for filename, lines in METRICS.iter_timed('score_by_code_to_comment_ratio', files_content.items()):
         code_lines = 0
         comment_lines = 0
         block_comment = False
@@ -265,9 +281,10 @@ def score_by_code_to_comment_ratio(files_content):
 
 
 # 根据代码长度多样性打分
+@METRICS.stage('score_by_code_length_diversity')
 def score_by_code_length_diversity(files_content):
     scores = {}
-    for filename, lines in files_content.items():
+    for filename, lines in METRICS.iter_timed('score_by_code_length_diversity', files_content.items()):
         lines = [line for line in lines if line.strip() and not line.strip().startswith("//") and "/*" not in line]
         lengths = [len(line.strip().split()) for line in lines if line.strip()]
 
@@ -292,6 +309,7 @@ def score_by_code_length_diversity(files_content):
 
 
 # 根据信息熵打分
+@METRICS.stage('score_by_information_entropy')
 def score_by_information_entropy(files_content):
     def calculate_entropy(elements):
         if not elements:
@@ -301,7 +319,7 @@ def score_by_information_entropy(files_content):
         return -sum(p * math.log2(p) for p in probabilities)
 
     scores = {}
-    for filename, lines in files_content.items():
+    for filename, lines in METRICS.iter_timed('score_by_information_entropy', files_content.items()):
         entropies = []
         for line in lines:
             stripped_line = line.strip()
@@ -346,6 +364,7 @@ def read_file(file_path):
         return file_path, f.readlines()  # 返回文件路径和内容
 
 
+@METRICS.stage('read_files')
 def read_files_concurrently(verilog_files, max_workers=20):
     files_content = {}  # 存储文件内容
     with ThreadPoolExecutor(max_workers=max_workers) as executor:
@@ -362,10 +381,17 @@ def read_files_concurrently(verilog_files, max_workers=20):
 
 
 # 主函数
-def main():
+def main(metrics_prefix=os.path.join('pipeline_metrics', 'code_test_mod3_4'), profile=False):
+    """
+    :param metrics_prefix: 运行结束后将各阶段耗时、计数器、单文件耗时直方图写出到 {metrics_prefix}.json / .prom
+    :param profile: 是否开启采样分析，调用栈写出到 {metrics_prefix}.folded
+    """
     if not check_iverilog_installed():
         exit(1)
 
+    METRICS.run_name = 'code_test_mod3_4'
+    profiler = SamplingProfiler().start() if profile else None
+
     target_directory = os.path.join(os.getcwd(), "code-verilog")
     selected_directory = os.path.join(os.getcwd(), "Selected")
     eval_directory = os.path.join(os.getcwd(), "评测集")
@@ -384,6 +410,7 @@ def main():
 
     # 限制读取的文件数量为 n 个
     verilog_files = verilog_files[:]
+    METRICS.inc('files_total', len(verilog_files))
 
     # 缓存文件内容
     files_content = read_files_concurrently(verilog_files)
@@ -392,7 +419,7 @@ def main():
     syntax_results = check_verilog_syntax_parallel(verilog_files, include_paths=[os.getcwd()])
 
     # 并行化评分计算
-    with ThreadPoolExecutor(max_workers=20) as executor:
+    with METRICS.stage('score_all'), ThreadPoolExecutor(max_workers=20) as executor:
         repetition_future = executor.submit(score_by_repetition, files_content)
         keyword_future = executor.submit(score_by_keyword_occurrence, files_content)
         comment_ratio_future = executor.submit(score_by_code_to_comment_ratio, files_content)
@@ -453,31 +480,38 @@ def main():
     output_file = os.path.join(target_directory, 'verilog_analysis_results.csv')
 
     # 使用 tqdm 显示写入 CSV 文件的进度
-    with tqdm(total=1, desc="写入 CSV 文件", unit="步骤") as pbar:
+    with METRICS.stage('write_csv'), tqdm(total=1, desc="写入 CSV 文件", unit="步骤") as pbar:
         df = pd.DataFrame(results_sorted)
         df.to_csv(output_file, index=False, encoding='utf-8-sig')  # 写入 CSV 文件
         pbar.update(1)  # 更新进度条
+    METRICS.inc('bytes_written', os.path.getsize(output_file))
 
     # 将文件分类保存到“评测集”和“训练集”
     eval_files = results_sorted[:300]  # 前 300 个文件
     train_files = results_sorted[301:5000]  # 第 301 到 5000 个文件
 
     # 复制文件到“评测集”
-    with tqdm(total=len(eval_files), desc="复制文件到评测集", unit="文件") as pbar:
+    with METRICS.stage('copy_files'), tqdm(total=len(eval_files), desc="复制文件到评测集", unit="文件") as pbar:
         for result in eval_files:
             shutil.copy(result['文件名'], os.path.join(eval_directory, os.path.basename(result['文件名'])))
+            METRICS.inc('bytes_written', os.path.getsize(result['文件名']))
             pbar.update(1)  # 更新进度条
 
     # 复制文件到“训练集”
-    with tqdm(total=len(train_files), desc="复制文件到训练集", unit="文件") as pbar:
+    with METRICS.stage('copy_files'), tqdm(total=len(train_files), desc="复制文件到训练集", unit="文件") as pbar:
         for result in train_files:
             shutil.copy(result['文件名'], os.path.join(train_directory, os.path.basename(result['文件名'])))
+            METRICS.inc('bytes_written', os.path.getsize(result['文件名']))
             pbar.update(1)  # 更新进度条
 
     print(f"分析完成，结果已保存到文件：{output_file}")
     print(f"前 500 个文件已保存到文件夹：{eval_directory}")
     print(f"第 501 到 5000 个文件已保存到文件夹：{train_directory}")
 
+    if profiler is not None:
+        profiler.stop().write_folded(metrics_prefix + '.folded')
+    METRICS.export(metrics_prefix)
+
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
@@ -0,0 +1,202 @@
+import os
+import sys
+import json
+import numpy as np
+from tqdm import tqdm
+from concurrent.futures import ProcessPoolExecutor
+
+# 定义关键词列表
+VERILOG_KEYWORDS = frozenset([
+    'module', 'endmodule', 'input', 'output', 'inout', 'wire', 'reg', 'integer',
+    'parameter', 'localparam', 'function', 'endfunction', 'task', 'endtask',
+    'if', 'else', 'case', 'casex', 'casez', 'default', 'for', 'while', 'repeat',
+    'always', 'initial', 'begin', 'end', 'fork', 'join', 'posedge', 'negedge',
+    'bit', 'logic', 'byte', 'shortint', 'int', 'longint', 'shortreal', 'chandle',
+    'string', 'enum', 'struct', 'union', 'typedef', 'signed', 'unsigned',
+    'interface', 'endinterface', 'modport', 'class', 'endclass', 'extends',
+    'implements', 'virtual', 'import', 'export', 'package',
+    'assert', 'assume', 'cover', 'expect', 'property', 'sequence',
+    'rand', 'randc', 'constraint', 'with', 'inside'
+])
+
+# 直方图范围：行长、文件行数按整数精确统计，超出上限的计入最后一个桶
+MAX_LINE_LENGTH = 1024
+MAX_FILE_LINES = 20000
+RATIO_BINS = 100
+QUANTILES = (0.01, 0.05, 0.25, 0.5, 0.75, 0.95, 0.99)
+
+# 每个文件记录的统计量（列顺序）
+FILE_COLUMNS = ('total_lines', 'code_lines', 'avg_length', 'max_length', 'keyword_ratio', 'identifier_ratio')
+
+
+# 统计单个文件
+def analyze_lines(lines):
+    """
+    过滤空行和注释行后统计行长和关键词/标识符比率
+    :return: 统计字典；没有有效代码行时返回 None
+    """
+    # 过滤掉空行和注释行
+    code_lines = [line.strip() for line in lines if line.strip() and not line.strip().startswith('//')]
+    if not code_lines:
+        return None
+
+    line_lengths = np.fromiter((len(line) for line in code_lines), dtype=np.int64, count=len(code_lines))
+
+    # 计算每行的关键词和标识符比率
+    keyword_ratios = np.zeros(len(code_lines))
+    identifier_ratios = np.zeros(len(code_lines))
+    for i, line in enumerate(code_lines):
+        words = line.split()
+        keyword_count = sum(1 for word in words if word in VERILOG_KEYWORDS)
+        identifier_count = sum(1 for word in words if word.isidentifier() and word not in VERILOG_KEYWORDS)
+        keyword_ratios[i] = keyword_count / len(words)
+        identifier_ratios[i] = identifier_count / len(words)
+
+    return {
+        'total_lines': len(lines),
+        'code_lines': len(code_lines),
+        'line_lengths': line_lengths,
+        'min_length': int(line_lengths.min()),
+        'max_length': int(line_lengths.max()),
+        'avg_length': float(line_lengths.mean()),
+        'median_length': float(np.median(line_lengths)),
+        'avg_keyword_ratio': float(keyword_ratios.mean()),
+        'avg_identifier_ratio': float(identifier_ratios.mean()),
+    }
+
+
+# 由直方图计算分位数
+def histogram_quantiles(counts, edges, quantiles=QUANTILES):
+    total = counts.sum()
+    if total == 0:
+        return {str(q): None for q in quantiles}
+    cumulative = np.cumsum(counts)
+    idx = np.searchsorted(cumulative, np.asarray(quantiles) * total, side='left')
+    idx = np.minimum(idx, len(counts) - 1)
+    return {str(q): float(edges[i]) for q, i in zip(quantiles, idx)}
+
+
+class CorpusStats:
+    def __init__(self) -> None:
+        """
+        语料统计：每个文件的统计量按列存入 NumPy 数组，行长 / 文件行数 / 关键词比率用固定分桶的直方图流式累计。
+        直方图可直接相加，因此多个进程的结果可以合并。
+        """
+        self.file_names = []
+        self.file_values = []  # 每个元素为 (len(FILE_COLUMNS),) 的数组，summary 时再堆叠
+        self.skipped_files = 0
+        self.line_length_hist = np.zeros(MAX_LINE_LENGTH + 1, dtype=np.int64)
+        self.file_lines_hist = np.zeros(MAX_FILE_LINES + 1, dtype=np.int64)
+        self.keyword_ratio_hist = np.zeros(RATIO_BINS + 1, dtype=np.int64)
+
+    def add_file(self, file_name, lines) -> None:
+        stats = analyze_lines(lines)
+        if stats is None:
+            self.skipped_files += 1
+            return
+
+        self.file_names.append(file_name)
+        self.file_values.append(np.array([
+            stats['total_lines'],
+            stats['code_lines'],
+            stats['avg_length'],
+            stats['max_length'],
+            stats['avg_keyword_ratio'],
+            stats['avg_identifier_ratio'],
+        ], dtype=np.float64))
+
+        self.line_length_hist += np.bincount(np.minimum(stats['line_lengths'], MAX_LINE_LENGTH),
+                                             minlength=MAX_LINE_LENGTH + 1)
+        self.file_lines_hist[min(stats['total_lines'], MAX_FILE_LINES)] += 1
+        self.keyword_ratio_hist[int(round(stats['avg_keyword_ratio'] * RATIO_BINS))] += 1
+
+    def merge(self, other: 'CorpusStats') -> None:
+        self.file_names.extend(other.file_names)
+        self.file_values.extend(other.file_values)
+        self.skipped_files += other.skipped_files
+        self.line_length_hist += other.line_length_hist
+        self.file_lines_hist += other.file_lines_hist
+        self.keyword_ratio_hist += other.keyword_ratio_hist
+
+    def file_table(self):
+        """
+        每个文件的统计量，形状为 (文件数, len(FILE_COLUMNS))
+        """
+        if not self.file_values:
+            return np.zeros((0, len(FILE_COLUMNS)))
+        return np.vstack(self.file_values)
+
+    def summary(self):
+        """
+        生成紧凑的统计摘要，其中 thresholds 给出 README 中的两个阈值：
+        文件行数低于 min_lines 的丢掉，高于 max_lines 的需要裁剪
+        """
+        table = self.file_table()
+        line_edges = np.arange(MAX_LINE_LENGTH + 1)
+        file_edges = np.arange(MAX_FILE_LINES + 1)
+        ratio_edges = np.arange(RATIO_BINS + 1) / RATIO_BINS
+        file_lines_quantiles = histogram_quantiles(self.file_lines_hist, file_edges)
+
+        # 直方图只保存非零桶，[[取值, 计数], ...]
+        def sparse(counts, edges):
+            nonzero = np.flatnonzero(counts)
+            return [[float(edges[i]), int(counts[i])] for i in nonzero]
+
+        return {
+            'num_files': len(self.file_names),
+            'skipped_files': self.skipped_files,
+            'mean': {col: (float(table[:, i].mean()) if len(table) else None) for i, col in enumerate(FILE_COLUMNS)},
+            'line_length_quantiles': histogram_quantiles(self.line_length_hist, line_edges),
+            'file_lines_quantiles': file_lines_quantiles,
+            'keyword_ratio_quantiles': histogram_quantiles(self.keyword_ratio_hist, ratio_edges),
+            'line_length_hist': sparse(self.line_length_hist, line_edges),
+            'file_lines_hist': sparse(self.file_lines_hist, file_edges),
+            'keyword_ratio_hist': sparse(self.keyword_ratio_hist, ratio_edges),
+            'thresholds': {
+                'min_lines': file_lines_quantiles['0.05'],
+                'max_lines': file_lines_quantiles['0.95'],
+            },
+        }
+
+    def save(self, summary_path, table_path=None) -> None:
+        with open(summary_path, 'w', encoding='utf-8') as f:
+            json.dump(self.summary(), f, ensure_ascii=False, separators=(',', ':'))
+        if table_path:
+            np.savez_compressed(table_path, file_names=np.array(self.file_names), columns=np.array(FILE_COLUMNS),
+                                values=self.file_table())
+
+
+# 统计一批文件（在子进程中运行）
+def collect_stats(file_paths):
+    stats = CorpusStats()
+    for file_path in file_paths:
+        try:
+            with open(file_path, 'r', encoding='utf-8', errors='replace') as f:
+                lines = f.readlines()
+        except OSError:
+            stats.skipped_files += 1
+            continue
+        stats.add_file(os.path.basename(file_path), lines)
+    return stats
+
+
+# 并行统计整个目录
+def collect_corpus_stats(directory, workers=None, shard_size=2000):
+    file_paths = sorted(os.path.join(directory, name) for name in os.listdir(directory) if name.endswith('.v'))
+    shards = [file_paths[i:i + shard_size] for i in range(0, len(file_paths), shard_size)]
+
+    corpus_stats = CorpusStats()
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        # map 按顺序返回，合并结果与进程数无关
+        for shard_stats in tqdm(executor.map(collect_stats, shards), total=len(shards), desc="语料统计"):
+            corpus_stats.merge(shard_stats)
+    return corpus_stats
+
+
+if __name__ == '__main__':
+    directory = sys.argv[1] if len(sys.argv) > 1 else '训练集'
+    corpus_stats = collect_corpus_stats(directory)
+    corpus_stats.save('corpus_stats.json', 'corpus_stats_files.npz')
+    summary = corpus_stats.summary()
+    print(f"共统计 {summary['num_files']} 个文件，跳过 {summary['skipped_files']} 个")
+    print(f"文件行数阈值: {summary['thresholds']}")
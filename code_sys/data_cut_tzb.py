@@ -1,53 +1,30 @@
 import os
+import bisect
 import random
 import numpy as np
 import torch
 import numpy as np
-import tiktoken
 import json
 from tqdm import tqdm
+from token_cache import TokenCache
+from corpus_stats import analyze_lines
 
 def analyze_verilog_file(filename, lines, context_window=2):
-    # 过滤掉空行和注释行
-    lines = [line.strip() for line in lines if line.strip() and not line.strip().startswith('//')]
-
-    line_lengths = [len(line) for line in lines]
-
-    # 计算最短、最长、平均和中位数长度
-    min_length = min(line_lengths)
-    max_length = max(line_lengths)
-    avg_length = np.mean(line_lengths)
-    median_length = np.median(line_lengths)
-
-    # 计算每行的关键词和标识符比率
-    keyword_ratios = []
-    identifier_ratios = []
-
-    for line in lines:
-        words = line.split()
-        keyword_count = sum(1 for word in words if word in verilog_keywords)
-        identifier_count = sum(1 for word in words if word.isidentifier() and word not in verilog_keywords)
-
-        keyword_ratio = keyword_count / len(words) if len(words) > 0 else 0
-        identifier_ratio = identifier_count / len(words) if len(words) > 0 else 0
-
-        keyword_ratios.append(keyword_ratio)
-        identifier_ratios.append(identifier_ratio)
-
-    # 计算平均关键词和标识符比率
-    avg_keyword_ratio = np.mean(keyword_ratios)
-    avg_identifier_ratio = np.mean(identifier_ratios)
+    # 过滤空行和注释行后统计，没有有效代码行的文件返回空字典
+    stats = analyze_lines(lines)
+    if stats is None:
+        return {}
 
     # 构建结果字典
     file_name = os.path.basename(filename).replace('.v', '')
     result = {
         file_name: {
-            'min_length': min_length,
-            'max_length': max_length,
-            'avg_length': avg_length,
-            'median_length': median_length,
-            'avg_keyword_ratio': avg_keyword_ratio,
-            'avg_identifier_ratio': avg_identifier_ratio,
+            'min_length': stats['min_length'],
+            'max_length': stats['max_length'],
+            'avg_length': stats['avg_length'],
+            'median_length': stats['median_length'],
+            'avg_keyword_ratio': stats['avg_keyword_ratio'],
+            'avg_identifier_ratio': stats['avg_identifier_ratio'],
         }
     }
 
@@ -69,8 +46,8 @@ def read_verilog_files(directory, num):
             with open(filepath, 'r', encoding='utf-8') as file:
                 process_lines = [line.rstrip('\n') if len(line) > 0 else line for line in file.readlines()]
                 verilog_dict[key] = process_lines
-                # 数据统计
-                verilog_data_analyze = analyze_verilog_file(filename, process_lines)
+                # 数据统计，累计每个文件的结果
+                verilog_data_analyze.update(analyze_verilog_file(filename, process_lines))
     return verilog_dict,verilog_data_analyze
 
 def permute(
@@ -137,20 +114,181 @@ def permute(
             )
         return list(new_sample), np_rng
 
+def permute_batch(
+            tokens,
+            offsets,
+            np_rng,
+            suffix_tok_id,
+            prefix_tok_id,
+            middle_tok_id,
+            fim_spm_rate=0.5,
+    ):
+        """
+        批量版本的 permute：对打包在一起的一批样本同时做 FIM 转换（PSM / SPM）。
+        tokens 为所有样本首尾相接的一维 token 数组，第 i 个样本为 tokens[offsets[i]:offsets[i + 1]]。
+        所有样本的切分点由一次 randint 抽取，PSM/SPM 由一次 binomial 抽取，之后只做向量化的 gather，
+        不再对每个 token 执行 Python 代码。
+        返回 (new_tokens, new_offsets, loss_mask)：
+            new_tokens 为转换后的打包数组，每个样本长度 +3（三个特殊符号）
+            loss_mask 为 bool 数组，middle 符号之后需要预测的位置为 True
+        """
+        tokens = np.asarray(tokens, dtype=np.int64)
+        offsets = np.asarray(offsets, dtype=np.int64)
+        starts = offsets[:-1]
+        ends = offsets[1:]
+        lengths = ends - starts
+        batch_size = len(lengths)
+
+        # 随机生成两个位置索引，数值中间部分为 middle
+        boundaries = np.sort(np_rng.randint(low=0, high=lengths + 1, size=(2, batch_size)), axis=0)
+        prefix_end = starts + boundaries[0]
+        suffix_start = starts + boundaries[1]
+        is_spm = np_rng.binomial(1, fim_spm_rate, size=batch_size).astype(bool)
+
+        # 特殊符号追加在源数组末尾，用下标引用
+        source = np.concatenate([tokens, np.array([prefix_tok_id, suffix_tok_id, middle_tok_id], dtype=np.int64)])
+        prefix_idx, suffix_idx, middle_idx = len(tokens), len(tokens) + 1, len(tokens) + 2
+        ones = np.ones(batch_size, dtype=np.int64)
+
+        # 每个样本由 6 段组成（起点, 长度）
+        # PSM: <p> prefix <s> suffix <m> middle
+        # SPM: <p> <s> suffix <m> prefix middle
+        psm_segments = [
+            (prefix_idx * ones, ones),
+            (starts, prefix_end - starts),
+            (suffix_idx * ones, ones),
+            (suffix_start, ends - suffix_start),
+            (middle_idx * ones, ones),
+            (prefix_end, suffix_start - prefix_end),
+        ]
+        spm_segments = [
+            (prefix_idx * ones, ones),
+            (suffix_idx * ones, ones),
+            (suffix_start, ends - suffix_start),
+            (middle_idx * ones, ones),
+            (starts, prefix_end - starts),
+            (prefix_end, suffix_start - prefix_end),
+        ]
+        seg_starts = np.stack([np.where(is_spm, spm[0], psm[0]) for psm, spm in zip(psm_segments, spm_segments)], axis=1)
+        seg_lengths = np.stack([np.where(is_spm, spm[1], psm[1]) for psm, spm in zip(psm_segments, spm_segments)], axis=1)
+
+        # 把所有段展开为 gather 下标
+        seg_starts = seg_starts.ravel()
+        seg_lengths = seg_lengths.ravel()
+        seg_out_starts = np.concatenate([[0], np.cumsum(seg_lengths)[:-1]])
+        total = int(seg_lengths.sum())
+        gather_idx = np.repeat(seg_starts - seg_out_starts, seg_lengths) + np.arange(total)
+        new_tokens = source[gather_idx]
+
+        new_offsets = offsets - offsets[0] + 3 * np.arange(batch_size + 1)
+
+        # middle 符号在样本内的位置：PSM 为 prefix + suffix + 2，SPM 为 suffix + 2
+        suffix_lengths = ends - suffix_start
+        middle_pos = np.where(is_spm, suffix_lengths + 2, boundaries[0] + suffix_lengths + 2)
+        sample_ids = np.repeat(np.arange(batch_size), lengths + 3)
+        pos_in_sample = np.arange(total) - new_offsets[sample_ids]
+        loss_mask = pos_in_sample > middle_pos[sample_ids]
+
+        return new_tokens, new_offsets, loss_mask
+
+
+def split_long_samples(samples, max_length):
+    """
+    把超过 max_length 的 token 序列切成不超过 max_length 的若干段（返回视图，不复制）。
+    整个文件作为一个样本时往往超过上下文长度，先切段再做 FIM，保证 middle 能完整放进一行
+    """
+    pieces = []
+    for sample in samples:
+        for start in range(0, max(len(sample), 1), max_length):
+            pieces.append(sample[start:start + max_length])
+    return pieces
+
+
+def pack_samples(tokens, offsets, loss_mask, context_length, eos_tok_id, pad_tok_id):
+    """
+    将变长样本装箱为定长训练行，代替 permute 中未实现的 truncate_or_pad。
+    每个样本后追加 EOS；FIM 样本的 middle 在末尾，截断会丢掉训练目标，
+    所以加上 EOS 后超过 context_length 的样本直接丢弃（调用方应先用 split_long_samples 切段）。
+    装箱使用 best-fit-decreasing：按长度从长到短，放入剩余空间最小且放得下的行。
+    返回 (row_tokens, position_ids, document_ids, row_loss_mask)，形状均为 (行数, context_length)：
+        position_ids 在每个文档内从 0 开始
+        document_ids 为样本在输入中的下标，填充位置为 -1
+        row_loss_mask 沿用样本的 loss_mask，EOS 位置为 True，填充位置为 False
+    """
+    tokens = np.asarray(tokens, dtype=np.int64)
+    offsets = np.asarray(offsets, dtype=np.int64)
+    loss_mask = np.asarray(loss_mask, dtype=bool)
+
+    # 丢弃放不进一行的样本，保留样本的原始下标作为 document_ids
+    lengths = np.diff(offsets)
+    kept = np.flatnonzero(lengths <= context_length - 1)
+    if len(kept) < len(lengths):
+        print(f"警告: {len(lengths) - len(kept)} 个样本超过 context_length - 1 = {context_length - 1}，已丢弃")
+    sample_starts = offsets[:-1][kept]
+    lengths = lengths[kept]
+    num_samples = len(kept)
+    packed_lengths = lengths + 1
+
+    # 装箱：按剩余空间分桶，rows_by_cap[cap] 为剩余空间为 cap 的行号；
+    # caps 为非空桶的容量（升序），长度不超过 context_length，与行数无关，每次放置只需一次二分
+    rows_by_cap = {}
+    caps = []
+    sample_rows = np.zeros(num_samples, dtype=np.int64)
+    sample_cols = np.zeros(num_samples, dtype=np.int64)
+    num_rows = 0
+    for sample_id in np.argsort(-packed_lengths, kind='stable'):
+        length = int(packed_lengths[sample_id])
+        k = bisect.bisect_left(caps, length)
+        if k < len(caps):
+            cap = caps[k]
+            bucket = rows_by_cap[cap]
+            row = bucket.pop()
+            if not bucket:
+                del rows_by_cap[cap]
+                caps.pop(k)
+        else:
+            cap = context_length
+            row = num_rows
+            num_rows += 1
+        sample_rows[sample_id] = row
+        sample_cols[sample_id] = context_length - cap
+        cap -= length
+        if cap > 0:
+            bucket = rows_by_cap.get(cap)
+            if bucket is None:
+                bucket = rows_by_cap[cap] = []
+                bisect.insort(caps, cap)
+            bucket.append(row)
+
+    row_tokens = np.full(num_rows * context_length, pad_tok_id, dtype=np.int64)
+    position_ids = np.zeros(num_rows * context_length, dtype=np.int64)
+    document_ids = np.full(num_rows * context_length, -1, dtype=np.int64)
+    row_loss_mask = np.zeros(num_rows * context_length, dtype=bool)
+
+    # 向量化写入样本内容
+    dest_starts = sample_rows * context_length + sample_cols
+    total = int(lengths.sum())
+    out_starts = np.concatenate([[0], np.cumsum(lengths)[:-1]]).astype(np.int64)
+    inner = np.arange(total) - np.repeat(out_starts, lengths)
+    dest = np.repeat(dest_starts, lengths) + inner
+    src = np.repeat(sample_starts, lengths) + inner
+    row_tokens[dest] = tokens[src]
+    position_ids[dest] = inner
+    document_ids[dest] = np.repeat(kept, lengths)
+    row_loss_mask[dest] = loss_mask[src]
+
+    # 写入每个样本末尾的 EOS
+    eos_dest = dest_starts + lengths
+    row_tokens[eos_dest] = eos_tok_id
+    position_ids[eos_dest] = lengths
+    document_ids[eos_dest] = kept
+    row_loss_mask[eos_dest] = True
+
+    shape = (num_rows, context_length)
+    return row_tokens.reshape(shape), position_ids.reshape(shape), document_ids.reshape(shape), row_loss_mask.reshape(shape)
+
+
 if __name__ == '__main__':
-    # 定义关键词列表
-    verilog_keywords = [
-        'module', 'endmodule', 'input', 'output', 'inout', 'wire', 'reg', 'integer',
-        'parameter', 'localparam', 'function', 'endfunction', 'task', 'endtask',
-        'if', 'else', 'case', 'casex', 'casez', 'default', 'for', 'while', 'repeat',
-        'always', 'initial', 'begin', 'end', 'fork', 'join', 'posedge', 'negedge',
-        'bit', 'logic', 'byte', 'shortint', 'int', 'longint', 'shortreal', 'chandle',
-        'string', 'enum', 'struct', 'union', 'typedef', 'signed', 'unsigned',
-        'interface', 'endinterface', 'modport', 'class', 'endclass', 'extends',
-        'implements', 'virtual', 'import', 'export', 'package',
-        'assert', 'assume', 'cover', 'expect', 'property', 'sequence',
-        'rand', 'randc', 'constraint', 'with', 'inside'
-    ]
     # 示例路径
     # directory = r"/home/tzb/hippo-coder/hippo-coder/data_mask"
     directory = r"/home/tzb/hippo-coder/hippo-coder/data_mask/a1_data"
@@ -180,7 +318,9 @@ if __name__ == '__main__':
     FIM_PAD = "<fim-pad>"
     FIM_MASK = "<fim-mask>"
 
-    # bpe分词器
+    # bpe分词器（只在生成数据时需要）
+    import tiktoken
+
     tokenizer = tiktoken.get_encoding("gpt2")
     # In production, load the arguments directly instead of accessing private attributes
     # See openai_public.py for examples of arguments for specific encodings
@@ -203,35 +343,46 @@ if __name__ == '__main__':
     suffix_tok_id, prefix_tok_id, middle_tok_id, pad_tok_id,mask_tok_id = (enc._special_tokens[tok] for tok in [FIM_SUFFIX, FIM_PREFIX, FIM_MIDDLE, FIM_PAD, FIM_MASK])
     np_rng = np.random.RandomState(seed=0) # rng state for FIM
     datas = []
-    num = 1000
-    for key,value in tqdm(verilog_dict.items()):
-        trunk_data = "".join(value)
-        sample = enc.encode(trunk_data)
-        tmp = permute(
-            sample,
+    batch_size = 1024
+    context_length = 2048
+    fim_tokens, fim_lengths, fim_loss_masks = [], [], []
+    # 按内容哈希缓存 token，重复运行时不再重新编码
+    token_cache = TokenCache("token_cache", enc)
+    samples = token_cache.encode(["".join(value) for value in verilog_dict.values()], batch_size=batch_size)
+    # FIM 增加 3 个特殊符号，装箱再加 1 个 EOS，切段后每个样本都能完整放进一行
+    samples = split_long_samples(samples, context_length - 4)
+    for batch_start in tqdm(range(0, len(samples), batch_size), desc="FIM"):
+        batch = samples[batch_start:batch_start + batch_size]
+        # 打包为一维数组 + 偏移
+        offsets = np.zeros(len(batch) + 1, dtype=np.int64)
+        np.cumsum([len(sample) for sample in batch], out=offsets[1:])
+        tokens = np.concatenate([np.asarray(sample, dtype=np.int64) for sample in batch])
+
+        new_tokens, new_offsets, loss_mask = permute_batch(
+            tokens,
+            offsets,
             np_rng,
             suffix_tok_id,
             prefix_tok_id,
             middle_tok_id,
-            pad_tok_id,
-            mask_tok_id,
-            fim_rate=0.5,
             fim_spm_rate=0.5,
-            truncate_or_pad=True,
         )
-        data = enc.decode(tokens=tmp[0])
-        # 找到 np.int64(50400) 的索引
-        index = tmp[0].index(50400)
-        # 使用列表推导式替换 np.int64(50400) 之后的所有内容为 np.int64(50700)
-        mask_data_encode = tmp[0][:index + 1] + [np.int64(50700)] * (len(tmp[0]) - index - 1)
-        mask_data = enc.decode(tokens=mask_data_encode)
-
-        # 构建一个字典，其中包含原始数据和掩码数据
-        data_dict = {
-            "ori_data": data,
-            "mask_data": mask_data
-        }
-        datas.append(data_dict)
+        masked_counts = np.add.reduceat(loss_mask.astype(np.int64), new_offsets[:-1])
+        fim_tokens.append(new_tokens)
+        fim_lengths.append(np.diff(new_offsets))
+        fim_loss_masks.append(loss_mask)
+
+        for start, end, masked_count in zip(new_offsets[:-1], new_offsets[1:], masked_counts):
+            # middle 符号之前的部分只解码一次，掩码数据直接用 mask 符号拼接，无需再次解码
+            split = end - masked_count
+            head = enc.decode(new_tokens[start:split].tolist())
+            tail = enc.decode(new_tokens[split:end].tolist())
+            # 构建一个字典，其中包含原始数据和掩码数据
+            data_dict = {
+                "ori_data": head + tail,
+                "mask_data": head + FIM_MASK * int(masked_count)
+            }
+            datas.append(data_dict)
 
     # 将字典按 jsonl 格式写入文件
     with open("output.jsonl", "w", encoding="utf-8") as f:
@@ -239,3 +390,19 @@ if __name__ == '__main__':
             # 将每个字典转换为 JSON 字符串并写入文件
             f.write(json.dumps(item, ensure_ascii=False) + "\n")
 
+    # 将 FIM 样本装箱为定长训练行，样本之间以 EOS 分隔
+    if fim_tokens:
+        fim_offsets = np.concatenate([[0], np.cumsum(np.concatenate(fim_lengths))])
+        row_tokens, position_ids, document_ids, row_loss_mask = pack_samples(
+            np.concatenate(fim_tokens),
+            fim_offsets,
+            np.concatenate(fim_loss_masks),
+            context_length,
+            enc.eot_token,
+            pad_tok_id,
+        )
+        np.savez("output_packed.npz", tokens=row_tokens.astype(np.uint32), position_ids=position_ids,
+                 document_ids=document_ids, loss_mask=row_loss_mask)
+        fill_ratio = (document_ids >= 0).mean()
+        print(f"装箱完成: {len(fim_offsets) - 1} 个样本 -> {len(row_tokens)} 行, 填充率 {fill_ratio:.2%}")
+
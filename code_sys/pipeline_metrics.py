@@ -0,0 +1,300 @@
+import os
+import re
+import sys
+import json
+import time
+import bisect
+import threading
+from collections import Counter
+from contextlib import contextmanager
+
+# 单个文件耗时直方图的桶上界（秒）
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+# 栈顶是这些函数时线程处于空闲等待（线程池 worker 等任务、等锁、等 IO 就绪），默认不计入采样
+IDLE_FRAMES = {('thread.py', '_worker'), ('threading.py', 'wait'), ('threading.py', '_wait_for_tstate_lock'),
+               ('selectors.py', 'select'), ('queue.py', 'get'), ('connection.py', '_recv')}
+
+
+class Histogram:
+    def __init__(self, buckets=LATENCY_BUCKETS) -> None:
+        """
+        固定桶直方图，counts 最后一个元素是超出最大桶上界的个数（+Inf 桶）
+        """
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+        self.max = max(self.max, value)
+
+    def quantile(self, q: float) -> float:
+        """
+        按桶估计分位数，返回所在桶的上界（落在 +Inf 桶时返回观测到的最大值）
+        """
+        if not self.count:
+            return 0.0
+        rank = q * self.count
+        seen = 0
+        for bound, count in zip(self.buckets, self.counts):
+            seen += count
+            if seen >= rank:
+                return bound
+        return self.max
+
+    def to_dict(self):
+        return {'buckets': list(self.buckets), 'counts': list(self.counts), 'count': self.count,
+                'sum': round(self.sum, 6), 'max': round(self.max, 6),
+                'p50': self.quantile(0.5), 'p95': self.quantile(0.95), 'p99': self.quantile(0.99)}
+
+    def merge(self, data) -> None:
+        if tuple(data['buckets']) != self.buckets:
+            raise ValueError("直方图的桶不一致，无法合并")
+        self.counts = [a + b for a, b in zip(self.counts, data['counts'])]
+        self.count += data['count']
+        self.sum += data['sum']
+        self.max = max(self.max, data['max'])
+
+
+class PipelineMetrics:
+    def __init__(self, run_name: str = 'pipeline') -> None:
+        """
+        轻量的流水线指标：
+        stages      每个阶段的累计耗时和调用次数
+        counters    计数器（读写字节数、子进程调用次数、缓存命中/未命中、出错文件数等）
+        histograms  每个文件的处理耗时直方图
+        各方法加锁，可以在线程池中并发调用；进程池中的 worker 各自记录，用 snapshot / merge 汇总
+        """
+        self.run_name = run_name
+        self.started = time.time()
+        self.stages = {}
+        self.counters = Counter()
+        self.histograms = {}
+        self._lock = threading.Lock()
+
+    def inc(self, name: str, value=1) -> None:
+        with self._lock:
+            self.counters[name] += value
+
+    def observe(self, name: str, seconds: float) -> None:
+        with self._lock:
+            if name not in self.histograms:
+                self.histograms[name] = Histogram()
+            self.histograms[name].observe(seconds)
+
+    def add_stage_time(self, name: str, seconds: float, calls: int = 1) -> None:
+        with self._lock:
+            stage = self.stages.setdefault(name, {'seconds': 0.0, 'calls': 0})
+            stage['seconds'] += seconds
+            stage['calls'] += calls
+
+    @contextmanager
+    def stage(self, name: str):
+        """
+        记录一个阶段的耗时，可以作为 with 语句或函数装饰器使用
+        """
+        start = time.perf_counter()
+        try:
+            yield self
+        finally:
+            self.add_stage_time(name, time.perf_counter() - start)
+
+    def iter_timed(self, name: str, iterable):
+        """
+        逐个产出 iterable 的元素，并把每个元素的处理耗时（两次取值之间的时间）记入 name 直方图
+        用法: for filename, lines in METRICS.iter_timed('score_by_xxx', files_content.items())
+        """
+        for item in iterable:
+            start = time.perf_counter()
+            yield item
+            self.observe(name, time.perf_counter() - start)
+
+    def cache_lookup(self, name: str, hit: bool) -> None:
+        self.inc(f'{name}_hits' if hit else f'{name}_misses')
+
+    def cache_hit_rates(self):
+        rates = {}
+        for key in list(self.counters):
+            if key.endswith('_hits'):
+                name = key[:-len('_hits')]
+                total = self.counters[key] + self.counters.get(f'{name}_misses', 0)
+                rates[name] = self.counters[key] / total if total else 0.0
+        return rates
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                'run': self.run_name,
+                'started': self.started,
+                'elapsed_seconds': round(time.time() - self.started, 3),
+                'stages': {name: {'seconds': round(stage['seconds'], 6), 'calls': stage['calls']}
+                           for name, stage in self.stages.items()},
+                'counters': dict(self.counters),
+                'cache_hit_rates': self.cache_hit_rates(),
+                'histograms': {name: histogram.to_dict() for name, histogram in self.histograms.items()},
+            }
+
+    def merge(self, snapshot) -> None:
+        """
+        合并子进程 / 其他实例的 snapshot
+        """
+        for name, stage in snapshot.get('stages', {}).items():
+            self.add_stage_time(name, stage['seconds'], stage['calls'])
+        with self._lock:
+            self.counters.update(snapshot.get('counters', {}))
+            for name, data in snapshot.get('histograms', {}).items():
+                if name not in self.histograms:
+                    self.histograms[name] = Histogram(data['buckets'])
+                self.histograms[name].merge(data)
+
+    def to_prometheus(self) -> str:
+        """
+        Prometheus 文本格式，可以放到 node_exporter 的 textfile 目录或直接 push 到 pushgateway
+        """
+        snapshot = self.snapshot()
+        run = escape_label(self.run_name)
+        lines = ['# TYPE pipeline_stage_seconds_total counter']
+        lines += [f'pipeline_stage_seconds_total{{run="{run}",stage="{escape_label(name)}"}} {stage["seconds"]}'
+                  for name, stage in snapshot['stages'].items()]
+        lines.append('# TYPE pipeline_stage_calls_total counter')
+        lines += [f'pipeline_stage_calls_total{{run="{run}",stage="{escape_label(name)}"}} {stage["calls"]}'
+                  for name, stage in snapshot['stages'].items()]
+        for name, value in sorted(snapshot['counters'].items()):
+            metric = f'pipeline_{metric_name(name)}_total'
+            lines.append(f'# TYPE {metric} counter')
+            lines.append(f'{metric}{{run="{run}"}} {value}')
+        lines.append('# TYPE pipeline_cache_hit_ratio gauge')
+        lines += [f'pipeline_cache_hit_ratio{{run="{run}",cache="{escape_label(name)}"}} {rate:.6f}'
+                  for name, rate in snapshot['cache_hit_rates'].items()]
+        lines.append('# TYPE pipeline_file_seconds histogram')
+        for name, data in snapshot['histograms'].items():
+            labels = f'run="{run}",stage="{escape_label(name)}"'
+            cumulative = 0
+            for bound, count in zip(data['buckets'], data['counts']):
+                cumulative += count
+                lines.append(f'pipeline_file_seconds_bucket{{{labels},le="{bound}"}} {cumulative}')
+            lines.append(f'pipeline_file_seconds_bucket{{{labels},le="+Inf"}} {data["count"]}')
+            lines.append(f'pipeline_file_seconds_sum{{{labels}}} {data["sum"]}')
+            lines.append(f'pipeline_file_seconds_count{{{labels}}} {data["count"]}')
+        lines.append('# TYPE pipeline_elapsed_seconds gauge')
+        lines.append(f'pipeline_elapsed_seconds{{run="{run}"}} {snapshot["elapsed_seconds"]}')
+        return '\n'.join(lines) + '\n'
+
+    def export(self, output_prefix: str) -> None:
+        """
+        写出 {output_prefix}.json 和 {output_prefix}.prom，并打印各阶段耗时汇总
+        """
+        directory = os.path.dirname(output_prefix)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with open(output_prefix + '.json', 'w', encoding='utf-8') as f:
+            json.dump(self.snapshot(), f, ensure_ascii=False, indent=2)
+        with open(output_prefix + '.prom', 'w', encoding='utf-8') as f:
+            f.write(self.to_prometheus())
+        self.print_summary()
+        print(f"运行指标已保存至 {output_prefix}.json / {output_prefix}.prom")
+
+    def print_summary(self) -> None:
+        snapshot = self.snapshot()
+        print(f"------------------------------ 运行指标 {self.run_name}，总耗时 {snapshot['elapsed_seconds']:.1f}s")
+        for name, stage in sorted(snapshot['stages'].items(), key=lambda item: -item[1]['seconds']):
+            print(f"{name:<36} {stage['seconds']:>10.2f}s  {stage['calls']:>8} 次")
+        for name, histogram in snapshot['histograms'].items():
+            print(f"{name + ' 单文件耗时':<36} p50 {histogram['p50']}s / p95 {histogram['p95']}s / "
+                  f"p99 {histogram['p99']}s / max {histogram['max']}s")
+        for name, value in sorted(snapshot['counters'].items()):
+            print(f"{name:<36} {value:>12}")
+        for name, rate in snapshot['cache_hit_rates'].items():
+            print(f"{name + ' 命中率':<36} {rate * 100:>11.2f}%")
+
+
+class SamplingProfiler:
+    def __init__(self, interval: float = 0.01, max_depth: int = 64, include_idle: bool = False) -> None:
+        """
+        采样分析器：后台线程每隔 interval 秒抓取一次所有线程的调用栈，统计每个调用栈出现的次数
+        开销与采样频率有关、与被测代码无关，适合长时间运行的任务；只采样当前进程，进程池中的 worker 不包含在内
+        输出 folded 格式（flamegraph.pl / speedscope 可以直接读取）
+        :param include_idle: 是否记录空闲等待中的线程（见 IDLE_FRAMES）
+        """
+        self.interval = interval
+        self.max_depth = max_depth
+        self.include_idle = include_idle
+        self.stacks = Counter()
+        self.samples = 0
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name='sampling-profiler', daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        return self
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+    def _run(self) -> None:
+        own_id = threading.get_ident()
+        while not self._stop.wait(self.interval):
+            names = {thread.ident: thread.name for thread in threading.enumerate()}
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == own_id:
+                    continue
+                code = frame.f_code
+                if not self.include_idle and (os.path.basename(code.co_filename), code.co_name) in IDLE_FRAMES:
+                    continue
+                stack = []
+                while frame is not None and len(stack) < self.max_depth:
+                    code = frame.f_code
+                    stack.append(f'{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})')
+                    frame = frame.f_back
+                stack.append(names.get(thread_id, str(thread_id)))
+                self.stacks[';'.join(reversed(stack))] += 1
+            self.samples += 1
+
+    def top_functions(self, n: int = 20):
+        """
+        按自身耗时（出现在栈顶的次数）排序的前 n 个函数
+        """
+        self_counts = Counter()
+        for stack, count in self.stacks.items():
+            self_counts[stack.rsplit(';', 1)[-1]] += count
+        return self_counts.most_common(n)
+
+    def write_folded(self, output_file: str) -> None:
+        directory = os.path.dirname(output_file)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with open(output_file, 'w', encoding='utf-8') as f:
+            for stack, count in self.stacks.most_common():
+                f.write(f'{stack} {count}\n')
+        print(f"采样 {self.samples} 次，调用栈已保存至 {output_file}")
+        for name, count in self.top_functions(10):
+            print(f"{count:>8}  {name}")
+
+
+def metric_name(name: str) -> str:
+    return re.sub(r'[^a-zA-Z0-9_]', '_', name)
+
+
+def escape_label(value: str) -> str:
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+# 进程内共享的默认实例，各脚本直接记录到这里
+METRICS = PipelineMetrics()
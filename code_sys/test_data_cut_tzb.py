@@ -0,0 +1,56 @@
+"""
+pack_samples 回归测试：装箱后 middle 符号之后的位置（训练目标）完整保留在 row_loss_mask 中
+"""
+import os
+import sys
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from data_cut_tzb import pack_samples, permute_batch, split_long_samples
+
+PREFIX_TOK, SUFFIX_TOK, MIDDLE_TOK, EOS_TOK, PAD_TOK = 1001, 1002, 1003, 1004, 1005
+
+
+def make_fim_batch(sample_lengths, context_length, seed=0):
+    rng = np.random.RandomState(seed)
+    samples = [rng.randint(0, 1000, size=length) for length in sample_lengths]
+    samples = split_long_samples(samples, context_length - 4)
+    offsets = np.zeros(len(samples) + 1, dtype=np.int64)
+    np.cumsum([len(sample) for sample in samples], out=offsets[1:])
+    tokens = np.concatenate(samples)
+    return permute_batch(tokens, offsets, rng, SUFFIX_TOK, PREFIX_TOK, MIDDLE_TOK, fim_spm_rate=0.5)
+
+
+def test_packed_loss_mask_covers_middle():
+    context_length = 64
+    tokens, offsets, loss_mask = make_fim_batch([10, 30, 60, 61, 200, 500], context_length)
+    row_tokens, position_ids, document_ids, row_loss_mask = pack_samples(
+        tokens, offsets, loss_mask, context_length, EOS_TOK, PAD_TOK)
+
+    # 切段后没有样本被丢弃
+    assert set(document_ids[document_ids >= 0].tolist()) == set(range(len(offsets) - 1))
+    for doc in range(len(offsets) - 1):
+        row, cols = np.nonzero(document_ids == doc)
+        assert len(set(row.tolist())) == 1
+        doc_tokens = row_tokens[row[0], cols]
+        doc_mask = row_loss_mask[row[0], cols]
+        # 样本完整写入，middle 符号之后直到 EOS 都计算损失
+        np.testing.assert_array_equal(doc_tokens[:-1], tokens[offsets[doc]:offsets[doc + 1]])
+        assert doc_tokens[-1] == EOS_TOK
+        middle_pos = int(np.flatnonzero(doc_tokens == MIDDLE_TOK)[0])
+        assert doc_mask[middle_pos + 1:].all()
+        assert not doc_mask[:middle_pos + 1].any()
+
+
+def test_overlong_sample_is_dropped():
+    context_length = 16
+    tokens = np.arange(40)
+    offsets = np.array([0, 10, 30, 40])
+    loss_mask = np.ones(40, dtype=bool)
+    row_tokens, position_ids, document_ids, row_loss_mask = pack_samples(
+        tokens, offsets, loss_mask, context_length, EOS_TOK, PAD_TOK)
+
+    assert set(document_ids[document_ids >= 0].tolist()) == {0, 2}
+    assert row_loss_mask.sum() == 10 + 10 + 2
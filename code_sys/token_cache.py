@@ -0,0 +1,120 @@
+import os
+import json
+import hashlib
+import numpy as np
+
+
+def encoding_fingerprint(enc) -> str:
+    """
+    分词器指纹：名称、切分正则、词表和特殊 token 全部参与哈希，
+    同名但特殊 token 不同的 Encoding（如 data_cut_tzb 中追加了 FIM 符号的 cl100k_base_im）也能区分
+    :param enc: tiktoken.Encoding
+    """
+    h = hashlib.sha1()
+    h.update(enc.name.encode('utf-8'))
+    h.update(b'\0' + enc._pat_str.encode('utf-8'))
+    for token, rank in sorted(enc._mergeable_ranks.items(), key=lambda item: item[1]):
+        h.update(b'\0' + token + b'\0' + str(rank).encode('ascii'))
+    for token, rank in sorted(enc._special_tokens.items()):
+        h.update(b'\1' + token.encode('utf-8') + b'\0' + str(rank).encode('ascii'))
+    return h.hexdigest()
+
+
+class TokenCache:
+    def __init__(self, cache_dir: str, enc) -> None:
+        """
+        以内容哈希为 key 的 token 缓存
+        所有 token 以 uint32 追加写入 tokens.bin，按内存映射读取；
+        index.json 记录 {内容哈希: [起始位置, 长度]}
+        缓存按分词器划分子目录 {名称}-{指纹前缀}，meta.json 记录完整指纹，打开时不一致直接报错，
+        换了词表或特殊 token 后不会读到旧分词器的 token
+        :param cache_dir: 缓存根目录
+        :param enc: tiktoken.Encoding
+        """
+        self.enc = enc
+        self.fingerprint = encoding_fingerprint(enc)
+        self.cache_dir = os.path.join(cache_dir, f'{enc.name}-{self.fingerprint[:16]}')
+        self.tokens_path = os.path.join(self.cache_dir, 'tokens.bin')
+        self.index_path = os.path.join(self.cache_dir, 'index.json')
+        self.meta_path = os.path.join(self.cache_dir, 'meta.json')
+        os.makedirs(self.cache_dir, exist_ok=True)
+
+        meta = {'encoding': enc.name, 'fingerprint': self.fingerprint}
+        if os.path.exists(self.meta_path):
+            with open(self.meta_path, 'r', encoding='utf-8') as f:
+                cached_meta = json.load(f)
+            if cached_meta != meta:
+                raise ValueError(f"token 缓存 {self.cache_dir} 由其他分词器生成: "
+                                 f"{cached_meta.get('encoding')} ({cached_meta.get('fingerprint')})，"
+                                 f"当前为 {enc.name} ({self.fingerprint})")
+        elif os.path.exists(self.index_path):
+            raise ValueError(f"token 缓存 {self.cache_dir} 缺少 meta.json，无法确认分词器，请删除后重建")
+        else:
+            with open(self.meta_path, 'w', encoding='utf-8') as f:
+                json.dump(meta, f)
+
+        self.index = {}
+        if os.path.exists(self.index_path):
+            with open(self.index_path, 'r', encoding='utf-8') as f:
+                self.index = json.load(f)
+        self._tokens = None
+
+    @staticmethod
+    def content_hash(text: str) -> str:
+        return hashlib.sha1(text.encode('utf-8', errors='replace')).hexdigest()
+
+    def _memmap(self):
+        """
+        懒加载内存映射，写入新 token 后需要重新映射
+        """
+        if self._tokens is None:
+            if os.path.exists(self.tokens_path) and os.path.getsize(self.tokens_path) > 0:
+                self._tokens = np.memmap(self.tokens_path, dtype=np.uint32, mode='r')
+            else:
+                self._tokens = np.zeros(0, dtype=np.uint32)
+        return self._tokens
+
+    def _save_index(self) -> None:
+        tmp_path = self.index_path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(self.index, f, separators=(',', ':'))
+        os.replace(tmp_path, self.index_path)
+
+    def get(self, key: str):
+        """
+        按内容哈希取出 token 数组（内存映射上的视图，不复制）
+        """
+        start, length = self.index[key]
+        return self._memmap()[start:start + length]
+
+    def encode(self, texts, batch_size: int = 1024, num_threads: int = 8):
+        """
+        批量编码文本，已缓存的直接复用，未缓存的用 tiktoken encode_batch 多线程编码后追加到缓存
+        :param texts: 文本列表
+        :return: 与 texts 一一对应的 uint32 token 数组列表
+        """
+        keys = [self.content_hash(text) for text in texts]
+
+        # 只编码缓存中没有的文本，相同内容只编码一次
+        missing = {}
+        for key, text in zip(keys, texts):
+            if key not in self.index and key not in missing:
+                missing[key] = text
+
+        if missing:
+            missing_keys = list(missing.keys())
+            start = os.path.getsize(self.tokens_path) if os.path.exists(self.tokens_path) else 0
+            start //= np.dtype(np.uint32).itemsize
+            with open(self.tokens_path, 'ab') as f:
+                for batch_start in range(0, len(missing_keys), batch_size):
+                    batch_keys = missing_keys[batch_start:batch_start + batch_size]
+                    # tiktoken 编码时会释放 GIL，encode_batch 内部用线程池并行
+                    batch_tokens = self.enc.encode_batch([missing[key] for key in batch_keys], num_threads=num_threads)
+                    for key, tokens in zip(batch_keys, batch_tokens):
+                        np.asarray(tokens, dtype=np.uint32).tofile(f)
+                        self.index[key] = [start, len(tokens)]
+                        start += len(tokens)
+            self._save_index()
+            self._tokens = None  # 文件变长，重新映射
+
+        return [self.get(key) for key in keys]
@@ -0,0 +1,157 @@
+import os
+import re
+import json
+import bisect
+import hashlib
+
+# 打开 / 关闭语法块的关键词
+BLOCK_OPEN_KEYWORDS = {'begin', 'case', 'casex', 'casez', 'randcase', 'function', 'task', 'fork', 'generate'}
+BLOCK_CLOSE_KEYWORDS = {'end', 'endcase', 'endfunction', 'endtask', 'join', 'join_any', 'join_none', 'endgenerate'}
+# 过程块关键词，后面跟的语句结束之前都不能切
+PROCESS_KEYWORDS = {'always', 'always_ff', 'always_comb', 'always_latch', 'initial', 'final'}
+
+# 词法单元：注释、字符串、标识符/关键词、分号、换行、其他符号
+TOKEN_PATTERN = re.compile(
+    r'(?P<comment>//[^\n]*|/\*.*?\*/)'
+    r'|(?P<string>"(?:\\.|[^"\\\n])*")'
+    r'|(?P<word>[A-Za-z_`$][\w$]*)'
+    r'|(?P<semi>;)'
+    r'|(?P<newline>\n)'
+    r'|(?P<other>[^\s\w])',
+    re.DOTALL
+)
+
+
+# 计算结构边界
+def build_boundary_index(buffer):
+    """
+    扫描一遍文件内容，返回所有可以安全切分的行号（升序）
+    行号 b 表示可以在第 b-1 行和第 b 行之间切分，0 和总行数始终是边界
+    满足以下条件的行尾才算边界：
+      - 不在 begin/end、case/endcase、function/task、fork/join 等块内部
+      - 不在 always/initial 后尚未结束的语句中
+      - 当前语句已经以 ; 或块结束关键词收尾
+      - 下一行不是以 else 开头
+    """
+    depth = 0
+    pending_process = False
+    stmt_open = False
+    line_first_words = [None]
+    safe_lines = [True]
+
+    def end_line():
+        nonlocal stmt_open
+        # `define、`include 等编译指令以行为单位，不以分号结尾
+        first_word = line_first_words[-1]
+        if first_word and first_word.startswith('`') and depth == 0 and not pending_process:
+            stmt_open = False
+        safe_lines.append(depth == 0 and not pending_process and not stmt_open)
+        line_first_words.append(None)
+
+    for match in TOKEN_PATTERN.finditer(buffer):
+        kind = match.lastgroup
+        if kind == 'newline':
+            end_line()
+        elif kind == 'comment':
+            # 块注释内的换行也要计入行号
+            for _ in range(match.group().count('\n')):
+                end_line()
+        elif kind == 'semi':
+            stmt_open = False
+            if depth == 0:
+                pending_process = False
+        elif kind == 'word':
+            word = match.group()
+            if line_first_words[-1] is None:
+                line_first_words[-1] = word
+            if word in BLOCK_OPEN_KEYWORDS:
+                depth += 1
+                stmt_open = False
+            elif word in BLOCK_CLOSE_KEYWORDS:
+                depth = max(0, depth - 1)
+                stmt_open = False
+                if depth == 0:
+                    pending_process = False
+            elif word == 'endmodule':
+                depth = 0
+                pending_process = False
+                stmt_open = False
+            elif word in PROCESS_KEYWORDS:
+                pending_process = True
+                stmt_open = True
+            else:
+                stmt_open = True
+        else:
+            stmt_open = True
+            if line_first_words[-1] is None:
+                line_first_words[-1] = match.group()
+
+    # 没有以换行结尾时，最后一行也算一行
+    total_lines = len(safe_lines) - 1
+    if buffer and not buffer.endswith('\n'):
+        total_lines += 1
+
+    boundaries = [0]
+    for line_no in range(1, min(len(safe_lines), total_lines)):
+        if safe_lines[line_no] and line_first_words[line_no] != 'else':
+            boundaries.append(line_no)
+    if total_lines > 0:
+        boundaries.append(total_lines)
+    return boundaries
+
+
+# 边界索引缓存文件路径，与源文件放在一起
+def boundary_cache_path(file_path):
+    return file_path + '.bidx.json'
+
+
+# 读取或计算边界索引
+def load_or_build_boundaries(file_path, buffer, metrics=None):
+    """
+    缓存中记录文件内容的 sha256，内容不变时直接复用缓存，否则重新计算并写回
+    :param metrics: 可选的 PipelineMetrics，记录缓存命中情况
+    """
+    digest = hashlib.sha256(buffer.encode('utf-8', errors='replace')).hexdigest()
+    cache_path = boundary_cache_path(file_path)
+
+    if os.path.exists(cache_path):
+        try:
+            with open(cache_path, 'r', encoding='utf-8') as f:
+                cache = json.load(f)
+            if cache.get('sha256') == digest:
+                if metrics is not None:
+                    metrics.cache_lookup('boundary_cache', True)
+                return cache['boundaries']
+        except (OSError, ValueError, KeyError):
+            pass
+
+    if metrics is not None:
+        metrics.cache_lookup('boundary_cache', False)
+    boundaries = build_boundary_index(buffer)
+    try:
+        with open(cache_path, 'w', encoding='utf-8') as f:
+            json.dump({'sha256': digest, 'boundaries': boundaries}, f, separators=(',', ':'))
+    except OSError:
+        pass  # 输入目录只读时不缓存
+    return boundaries
+
+
+# 将切块终点吸附到最近的结构边界
+def snap_to_boundary(boundaries, current, target, max_shift):
+    """
+    :param boundaries: build_boundary_index 返回的升序行号
+    :param current: 当前块的起始行
+    :param target: 按分布抽样得到的块终点
+    :param max_shift: 允许移动的最大行数，超出时保持原终点（超长的块本身无法保持完整）
+    """
+    k = bisect.bisect_left(boundaries, target)
+    candidates = []
+    if k < len(boundaries):
+        candidates.append(boundaries[k])
+    if k > 0 and boundaries[k - 1] > current:
+        candidates.append(boundaries[k - 1])
+    if not candidates:
+        return target
+
+    best = min(candidates, key=lambda b: (abs(b - target), b))
+    return best if abs(best - target) <= max_shift else target
@@ -4,6 +4,8 @@
 @Date  : 12/28/2024
 @Desc  : 
 """
+import itertools
+import json
 import os
 import random
 import sys
@@ -12,13 +14,31 @@ import time
 from tqdm import tqdm
 
 
+# 读取块大小分布文件（code_sys/chunk_size_sampler.py 保存的别名表 values / prob / alias），返回 O(1) 的抽样函数
+def load_size_sampler(path):
+    with open(path, 'r', encoding='utf-8') as f:
+        table = json.load(f)
+    values, prob, alias = table['values'], table['prob'], table['alias']
+
+    def sample():
+        i = random.randrange(len(values))
+        return values[i] if random.random() < prob[i] else values[alias[i]]
+
+    return sample
+
+
 # 计算块大小
-def calculate_block_size(remaining_lines):
+def calculate_block_size(remaining_lines, size_sampler=None):
     # 确保块大小在 11-60 行之间
     # 如果剩余行数少于10行，不切分，返回剩余行数
     if remaining_lines <= 10:
         return remaining_lines
 
+    # 指定了由语料统计拟合的分布（load_size_sampler 返回的抽样函数）时按分布抽取，
+    # 抽到不足 11 行时按 11 行切，否则调用方会把它当作文件末尾的零头，丢掉剩下的所有行
+    if size_sampler is not None:
+        return min(max(size_sampler(), 11), remaining_lines)
+
     # 50%的块在 11-24 行之间
     if random.random() <= 0.5:
         block_size = random.randint(11, 24)
@@ -33,10 +53,18 @@ def calculate_block_size(remaining_lines):
     return min(block_size, remaining_lines)
 
 
+# 计算行偏移表，offsets[i] 为第 i 行在 content 中的起始位置
+def build_line_offsets(lines):
+    offsets = [0]
+    offsets.extend(itertools.accumulate(len(line) for line in lines))
+    return offsets
+
+
 # 保存文件块
-def save_block(lines, output_dir, filename, suffix):
-    cleaned_lines = [line.rstrip('\n') for line in lines]
-    block_content = "\n".join(cleaned_lines)
+def save_block(block_content, output_dir, filename, suffix):
+    # 去掉块末尾的换行，与逐行 rstrip 后用 "\n" 拼接的结果一致
+    if block_content.endswith('\n'):
+        block_content = block_content[:-1]
 
     block_filename = os.path.splitext(filename)[0] + suffix + ".v"
     block_filepath = os.path.join(output_dir, block_filename)
@@ -46,10 +74,14 @@ def save_block(lines, output_dir, filename, suffix):
 
 
 # 处理Verilog文件
-def process_verilog_file(input_file, output_dir):
+def process_verilog_file(input_file, output_dir, size_sampler=None):
     with open(input_file, 'r') as f:
         lines = f.readlines()
 
+    # 整个文件只拼接一次，按行偏移切块，不再反复切片列表
+    content = ''.join(lines)
+    offsets = build_line_offsets(lines)
+
     total_lines = len(lines)
     current_line = 0
     file_suffix = 1
@@ -59,18 +91,17 @@ def process_verilog_file(input_file, output_dir):
         remaining_lines = total_lines - current_line
 
         # 计算当前块的大小
-        block_size = calculate_block_size(remaining_lines)
+        block_size = calculate_block_size(remaining_lines, size_sampler)
 
         # 如果当前块行数少于10行，跳过切分直接合并
         if block_size <= 10:
             break
 
-        # 获取当前块的行
-        block_lines = lines[current_line:current_line + block_size]
+        # 获取当前块的内容
+        block_content = content[offsets[current_line]:offsets[current_line + block_size]]
 
-        # print(len(block_lines))
         # 保存当前块
-        save_block(block_lines, output_dir, os.path.basename(input_file), f"_{file_suffix}")
+        save_block(block_content, output_dir, os.path.basename(input_file), f"_{file_suffix}")
         file_suffix += 1
 
         # 更新当前行
@@ -78,7 +109,7 @@ def process_verilog_file(input_file, output_dir):
 
 
 # 主程序
-def process_verilog_files(input_directory, output_directory, sample=None):
+def process_verilog_files(input_directory, output_directory, sample=None, size_sampler=None):
     count = 0
     if not os.path.exists(output_directory):
         os.makedirs(output_directory)
@@ -89,7 +120,7 @@ def process_verilog_files(input_directory, output_directory, sample=None):
         # tqdm.write(f"Saving >> {filename}")
         input_file = os.path.join(input_directory, filename)
         if os.path.isfile(input_file) and filename.endswith(".v"):
-            process_verilog_file(input_file, output_directory)
+            process_verilog_file(input_file, output_directory, size_sampler)
         count += 1
     print(f"\nProcessed {count} files")
 
@@ -97,4 +128,8 @@ def process_verilog_files(input_directory, output_directory, sample=None):
 input_directory = r"../data/code-verilog"  # 输入Verilog文件目录
 output_directory = "./output1"  # 输出子块文件目录
 
-process_verilog_files(input_directory, output_directory, sample=3)
+# 块大小分布文件（code_sys/chunk_size_sampler.py 生成），可由命令行指定，不存在时沿用固定比例
+size_sampler_path = sys.argv[1] if len(sys.argv) > 1 else 'chunk_size_sampler.json'
+size_sampler = load_size_sampler(size_sampler_path) if os.path.exists(size_sampler_path) else None
+
+process_verilog_files(input_directory, output_directory, sample=3, size_sampler=size_sampler)
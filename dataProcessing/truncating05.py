@@ -6,6 +6,7 @@
 """
 import os
 import json
+import itertools
 import re
 import chardet
 import codecs
@@ -110,16 +111,22 @@ def splitFile(filePath, window, minLines=20, maxLines=30):
 
     # maxLines = 20  # 每个切片的最大行数
 
+    # 整个文件只拼接一次，用行偏移表截取滑动窗口，避免每个窗口重新切片和拼接行列表
+    content = ''.join(lines)
+    offsets = [0]
+    offsets.extend(itertools.accumulate(len(line) for line in lines))
+    totalLines = len(lines)
+
     # chunks = list(more_itertools.windowed(lines, maxLines))
     chunks = []
-    for i in range(0, len(lines), window):
-        chunk = lines[i:i + maxLines]
-        if len(chunk) < minLines:
+    for i in range(0, totalLines, window):
+        end = min(i + maxLines, totalLines)
+        if end - i < minLines:
             break
         else:
-            print(len(chunk))
+            print(end - i)
 
-        chunks.append(''.join(chunk))
+        chunks.append(content[offsets[i]:offsets[end]])
 
     return chunks
 
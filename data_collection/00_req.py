@@ -4,6 +4,7 @@ encoding: utf-8
     @Date  : 2024/12/19
     @Desc  : Git Repos
 """
+import sys
 import csv
 import json
 import time
@@ -26,9 +27,10 @@ def save_to_csv(data, filename='result.csv'):
             writer.writerow([item])
 
 
-def save_to_json(data):
-    current_time = datetime.datetime.now().strftime("%m%d_%H_%M")
-    filename = f'result_{current_time}.json'
+def save_to_json(data, filename=None):
+    if filename is None:
+        current_time = datetime.datetime.now().strftime("%m%d_%H_%M")
+        filename = f'result_{current_time}.json'
 
     with open(filename, mode='w', encoding='utf-8') as file:
         json.dump(data, file, ensure_ascii=False, indent=4)
@@ -94,4 +96,5 @@ if __name__ == '__main__':
         allResult.extend(result)
         time.sleep(0.3)
     print(f"Total saved >> {len(allResult)}")
-    save_to_json(allResult)
+    # 可指定输出文件，默认按时间命名
+    save_to_json(allResult, sys.argv[1] if len(sys.argv) > 1 else None)
@@ -5,6 +5,7 @@
 @Desc  : 
 """
 import re
+import sys
 import time
 import requests
 import os
@@ -36,12 +37,13 @@ def download_file(url, local_filename, proxies=None):
         return True
     except Exception as e:
         print(f"!!Failed to download {url}: {e}")
+        # 删除写了一半的文件，否则下次运行会当作已下载而跳过
+        if os.path.exists(local_filename):
+            os.remove(local_filename)
         return False
 
 # 主函数
-def main():
-    json_file = "test/result_12_20_14_42.json"
-    save_dir = 'zipfiles'
+def main(json_file="test/result_12_20_14_42.json", save_dir='zipfiles'):
 
     # 创建保存目录
     os.makedirs(save_dir, exist_ok=True)
@@ -79,10 +81,15 @@ def main():
         with open(failed_log, 'w', encoding='utf-8') as file:
             json.dump(failed_downloads, file, ensure_ascii=False, indent=4)
         print(f"Failed downloads logged to {failed_log}")
+    return failed_downloads
 
 if __name__ == "__main__":
+    # 出错或有下载失败时返回非 0，流水线不会把不完整的下载结果记为完成；已下载的文件下次运行时跳过
     try:
-        main()
+        failed = main(*sys.argv[1:3])
     except Exception as e:
         print(f"Unhandled exception occurred: {e}")
         traceback.print_exc()
+        sys.exit(1)
+    if failed:
+        sys.exit(1)
@@ -0,0 +1,119 @@
+# coding=utf-8
+"""
+@Desc  : 流式评测驱动：asyncio 保持最多 N 个请求在途，每个补全返回后立即用 eval03 / code_metrics 的指标评分，
+         并连同分数追加写入结果存储，生成与评分重叠进行；中断后重跑会跳过已经评分的样本
+         适合 OpenAI 兼容服务 / stub 等可以并发请求的后端；离线 vllm.LLM 请直接整批调用 generate
+"""
+import sys
+import asyncio
+from typing import Dict, Iterable, Optional, Tuple
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+from tqdm import tqdm
+
+from backends import GenerationBackend, create_backend
+from code_metrics import score_code_pairs
+from eval_dataset import iter_eval_samples
+from eval03 import score_pairs
+from result_store import ResultStore
+
+
+def score_completions(pairs):
+    """
+    评分一批 (prediction, label)，在进程池中运行
+    :return: 每条的分数字典，字段与 eval03 __main__ 追加的一致
+    """
+    results = []
+    for (bleu, rouge, custom, final), code_score in zip(score_pairs(pairs), score_code_pairs(pairs)):
+        results.append({'bleu': bleu, 'rouge': rouge, 'custom': custom, 'scores': final, **code_score})
+    return results
+
+
+def batched(samples: Iterable, batch_size: int):
+    batch = []
+    for sample in samples:
+        batch.append(sample)
+        if len(batch) == batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+async def run_eval(backend: GenerationBackend, samples: Iterable[Tuple], run_name: str, store: ResultStore,
+                   max_in_flight: int = 8, batch_size: int = 1, sampling: Optional[Dict] = None,
+                   score_workers: Optional[int] = None, fsync: bool = True) -> Dict:
+    """
+    :param samples: (sample_id, prompt, label) 的可迭代对象，可以是惰性的；prompt 为文本或 token id 列表
+    :param run_name: 结果存储中的 model 字段
+    :param max_in_flight: 同时在途的请求数
+    :param batch_size: 每个请求携带的样本数
+    :param score_workers: 评分进程数
+    :return: 本次新评分样本的平均分
+    """
+    sampling = sampling or {}
+    done_ids = store.completed_ids(run_name, field='scores')
+    pending = batched((sample for sample in samples if sample[0] not in done_ids), batch_size)
+
+    loop = asyncio.get_running_loop()
+    progress = tqdm(desc=f"评测 {run_name}", unit="条")
+    totals = {}
+    count = 0
+
+    def generate(prompts):
+        if prompts and not isinstance(prompts[0], str):
+            return backend.generate_tokens(prompts, **sampling)
+        return backend.generate(prompts, **sampling)
+
+    async def worker(generate_executor, score_executor, write_executor):
+        nonlocal count
+        # 事件循环是单线程的，多个 worker 共享同一个迭代器是安全的
+        for batch in pending:
+            sample_ids, prompts, labels = zip(*batch)
+            texts = await loop.run_in_executor(generate_executor, generate, list(prompts))
+            records = [{'sample_id': sample_id, 'model': run_name, 'question': prompt, 'label': label,
+                        'prediction': text}
+                       for sample_id, prompt, label, text in zip(sample_ids, prompts, labels, texts)]
+
+            scored = [(record, (record['prediction'], str(record['label']))) for record in records
+                      if record['label'] is not None]
+            if scored:
+                scores = await loop.run_in_executor(score_executor, score_completions, [pair for _, pair in scored])
+                for (record, _), score in zip(scored, scores):
+                    record.update(score)
+                    for key, value in score.items():
+                        totals[key] = totals.get(key, 0.0) + value
+                count += len(scored)
+
+            # 写入和 fsync 会阻塞，放到单线程的写入线程中，不卡住事件循环，各批次的追加也不会交错
+            await loop.run_in_executor(write_executor, store.append, records, fsync)
+            progress.update(len(records))
+
+    with ThreadPoolExecutor(max_workers=max_in_flight) as generate_executor, \
+            ProcessPoolExecutor(max_workers=score_workers) as score_executor, \
+            ThreadPoolExecutor(max_workers=1) as write_executor:
+        await asyncio.gather(*(worker(generate_executor, score_executor, write_executor)
+                               for _ in range(max_in_flight)))
+    progress.close()
+
+    summary = {key: value / count for key, value in totals.items()} if count else {}
+    if summary:
+        print(f"新评分 {count} 条，平均综合评分: {summary['scores']:.2f}，"
+              f"edit_similarity: {summary['edit_similarity'] * 100:.2f}")
+    return summary
+
+
+if __name__ == '__main__':
+    data_path = sys.argv[1] if len(sys.argv) > 1 else '/hy-tmp/hippo/data/sft_data/hippo_test_sft_data.json'
+    base_url = sys.argv[2] if len(sys.argv) > 2 else 'http://127.0.0.1:8000/v1'
+    model_name = 'Qwen2.5-Coder-7B'
+
+    shard_index = int(sys.argv[3]) if len(sys.argv) > 3 else 0
+    num_shards = int(sys.argv[4]) if len(sys.argv) > 4 else 1
+
+    # 惰性读取，样本边读边提交
+    samples = iter_eval_samples(data_path, shard_index=shard_index, num_shards=num_shards)
+
+    backend = create_backend('openai', base_url=base_url, model=model_name, batch_size=8)
+    asyncio.run(run_eval(backend, samples, f'{model_name}@greedy', ResultStore('hippo_eval_results.jsonl'),
+                         max_in_flight=16, batch_size=8, sampling={'temperature': 0, 'max_tokens': 512}))
@@ -0,0 +1,304 @@
+# coding=utf-8
+"""
+@Desc  : 生成后端：统一的 generate(prompts, **sampling) -> List[str] 接口
+         hf: transformers generate；vllm: vllm.LLM；openai: OpenAI 兼容 /v1/completions 服务（批量 HTTP）；
+         stub: 进程内确定性假模型，用于在只有 CPU 的机器上测试/压测评测流程的批处理、缓存和评分
+         GPU 相关依赖只在创建对应后端时导入
+"""
+import json
+import random
+import hashlib
+import time
+from typing import Dict, List, Optional
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# 与原 vllm_chat 中的采样参数一致
+DEFAULT_SAMPLING = {'temperature': 0.7, 'top_p': 0.8, 'repetition_penalty': 1.05, 'max_tokens': 512}
+
+
+class GenerationBackend:
+    name = 'base'
+
+    def generate(self, prompts: List[str], **sampling) -> List[str]:
+        """
+        :param prompts: 已经渲染好的提示词文本
+        :param sampling: 采样参数，未指定的取 DEFAULT_SAMPLING
+        :return: 与 prompts 一一对应的生成文本（不含提示词）
+        """
+        raise NotImplementedError
+
+    def generate_tokens(self, prompt_token_ids: List[List[int]], **sampling) -> List[str]:
+        """
+        直接传入已分词的提示词，避免每组采样参数都重新分词
+        """
+        raise NotImplementedError
+
+    @staticmethod
+    def sampling_params(sampling: Dict) -> Dict:
+        return {**DEFAULT_SAMPLING, **sampling}
+
+
+# 按 token 长度分桶：长度相近的提示词放进同一批，只需补齐到桶内最大长度
+def length_buckets(lengths: List[int], batch_size: int, max_batch_tokens: Optional[int] = None) -> List[List[int]]:
+    """
+    从长到短排序后依次装批，最长的批次最先运行，显存不足会尽早暴露
+    :param max_batch_tokens: 每批补齐后的 token 总数上限（批大小 x 桶内最大长度）
+    :return: 每批的下标列表
+    """
+    order = sorted(range(len(lengths)), key=lambda i: -lengths[i])
+    batches = []
+    current = []
+    for i in order:
+        if current and (len(current) >= batch_size or
+                        (max_batch_tokens and (len(current) + 1) * lengths[current[0]] > max_batch_tokens)):
+            batches.append(current)
+            current = []
+        current.append(i)
+    if current:
+        batches.append(current)
+    return batches
+
+
+class HFBackend(GenerationBackend):
+    name = 'hf'
+
+    def __init__(self, path: str, tokenizer=None, batch_size: int = 8, max_batch_tokens: Optional[int] = None,
+                 device_map: Optional[str] = None) -> None:
+        """
+        :param batch_size: 每批最多的提示词条数
+        :param max_batch_tokens: 每批补齐后的 token 总数上限
+        :param device_map: 默认有 GPU 时为 "auto"，否则在 CPU 上加载（不依赖 accelerate）
+        """
+        import torch
+        from transformers import AutoTokenizer, AutoModelForCausalLM
+
+        if device_map is None and torch.cuda.is_available():
+            device_map = "auto"
+
+        self.tokenizer = tokenizer or AutoTokenizer.from_pretrained(pretrained_model_name_or_path=path)
+        # decoder-only 模型批量生成需要左侧补齐，生成的 token 才能紧接在提示词后面
+        self.tokenizer.padding_side = 'left'
+        self.model = AutoModelForCausalLM.from_pretrained(pretrained_model_name_or_path=path,
+                                                          torch_dtype="auto",
+                                                          device_map=device_map).eval()
+        self.batch_size = batch_size
+        self.max_batch_tokens = max_batch_tokens
+        pad_token_id = self.tokenizer.pad_token_id
+        self.pad_token_id = pad_token_id if pad_token_id is not None else self.tokenizer.eos_token_id
+
+    def generate(self, prompts: List[str], **sampling) -> List[str]:
+        return self.generate_tokens(self.tokenizer(prompts)['input_ids'], **sampling)
+
+    def generate_tokens(self, prompt_token_ids: List[List[int]], **sampling) -> List[str]:
+        responses = [None] * len(prompt_token_ids)
+        for indices, texts in self.iter_generate_tokens(prompt_token_ids, **sampling):
+            for i, text in zip(indices, texts):
+                responses[i] = text
+        return responses
+
+    def iter_generate_tokens(self, prompt_token_ids: List[List[int]], **sampling):
+        """
+        按长度分桶批量生成，每完成一批就 yield (下标列表, 生成文本列表)，调用方可以边生成边落盘
+        """
+        import torch
+
+        params = self.sampling_params(sampling)
+        do_sample = params['temperature'] > 0
+        batches = length_buckets([len(ids) for ids in prompt_token_ids], self.batch_size, self.max_batch_tokens)
+        for indices in batches:
+            max_len = max(len(prompt_token_ids[i]) for i in indices)
+            input_ids = torch.full((len(indices), max_len), self.pad_token_id, dtype=torch.long)
+            attention_mask = torch.zeros((len(indices), max_len), dtype=torch.long)
+            for row, i in enumerate(indices):
+                token_ids = prompt_token_ids[i]
+                if token_ids:
+                    input_ids[row, max_len - len(token_ids):] = torch.tensor(token_ids, dtype=torch.long)
+                    attention_mask[row, max_len - len(token_ids):] = 1
+            with torch.no_grad():
+                generated_ids = self.model.generate(input_ids.to(self.model.device),
+                                                    attention_mask=attention_mask.to(self.model.device),
+                                                    max_new_tokens=params['max_tokens'],
+                                                    do_sample=do_sample,
+                                                    temperature=params['temperature'] if do_sample else None,
+                                                    top_p=params['top_p'] if do_sample else None,
+                                                    repetition_penalty=params['repetition_penalty'],
+                                                    pad_token_id=self.pad_token_id)
+            # 左侧补齐后所有序列的提示词都占前 max_len 列，解码整批所有序列
+            yield indices, self.tokenizer.batch_decode(generated_ids[:, max_len:], skip_special_tokens=True)
+
+
+class VllmBackend(GenerationBackend):
+    name = 'vllm'
+
+    def __init__(self, path: str, gpu_memory_utilization: float = 0.8) -> None:
+        import torch.cuda as cuda
+        from vllm import LLM
+
+        # 开启前缀缓存，共享前缀的请求（见 prefix_order）复用已计算的 KV
+        self.llm = LLM(model=path, tensor_parallel_size=cuda.device_count(), dtype="float16",
+                       gpu_memory_utilization=gpu_memory_utilization, enable_prefix_caching=True)
+
+    @staticmethod
+    def _sampling_params(sampling: Dict):
+        from vllm import SamplingParams
+
+        params = GenerationBackend.sampling_params(sampling)
+        return SamplingParams(temperature=params['temperature'], top_p=params['top_p'],
+                              repetition_penalty=params['repetition_penalty'],
+                              max_tokens=params['max_tokens'], seed=params.get('seed'))
+
+    def generate(self, prompts: List[str], **sampling) -> List[str]:
+        # vLLM 自己做连续批处理，按输入顺序返回
+        return [response.outputs[0].text for response in self.llm.generate(prompts, self._sampling_params(sampling))]
+
+    def generate_tokens(self, prompt_token_ids: List[List[int]], **sampling) -> List[str]:
+        prompts = [{'prompt_token_ids': token_ids} for token_ids in prompt_token_ids]
+        return [response.outputs[0].text for response in self.llm.generate(prompts, self._sampling_params(sampling))]
+
+
+class OpenAIBackend(GenerationBackend):
+    name = 'openai'
+
+    def __init__(self, base_url: str, model: str, batch_size: int = 32, max_workers: int = 4,
+                 api_key: Optional[str] = None, timeout: float = 600, max_retries: int = 3) -> None:
+        """
+        OpenAI 兼容的文本补全服务（vLLM / TGI / sglang 的 openai server，或 serve_stub 启动的本地替身）
+        :param base_url: 如 http://127.0.0.1:8000/v1
+        :param batch_size: 每个请求携带的提示词条数（/v1/completions 的 prompt 支持列表）
+        :param max_workers: 同时在途的请求数
+        """
+        import requests
+
+        self.url = base_url.rstrip('/') + '/completions'
+        self.model = model
+        self.batch_size = batch_size
+        self.max_workers = max_workers
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.session = requests.Session()
+        if api_key:
+            self.session.headers['Authorization'] = f'Bearer {api_key}'
+
+    def _post(self, payload):
+        import requests
+
+        for attempt in range(self.max_retries + 1):
+            try:
+                response = self.session.post(self.url, json=payload, timeout=self.timeout)
+                response.raise_for_status()
+                return response.json()
+            except requests.RequestException:
+                if attempt == self.max_retries:
+                    raise
+                time.sleep(2 ** attempt)
+
+    def _generate_batch(self, prompts, params: Dict) -> List[str]:
+        payload = {'model': self.model, 'prompt': prompts, **params}
+        choices = self._post(payload)['choices']
+        # 服务端不保证 choices 的顺序，按 index 还原
+        texts = [''] * len(prompts)
+        for choice in choices:
+            texts[choice['index']] = choice['text']
+        return texts
+
+    def generate(self, prompts: List[str], **sampling) -> List[str]:
+        return self._generate_all(prompts, sampling)
+
+    def generate_tokens(self, prompt_token_ids: List[List[int]], **sampling) -> List[str]:
+        # /v1/completions 的 prompt 也可以是 token id 列表的列表
+        return self._generate_all(prompt_token_ids, sampling)
+
+    def _generate_all(self, prompts, sampling: Dict) -> List[str]:
+        params = self.sampling_params(sampling)
+        batches = [prompts[i:i + self.batch_size] for i in range(0, len(prompts), self.batch_size)]
+        responses = []
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            for texts in executor.map(lambda batch: self._generate_batch(batch, params), batches):
+                responses.extend(texts)
+        return responses
+
+
+class StubBackend(GenerationBackend):
+    name = 'stub'
+
+    def __init__(self, seed: int = 0, latency: float = 0.0, token_latency: float = 0.0) -> None:
+        """
+        确定性假模型：生成结果只由 (seed, prompt, 采样参数) 决定，从提示词自身的词中抽取，
+        长度不超过 max_tokens 个词；可以模拟每个请求 / 每个输出词的延迟
+        :param latency: 每批请求的固定延迟（秒）
+        :param token_latency: 每个输出词的延迟（秒）
+        """
+        self.seed = seed
+        self.latency = latency
+        self.token_latency = token_latency
+
+    def complete(self, prompt: str, params: Dict) -> str:
+        key = json.dumps([self.seed, prompt, params], sort_keys=True, ensure_ascii=False)
+        rng = random.Random(hashlib.sha256(key.encode('utf-8')).digest())
+        words = prompt.split() or ['']
+        length = rng.randint(1, max(1, min(params['max_tokens'], 64)))
+        return ' '.join(rng.choice(words) for _ in range(length))
+
+    def generate(self, prompts: List[str], **sampling) -> List[str]:
+        params = self.sampling_params(sampling)
+        responses = [self.complete(prompt, params) for prompt in prompts]
+        delay = self.latency + self.token_latency * sum(len(text.split()) for text in responses)
+        if delay > 0:
+            time.sleep(delay)
+        return responses
+
+    def generate_tokens(self, prompt_token_ids: List[List[int]], **sampling) -> List[str]:
+        return self.generate([' '.join(map(str, token_ids)) for token_ids in prompt_token_ids], **sampling)
+
+
+BACKENDS = {backend.name: backend for backend in (HFBackend, VllmBackend, OpenAIBackend, StubBackend)}
+
+
+def create_backend(name: str, **kwargs) -> GenerationBackend:
+    if name not in BACKENDS:
+        raise KeyError(f"未注册的生成后端: {name}，可选: {', '.join(BACKENDS)}")
+    return BACKENDS[name](**kwargs)
+
+
+# 本地替身服务：用任意后端（默认 stub）提供 OpenAI 兼容的 /v1/completions
+def serve_stub(host: str = '127.0.0.1', port: int = 8000, backend: Optional[GenerationBackend] = None):
+    """
+    :return: ThreadingHTTPServer，调用方负责 serve_forever() / shutdown()
+    """
+    backend = backend or StubBackend()
+
+    class CompletionHandler(BaseHTTPRequestHandler):
+        def do_POST(self):
+            if self.path.rstrip('/') not in ('/v1/completions', '/completions'):
+                self.send_error(404)
+                return
+            request = json.loads(self.rfile.read(int(self.headers.get('Content-Length', 0))))
+            prompts = request.pop('prompt')
+            prompts = [prompts] if isinstance(prompts, str) else prompts
+            model = request.pop('model', backend.name)
+            if prompts and isinstance(prompts[0], list):
+                texts = backend.generate_tokens(prompts, **request)
+            else:
+                texts = backend.generate(prompts, **request)
+            body = json.dumps({
+                'object': 'text_completion',
+                'model': model,
+                'choices': [{'index': i, 'text': text, 'finish_reason': 'length'} for i, text in enumerate(texts)],
+            }, ensure_ascii=False).encode('utf-8')
+            self.send_response(200)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    return ThreadingHTTPServer((host, port), CompletionHandler)
+
+
+if __name__ == '__main__':
+    server = serve_stub()
+    print(f"stub 补全服务已启动: http://{server.server_address[0]}:{server.server_address[1]}/v1")
+    server.serve_forever()
@@ -0,0 +1,109 @@
+# coding=utf-8
+"""
+@Desc  : 代码补全常用指标：行级精确匹配、首行精确匹配、归一化编辑相似度
+         在去除空白差异后的 Verilog token 序列上计算，编辑距离使用 Myers/Hyyrö 位并行算法
+"""
+import re
+from tqdm import tqdm
+from concurrent.futures import ProcessPoolExecutor
+
+TOKEN_PATTERN = re.compile(r"\w+|[^\w\s]")
+
+
+def normalize_lines(text):
+    """
+    行内空白合并为一个空格，去掉首尾空白和空行
+    """
+    return [" ".join(line.split()) for line in text.splitlines() if line.strip()]
+
+
+def code_tokens(text):
+    """
+    Verilog token 序列：标识符/数字为一个 token，其余符号各为一个 token，忽略所有空白
+    """
+    return TOKEN_PATTERN.findall(text)
+
+
+def levenshtein_distance(seq1, seq2):
+    """
+    Myers/Hyyrö 位并行编辑距离：把 seq1 编码为位向量（Python 大整数），逐个扫描 seq2 的元素，
+    复杂度约 O(len1 * len2 / 64)，元素可以是任意可哈希对象（字符或 token）
+    """
+    if not seq1:
+        return len(seq2)
+    if not seq2:
+        return len(seq1)
+
+    peq = {}
+    for i, item in enumerate(seq1):
+        peq[item] = peq.get(item, 0) | (1 << i)
+
+    m = len(seq1)
+    full = (1 << m) - 1
+    high_bit = 1 << (m - 1)
+    pv = full
+    mv = 0
+    score = m
+    for item in seq2:
+        eq = peq.get(item, 0)
+        xv = eq | mv
+        xh = (((eq & pv) + pv) ^ pv) | eq
+        ph = (mv | ~(xh | pv)) & full
+        mh = pv & xh
+        if ph & high_bit:
+            score += 1
+        elif mh & high_bit:
+            score -= 1
+        ph = ((ph << 1) | 1) & full
+        mh = (mh << 1) & full
+        pv = (mh | ~(xv | ph)) & full
+        mv = ph & xv
+    return score
+
+
+def edit_similarity(prediction_tokens, label_tokens):
+    """
+    1 - 编辑距离 / 较长序列长度，两者都为空时记为 1
+    """
+    longest = max(len(prediction_tokens), len(label_tokens))
+    if longest == 0:
+        return 1.0
+    return 1 - levenshtein_distance(label_tokens, prediction_tokens) / longest
+
+
+def code_metrics(prediction, label):
+    pred_lines = normalize_lines(prediction)
+    label_lines = normalize_lines(label)
+    return {
+        "exact_match": float(pred_lines == label_lines),
+        "first_line_exact_match": float(pred_lines[:1] == label_lines[:1]),
+        "edit_similarity": edit_similarity(code_tokens(prediction), code_tokens(label)),
+    }
+
+
+def score_code_pairs(pairs):
+    return [code_metrics(pred, label) for pred, label in pairs]
+
+
+def calculate_code_metrics(predictions, labels, workers=None, chunk_size=512):
+    """
+    批量计算代码补全指标，按 chunk_size 条一批分发到进程池，workers=1 时在当前进程计算
+    :return: 每条数据的指标字典列表
+    """
+    pairs = list(zip(predictions, labels))
+    chunks = [pairs[i:i + chunk_size] for i in range(0, len(pairs), chunk_size)]
+
+    results = []
+    if workers == 1:
+        for chunk in tqdm(chunks, desc="Calculating code metrics ..."):
+            results.extend(score_code_pairs(chunk))
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            for chunk_results in tqdm(executor.map(score_code_pairs, chunks), total=len(chunks),
+                                      desc="Calculating code metrics ..."):
+                results.extend(chunk_results)
+
+    if results:
+        for key in ("exact_match", "first_line_exact_match", "edit_similarity"):
+            print(f"{key}: {sum(r[key] for r in results) / len(results) * 100:.2f}")
+    return results
@@ -0,0 +1,154 @@
+# coding=utf-8
+"""
+@Desc  : 生成结果缓存（SQLite），键为 (模型标识, 提示词哈希, 采样参数哈希)
+         命中的提示词不再生成；未命中的按批生成，每批完成后立即写入，中断后重跑会从断点继续
+         注意：temperature > 0 时缓存的是第一次采样的结果，需要重新采样时在采样参数里换一个 seed
+"""
+import os
+import sys
+import json
+import time
+import sqlite3
+import hashlib
+from array import array
+from typing import Dict, List, Optional
+
+from backends import GenerationBackend
+
+# 文件哈希缓存与流水线编排共用 pipeline/file_hashes.py
+sys.path.append(os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'pipeline'))
+from file_hashes import FileHashCache
+
+
+def model_fingerprint(path: str, hash_cache: Optional[str] = None) -> str:
+    """
+    本地检查点：config.json 和每个权重文件完整内容的哈希，只改了部分张量的检查点也能区分；
+    不是本地目录时（如 OpenAI 兼容服务的模型名）直接使用 path
+    :param hash_cache: 权重文件哈希的缓存文件，大小和修改时间不变时不重新读取几 GB 的权重
+    """
+    if not os.path.isdir(path):
+        return path
+    hashes = FileHashCache(hash_cache)
+    digest = hashlib.sha256()
+    for name in sorted(os.listdir(path)):
+        if name == 'config.json' or name.endswith(('.safetensors', '.bin', '.pt')):
+            digest.update(f'{name}:{hashes.digest(os.path.join(path, name))}\n'.encode('utf-8'))
+    hashes.save()
+    return f'{os.path.basename(os.path.normpath(path))}:{digest.hexdigest()[:16]}'
+
+
+def prompt_hash(prompt) -> str:
+    """
+    :param prompt: 提示词文本或 token id 列表
+    """
+    if isinstance(prompt, str):
+        data = b's' + prompt.encode('utf-8')
+    else:
+        data = b't' + array('q', prompt).tobytes()
+    return hashlib.sha256(data).hexdigest()
+
+
+def params_hash(sampling: Dict) -> str:
+    return hashlib.sha256(json.dumps(GenerationBackend.sampling_params(sampling),
+                                     sort_keys=True).encode('utf-8')).hexdigest()
+
+
+class CompletionCache:
+    def __init__(self, path: str) -> None:
+        self.path = path
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        # WAL 模式下写入不阻塞读取，多个评测进程可以共享同一个缓存
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        self.conn.execute('PRAGMA synchronous=NORMAL')
+        self.conn.execute('''
+            CREATE TABLE IF NOT EXISTS completions (
+                model TEXT NOT NULL,
+                prompt_hash TEXT NOT NULL,
+                params_hash TEXT NOT NULL,
+                completion TEXT NOT NULL,
+                created REAL NOT NULL,
+                PRIMARY KEY (model, prompt_hash, params_hash)
+            ) WITHOUT ROWID
+        ''')
+        self.conn.commit()
+
+    def get_many(self, model: str, prompt_hashes: List[str], sampling_hash: str) -> Dict[str, str]:
+        """
+        :return: {prompt_hash: completion}，只包含命中的
+        """
+        found = {}
+        unique = list(dict.fromkeys(prompt_hashes))
+        # SQLite 默认最多 999 个绑定参数
+        for i in range(0, len(unique), 900):
+            chunk = unique[i:i + 900]
+            rows = self.conn.execute(
+                f'SELECT prompt_hash, completion FROM completions '
+                f'WHERE model = ? AND params_hash = ? AND prompt_hash IN ({",".join("?" * len(chunk))})',
+                [model, sampling_hash, *chunk])
+            found.update(rows)
+        return found
+
+    def put_many(self, model: str, items: Dict[str, str], sampling_hash: str) -> None:
+        now = time.time()
+        with self.conn:
+            self.conn.executemany(
+                'INSERT OR REPLACE INTO completions VALUES (?, ?, ?, ?, ?)',
+                [(model, key, sampling_hash, completion, now) for key, completion in items.items()])
+
+    def count(self, model: Optional[str] = None) -> int:
+        if model is None:
+            return self.conn.execute('SELECT COUNT(*) FROM completions').fetchone()[0]
+        return self.conn.execute('SELECT COUNT(*) FROM completions WHERE model = ?', (model,)).fetchone()[0]
+
+    def close(self) -> None:
+        self.conn.close()
+
+
+class CachedBackend(GenerationBackend):
+    name = 'cached'
+
+    def __init__(self, backend: GenerationBackend, cache: CompletionCache, model_id: str,
+                 chunk_size: int = 256) -> None:
+        """
+        :param backend: 实际执行生成的后端
+        :param model_id: 模型标识，本地检查点建议用 model_fingerprint(path)
+        :param chunk_size: 未命中的提示词每多少条生成一次并写入缓存，决定中断时最多损失多少结果
+        """
+        self.backend = backend
+        self.cache = cache
+        self.model_id = model_id
+        self.chunk_size = chunk_size
+        self.hits = 0
+        self.misses = 0
+
+    def _generate_cached(self, prompts, generate_fn, sampling: Dict) -> List[str]:
+        sampling_hash = params_hash(sampling)
+        keys = [prompt_hash(prompt) for prompt in prompts]
+        found = self.cache.get_many(self.model_id, keys, sampling_hash)
+
+        # 同一提示词只生成一次
+        pending = {}
+        for key, prompt in zip(keys, prompts):
+            if key not in found and key not in pending:
+                pending[key] = prompt
+        misses = sum(1 for key in keys if key not in found)
+        self.hits += len(keys) - misses
+        self.misses += misses
+
+        pending_keys = list(pending)
+        for i in range(0, len(pending_keys), self.chunk_size):
+            chunk_keys = pending_keys[i:i + self.chunk_size]
+            completions = generate_fn([pending[key] for key in chunk_keys], **sampling)
+            generated = dict(zip(chunk_keys, completions))
+            self.cache.put_many(self.model_id, generated, sampling_hash)
+            found.update(generated)
+        return [found[key] for key in keys]
+
+    def generate(self, prompts: List[str], **sampling) -> List[str]:
+        return self._generate_cached(prompts, self.backend.generate, sampling)
+
+    def generate_tokens(self, prompt_token_ids: List[List[int]], **sampling) -> List[str]:
+        return self._generate_cached(prompt_token_ids, self.backend.generate_tokens, sampling)
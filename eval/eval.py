@@ -18,34 +18,42 @@
   },
 ]
 """
-from transformers import AutoTokenizer, AutoModelForCausalLM
-import json
+import os
+import sys
 
-def extract_inputs(json_data):
+from backends import HFBackend
+from eval_dataset import iter_eval_samples
+from result_store import ResultStore
+
+def extract_inputs(samples):
+    sample_ids = []
     input_list = []
-    for item in json_data:
-        input_list.append(item['input'])
-    return input_list
+    label_list = []
+    for sample_id, question, label in samples:
+        sample_ids.append(sample_id)
+        input_list.append(question)
+        label_list.append(label)
+    return sample_ids, input_list, label_list
 
-device = "cuda" # the device to load the model onto
+# 模型路径可以从命令行传入，CPU 上可以用小模型测试
+MODEL_PATH = sys.argv[1] if len(sys.argv) > 1 else "/hy-tmp/hippo/models/Qwen2.5-Coder-7B"
+DATA_PATH = sys.argv[2] if len(sys.argv) > 2 else '/hy-tmp/hippo/data/sft_data/hippo_test_sft_data.json'
+RUN_NAME = f"{os.path.basename(MODEL_PATH.rstrip('/'))}@hf"
 
-# Now you do not need to add "trust_remote_code=True"
-TOKENIZER = AutoTokenizer.from_pretrained("/hy-tmp/hippo/models/Qwen2.5-Coder-7B")
-MODEL = AutoModelForCausalLM.from_pretrained("/hy-tmp/hippo/models/Qwen2.5-Coder-7B", device_map="auto").eval()
+# 按长度分桶批量生成，左侧补齐
+BACKEND = HFBackend(MODEL_PATH, batch_size=8, max_batch_tokens=8 * 4096)
 
 # tokenize the input into tokens
-# 从文件中读取JSON数据
-with open('/hy-tmp/hippo/data/sft_data/hippo_test_sft_data.json', 'r') as file:
-    json_data = json.load(file)
-
-input_list = extract_inputs(json_data)
-
-input_text = input_list[:2]
-model_inputs = TOKENIZER(input_text, padding=True, truncation=True, return_tensors="pt").to(device)
-
-# Use `max_new_tokens` to control the maximum output length.
-generated_ids = MODEL.generate(model_inputs.input_ids, max_new_tokens=512, do_sample=True)[0]
-# The generated_ids include prompt_ids, so we only need to decode the tokens after prompt_ids.
-output_text = TOKENIZER.decode(generated_ids[len(model_inputs.input_ids[0]):], skip_special_tokens=True)
-
-print(f"Prompt: {input_text}\n\nGenerated text: {output_text}")
\ No newline at end of file
+# 流式读取评测数据
+sample_ids, input_list, label_list = extract_inputs(iter_eval_samples(DATA_PATH))
+# 评测输入中的 <|fim_prefix|> 等特殊符号由分词器直接识别
+prompt_ids = BACKEND.tokenizer(input_list, add_special_tokens=False)['input_ids']
+
+# 每完成一批就追加写入结果存储，中途中断也不会丢掉已完成的批次
+store = ResultStore('hippo_eval_results.jsonl')
+for indices, output_texts in BACKEND.iter_generate_tokens(prompt_ids, max_tokens=512):
+    store.append({'sample_id': sample_ids[i], 'model': RUN_NAME, 'question': input_list[i],
+                  'label': label_list[i], 'prediction': text}
+                 for i, text in zip(indices, output_texts))
+    for i, text in zip(indices, output_texts):
+        print(f"Prompt #{i}\n\nGenerated text: {text}")
@@ -5,13 +5,22 @@
 @Desc  : 
 """
 import re
-import pandas as pd
+import sys
+import math
+import functools
 from tqdm import tqdm
 from rouge_score import rouge_scorer
 import hashlib
+import numpy as np
 from datetime import datetime
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+from nltk.stem import porter
 from nltk.translate.bleu_score import sentence_bleu, SmoothingFunction
 
+from code_metrics import calculate_code_metrics
+from result_store import ResultStore
+
 
 def preprocess_text(text):
     # 去除多余的空格和换行符
@@ -51,7 +60,7 @@ def calculate_bleu_score(candidate, reference):
 
 def calculate_window_hashes(code, window_size=10, hash_algorithm="sha256"):
     """
-    计算代码片段的滑动窗口哈希值
+    计算代码片段的滑动窗口哈希值（逐窗口调用 hashlib，仅作参考实现，评分使用 calculate_rolling_hashes）
     """
     window_hashes = []
     for i in range(len(code) - window_size + 1):
@@ -61,17 +70,35 @@ def calculate_window_hashes(code, window_size=10, hash_algorithm="sha256"):
         window_hashes.append(hasher.hexdigest())
     return window_hashes
 
+# Unicode 码位上限，窗口不超过 3 个字符时以它为基数的多项式哈希是单射（3 * 21 位 < 64 位），与逐窗口哈希结果完全一致
+CODE_POINT_BASE = np.uint64(0x110000)
+# 更长的窗口在 uint64 上自然溢出取模，使用大奇数作为基数
+ROLLING_HASH_BASE = np.uint64(0x100000001B3)
+
+def calculate_rolling_hashes(code, window_size=3):
+    """
+    用多项式滚动哈希计算所有滑动窗口的整数哈希，返回 uint64 数组（长度与 calculate_window_hashes 相同）
+    """
+    num_windows = len(code) - window_size + 1
+    if num_windows <= 0:
+        return np.zeros(0, dtype=np.uint64)
+    code_points = np.frombuffer(code.encode("utf-32-le"), dtype=np.uint32).astype(np.uint64)
+    base = CODE_POINT_BASE if window_size <= 3 else ROLLING_HASH_BASE
+    hashes = np.zeros(num_windows, dtype=np.uint64)
+    for k in range(window_size):
+        hashes = hashes * base + code_points[k:k + num_windows]
+    return hashes
+
 def calculate_similarity(code1, code2, window_size=3):
     """
     计算两段代码的局部相似度
     """
     # 计算滑动窗口哈希值
-    hashes1 = calculate_window_hashes(code1, window_size)
-    hashes2 = calculate_window_hashes(code2, window_size)
+    hashes1 = calculate_rolling_hashes(code1, window_size)
+    hashes2 = calculate_rolling_hashes(code2, window_size)
 
-    # 统计重合的窗口数量
-    common_hashes = set(hashes1).intersection(set(hashes2))
-    common_count = len(common_hashes)
+    # 统计重合的窗口数量（去重后在有序数组上求交集）
+    common_count = len(np.intersect1d(np.unique(hashes1), np.unique(hashes2), assume_unique=True))
 
     # 计算相似度
     total_windows = max(len(hashes1), len(hashes2))
@@ -112,8 +139,125 @@ def custom_scoring(prediction, label, threshold_ratio=0.3):
 
     return similarity * 100
 
+# ---------------------------- 批量评分引擎 ----------------------------
+
+# 与 NLTK SmoothingFunction().method1 相同的平滑系数
+BLEU_EPSILON = 0.1
+
+def bleu_1_2_score(candidate_tokens, reference_tokens):
+    """
+    与 calculate_bleu_score 结果一致（NLTK sentence_bleu，weights=(0.5, 0.5, 0, 0)，method1 平滑），
+    直接在已分好的 token 上计算，不再构造 Fraction
+    """
+    hyp_len = len(candidate_tokens)
+    ref_len = len(reference_tokens)
+    log_precisions = []
+    for n in (1, 2, 3, 4):
+        hyp_ngrams = Counter(zip(*[candidate_tokens[i:] for i in range(n)]))
+        ref_ngrams = Counter(zip(*[reference_tokens[i:] for i in range(n)]))
+        numerator = sum(min(count, ref_ngrams[ngram]) for ngram, count in hyp_ngrams.items())
+        denominator = max(1, sum(hyp_ngrams.values()))
+        if n == 1 and numerator == 0:
+            return 0.0  # 没有任何 unigram 匹配
+        log_precisions.append(math.log((numerator or BLEU_EPSILON) / denominator))
+
+    if hyp_len > ref_len:
+        brevity_penalty = 1.0
+    elif hyp_len == 0:
+        brevity_penalty = 0.0
+    else:
+        brevity_penalty = math.exp(1 - ref_len / hyp_len)
+
+    weights = (0.5, 0.5, 0, 0)
+    return brevity_penalty * math.exp(math.fsum(w * p for w, p in zip(weights, log_precisions))) * 100
+
+@functools.lru_cache(maxsize=None)
+def _porter_stem(token):
+    return _PORTER_STEMMER.stem(token)
+
+_PORTER_STEMMER = porter.PorterStemmer()
+
+def rouge_tokenize(text, use_stemmer=True):
+    """
+    与 rouge_score 默认分词一致：小写、非字母数字替换为空格、长度大于 3 的 token 做 Porter 词干化
+    代码里 token 重复率很高，词干化结果做了缓存
+    """
+    tokens = re.sub(r"[^a-z0-9]+", " ", text.lower()).split()
+    if use_stemmer:
+        tokens = [_porter_stem(token) if len(token) > 3 else token for token in tokens]
+    return tokens
+
+def lcs_length(tokens1, tokens2):
+    """
+    位并行 LCS（Hyyrö 2004），用 Python 大整数做位向量，复杂度约 O(len1 * len2 / 64)
+    """
+    if not tokens1 or not tokens2:
+        return 0
+    match_masks = {}
+    for i, token in enumerate(tokens2):
+        match_masks[token] = match_masks.get(token, 0) | (1 << i)
+    full = (1 << len(tokens2)) - 1
+    v = full
+    for token in tokens1:
+        u = v & match_masks.get(token, 0)
+        v = ((v + u) | (v - u)) & full
+    return len(tokens2) - bin(v).count("1")
+
+def rouge_l_fmeasure(target_tokens, prediction_tokens):
+    """
+    与 rouge_scorer 的 rougeL fmeasure 一致
+    """
+    if not target_tokens or not prediction_tokens:
+        return 0.0
+    lcs = lcs_length(target_tokens, prediction_tokens)
+    precision = lcs / len(prediction_tokens)
+    recall = lcs / len(target_tokens)
+    if precision + recall == 0:
+        return 0.0
+    return 2 * precision * recall / (precision + recall)
+
+def score_pairs(pairs):
+    """
+    计算一批 (prediction, label) 的 (BLEU, ROUGE-L, 自定义评分, 综合评分)，每条文本只分词一次
+    """
+    results = []
+    for pred, label in pairs:
+        bleu_score = bleu_1_2_score(pred.split(), label.split())
+        rouge_score = rouge_l_fmeasure(rouge_tokenize(pred), rouge_tokenize(label)) * 100
+        custom_score = custom_scoring(pred, label)
+        final_score = calculate_final_score(bleu_score, rouge_score, custom_score)
+        results.append((bleu_score, rouge_score, custom_score, final_score))
+    return results
+
 # 计算总分数
-def calculate_total_scores(predictions, labels):
+def calculate_total_scores(predictions, labels, workers=None, chunk_size=256, return_details=False):
+    """
+    计算每一对 prediction 和 label 的总分数
+    按 chunk_size 条一批分发到进程池，workers=1 时在当前进程计算
+    :param return_details: 为 True 时返回每条的 (BLEU, ROUGE-L, 自定义评分, 综合评分)
+    """
+    pairs = list(zip(predictions, labels))
+    chunks = [pairs[i:i + chunk_size] for i in range(0, len(pairs), chunk_size)]
+
+    details = []
+    if workers == 1:
+        for chunk in tqdm(chunks, desc="Calculating scores ..."):
+            details.extend(score_pairs(chunk))
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            for chunk_results in tqdm(executor.map(score_pairs, chunks), total=len(chunks),
+                                      desc="Calculating scores ..."):
+                details.extend(chunk_results)
+
+    scores = [final_score for _, _, _, final_score in details]
+
+    # 计算最终平均分
+    avg_final_score = sum(scores) / len(scores) if scores else 0
+    print(f"最终平均综合评分: {avg_final_score:.2f}")
+    return details if return_details else scores
+
+# 逐条调用 NLTK / rouge_score 的原实现，用于核对批量评分引擎
+def calculate_total_scores_serial(predictions, labels):
     """
     计算每一对 prediction 和 label 的总分数
     """
@@ -123,31 +267,12 @@ def calculate_total_scores(predictions, labels):
 
     for idx, (pred, label) in tqdm(enumerate(zip(predictions, labels), start=1),
                             total=len(predictions), desc="Calculating scores ..."):
-
-        # 计算当前数据的 BLEU 分数
-        # bleu_score = sentence_bleu([pred.split()], label.split()) * 100
-        # bleu_score = calculate_bleu(pred, label) * 100
-
         bleu_score = calculate_bleu_score(pred, label)
-
-        # 计算当前数据的 ROUGE 分数
         rouge_score = rouge.score(pred, label)['rougeL'].fmeasure * 100
-
-        # 计算当前数据的自定义评分
         custom_score = custom_scoring(pred, label)
-
-        # 计算当前数据的综合评分
         final_score = calculate_final_score(bleu_score, rouge_score, custom_score)
         scores.append(final_score)
 
-        # 打印当前数据的评分
-        # print(f"第 {idx} 条数据生成完成，当前评分:")
-        # print(f"  - BLEU Score: {bleu_score:.2f}")
-        # print(f"  - ROUGE-L Score: {rouge_score:.2f}")
-        # print(f"  - Custom Score: {custom_score:.2f}")
-        # print(f"  - Final Combined Score: {final_score:.2f}")
-
-        # 计算最终平均分
     avg_final_score = sum(scores) / len(scores)
     print(f"最终平均综合评分: {avg_final_score:.2f}")
     return scores
@@ -157,18 +282,31 @@ def calculate_total_scores(predictions, labels):
 
 
 if __name__ == '__main__':
-    inputFile = r"hippo_eval_output_3083_trained.xlsx"
-
-    timeStamp = datetime.now().strftime("%m-%d-%H%M")
-    outputFile = rf"./eval_scores{timeStamp}.xlsx"
-
-    df = pd.read_excel(inputFile)
-    labels = df["标准答案"].astype(str)
-    predictions = df['base 预测答案'].astype(str)
+    resultFile = sys.argv[1] if len(sys.argv) > 1 else r"hippo_eval_results.jsonl"
+    modelName = sys.argv[2] if len(sys.argv) > 2 else "Qwen2.5-Coder-7B@greedy"
+    # 分数写入的结果存储，默认追加到生成结果所在的同一个文件
+    scoreFile = sys.argv[3] if len(sys.argv) > 3 else resultFile
+
+    store = ResultStore(resultFile)
+    scoreStore = ResultStore(scoreFile)
+    records = store.load(model=modelName)
+    labels = [str(record['label']) for record in records]
+    predictions = [str(record['prediction']) for record in records]
     # 运行评测
     print("开始评测...")
-    scores = calculate_total_scores(predictions, labels)
+    details = calculate_total_scores(predictions, labels, return_details=True)
+    # 代码补全指标：行级精确匹配、首行精确匹配、token 编辑相似度
+    code_scores = calculate_code_metrics(predictions, labels)
 
-    df['scores'] = scores
-    df.to_excel(outputFile)
-    print(f"评测完毕,文件已存储至{outputFile}")
\ No newline at end of file
+    # 分数追加到结果存储，键与生成阶段一致
+    scoreStore.append({'sample_id': record['sample_id'], 'model': modelName,
+                       'bleu': bleu, 'rouge': rouge, 'custom': custom, 'scores': final, **code_score}
+                      for record, (bleu, rouge, custom, final), code_score in zip(records, details, code_scores))
+    print(f"评测完毕,分数已追加至{scoreFile}")
+
+    # 可选：导出 Excel
+    timeStamp = datetime.now().strftime("%m-%d-%H%M")
+    try:
+        scoreStore.export_excel(rf"./eval_scores{timeStamp}.xlsx", model=modelName)
+    except ImportError:
+        print("未安装 openpyxl，跳过 Excel 导出")
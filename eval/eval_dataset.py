@@ -0,0 +1,44 @@
+# coding=utf-8
+"""
+@Desc  : 评测数据流式读取：兼容 JSON 数组（hippo_test_sft_data.json）和 JSONL，逐块读入、逐条解析，
+         支持按下标分片（第 k 个 worker / 共 n 个）和确定性抽样，读够 num_samples 条即停止读文件
+"""
+import os
+import sys
+import hashlib
+
+# 流式读取与 SFT 转换共用 sft_data/tran.py 的 iter_records（兼容 JSON 数组）
+sys.path.append(os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'sft_data'))
+from tran import iter_records
+
+
+def keep_sample(index, seed, sample_rate):
+    """
+    确定性抽样：只由 (seed, 下标) 决定，与读取顺序、分片数无关
+    """
+    if sample_rate >= 1:
+        return True
+    digest = hashlib.blake2b(f'{seed}:{index}'.encode('utf-8'), digest_size=8).digest()
+    return int.from_bytes(digest, 'big') < sample_rate * (1 << 64)
+
+
+def iter_eval_samples(input_file, num_samples=None, shard_index=0, num_shards=1, sample_rate=1.0, seed=0,
+                      input_key='input', output_key='output'):
+    """
+    :param num_samples: 抽样后最多取多少条（对所有分片合计，与原 extract_inputs 的 [:num_samples] 一致）
+    :param shard_index / num_shards: 只产出抽中样本中序号 % num_shards == shard_index 的部分，
+                                     各 worker 的结果合起来与单进程完全相同
+    :param sample_rate: 抽样比例
+    :return: 迭代器，元素为 (sample_id, input, output)，sample_id 为该条在文件中的下标
+    """
+    if not 0 <= shard_index < num_shards:
+        raise ValueError(f"shard_index 必须在 [0, {num_shards}) 之间")
+    selected = 0
+    for index, item in enumerate(iter_records(input_file)):
+        if num_samples is not None and selected >= num_samples:
+            break
+        if not keep_sample(index, seed, sample_rate):
+            continue
+        if selected % num_shards == shard_index:
+            yield index, item[input_key], item.get(output_key)
+        selected += 1
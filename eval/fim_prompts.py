@@ -0,0 +1,86 @@
+# coding=utf-8
+"""
+@Desc  : 原始 FIM 补全模式：不套 chat 模板，直接把 <|fim_prefix|>P<|fim_suffix|>S<|fim_middle|> 交给模型续写
+         提示词只分词一次，按 token 预算截断（prefix 从左侧截、suffix 从右侧截，保留紧挨 middle 的部分），
+         得到的 token id 可以在多组采样参数之间复用
+"""
+from typing import List, Tuple
+
+# Qwen2.5-Coder 的 FIM 特殊符号（与 sft_data/fim_templates.py 中的 qwen 模板一致）
+FIM_PREFIX = '<|fim_prefix|>'
+FIM_SUFFIX = '<|fim_suffix|>'
+FIM_MIDDLE = '<|fim_middle|>'
+
+
+def split_fim_prompt(text: str) -> Tuple[str, str]:
+    """
+    把评测输入拆成 (prefix, suffix)，兼容 sft_data/tran.py 输出的两种格式：
+    PSM: <|fim_prefix|>P<|fim_suffix|>S<|fim_middle|>
+    SPM: <|fim_prefix|><|fim_suffix|>S<|fim_middle|>P
+    prefix 为空的 PSM 与 SPM 文本相同，两种解析结果也相同
+    """
+    if not (text.startswith(FIM_PREFIX) and FIM_SUFFIX in text):
+        raise ValueError("输入不是 <|fim_prefix|>...<|fim_suffix|>...<|fim_middle|> 格式")
+    if text.startswith(FIM_PREFIX + FIM_SUFFIX):
+        body = text[len(FIM_PREFIX + FIM_SUFFIX):]
+        suffix, _, prefix = body.partition(FIM_MIDDLE)
+        return prefix, suffix
+    body = text[len(FIM_PREFIX):]
+    if body.endswith(FIM_MIDDLE):
+        body = body[:-len(FIM_MIDDLE)]
+    prefix, suffix = body.split(FIM_SUFFIX, 1)
+    return prefix, suffix
+
+
+def truncate_fim(prefix_ids: List[int], suffix_ids: List[int], budget: int,
+                 prefix_ratio: float = 0.5) -> Tuple[List[int], List[int]]:
+    """
+    把 prefix + suffix 截断到 budget 个 token 以内
+    一侧不足自己的份额时，剩余额度让给另一侧
+    :param prefix_ratio: 两侧都超长时 prefix 占预算的比例
+    """
+    if len(prefix_ids) + len(suffix_ids) <= budget:
+        return prefix_ids, suffix_ids
+    prefix_share = int(budget * prefix_ratio)
+    if len(prefix_ids) <= prefix_share:
+        keep_prefix = len(prefix_ids)
+    elif len(suffix_ids) <= budget - prefix_share:
+        keep_prefix = budget - len(suffix_ids)
+    else:
+        keep_prefix = prefix_share
+    keep_suffix = budget - keep_prefix
+    return prefix_ids[len(prefix_ids) - keep_prefix:], suffix_ids[:keep_suffix]
+
+
+class FimPromptBuilder:
+    def __init__(self, tokenizer, max_prompt_tokens: int = 2048, prefix_ratio: float = 0.5) -> None:
+        """
+        :param tokenizer: transformers 分词器
+        :param max_prompt_tokens: 提示词（含 3 个 FIM 特殊符号）的最大 token 数
+        """
+        self.tokenizer = tokenizer
+        self.max_prompt_tokens = max_prompt_tokens
+        self.prefix_ratio = prefix_ratio
+        self.special_ids = tokenizer.convert_tokens_to_ids([FIM_PREFIX, FIM_SUFFIX, FIM_MIDDLE])
+
+    def encode(self, texts: List[str]) -> List[List[int]]:
+        """
+        :param texts: PSM 格式的评测输入
+        :return: 每条输入截断后的提示词 token id
+        """
+        prefixes, suffixes = zip(*(split_fim_prompt(text) for text in texts)) if texts else ((), ())
+        # 快速分词器批量分词，prefix / suffix 各一次
+        prefix_ids = self.tokenizer(list(prefixes), add_special_tokens=False)['input_ids']
+        suffix_ids = self.tokenizer(list(suffixes), add_special_tokens=False)['input_ids']
+
+        prefix_id, suffix_id, middle_id = self.special_ids
+        budget = self.max_prompt_tokens - 3
+        prompts = []
+        truncated = 0
+        for p_ids, s_ids in zip(prefix_ids, suffix_ids):
+            kept_p, kept_s = truncate_fim(p_ids, s_ids, budget, self.prefix_ratio)
+            truncated += len(kept_p) + len(kept_s) < len(p_ids) + len(s_ids)
+            prompts.append([prefix_id, *kept_p, suffix_id, *kept_s, middle_id])
+        if truncated:
+            print(f"{truncated}/{len(prompts)} 条提示词超过 {self.max_prompt_tokens} 个 token，已截断")
+        return prompts
@@ -0,0 +1,115 @@
+# coding=utf-8
+"""
+@Desc  : 按共享前缀排序评测请求
+         同一文件的相邻块（block_id_{file_index}_{n}）的提示词有很长的公共前缀，
+         在 token id 上建压缩前缀树，按深度优先顺序提交请求、按共享前缀分组，后端的前缀 / KV 缓存才能命中
+"""
+from typing import List, Optional
+
+
+def common_prefix_length(seq1, seq2) -> int:
+    n = min(len(seq1), len(seq2))
+    i = 0
+    while i < n and seq1[i] == seq2[i]:
+        i += 1
+    return i
+
+
+class TrieNode:
+    __slots__ = ('depth', 'children', 'indices')
+
+    def __init__(self, depth: int) -> None:
+        """
+        :param depth: 从根到该节点的 token 数
+        """
+        self.depth = depth
+        self.children = []
+        self.indices = []  # 恰好在该节点结束的提示词下标（重复的提示词共用一个节点）
+
+
+class PrefixTrie:
+    def __init__(self, prompt_token_ids: List[List[int]]) -> None:
+        """
+        压缩前缀树（每条边可以包含多个 token，节点数不超过 2 x 提示词条数）：
+        按字典序排序后，相邻两条的最长公共前缀（LCP）就是它们在树中分叉的深度，用一个栈即可线性建树
+        """
+        self.prompts = prompt_token_ids
+        self.order = sorted(range(len(prompt_token_ids)), key=lambda i: prompt_token_ids[i])
+        self.lcp = [common_prefix_length(prompt_token_ids[a], prompt_token_ids[b])
+                    for a, b in zip(self.order, self.order[1:])]
+
+        self.root = TrieNode(0)
+        stack = [self.root]
+        for k, index in enumerate(self.order):
+            if k > 0:
+                shared = self.lcp[k - 1]
+                last = None
+                while stack[-1].depth > shared:
+                    last = stack.pop()
+                if stack[-1].depth < shared:
+                    # 在 last 这条边的中间分叉
+                    node = TrieNode(shared)
+                    stack[-1].children[-1] = node
+                    node.children.append(last)
+                    stack.append(node)
+            length = len(prompt_token_ids[index])
+            if stack[-1].depth == length:
+                stack[-1].indices.append(index)
+            else:
+                leaf = TrieNode(length)
+                leaf.indices.append(index)
+                stack[-1].children.append(leaf)
+                stack.append(leaf)
+
+    def iter_indices(self, node: Optional[TrieNode] = None):
+        """
+        深度优先顺序（即字典序）遍历提示词下标
+        """
+        stack = [node or self.root]
+        while stack:
+            node = stack.pop()
+            yield from node.indices
+            stack.extend(reversed(node.children))
+
+    def groups(self, min_shared_tokens: int = 1) -> List[List[int]]:
+        """
+        共享前缀不少于 min_shared_tokens 个 token 的提示词分为一组，组按深度优先顺序排列
+        """
+        groups = []
+        stack = [self.root]
+        while stack:
+            node = stack.pop()
+            if node.depth >= min_shared_tokens:
+                groups.append(list(self.iter_indices(node)))
+                continue
+            groups.extend([index] for index in node.indices)
+            stack.extend(reversed(node.children))
+        return groups
+
+    def stats(self):
+        """
+        shared_prefix_ratio：按深度优先顺序提交、后端缓存全部前缀时可省掉的预填充 token 比例
+        """
+        total_tokens = sum(len(ids) for ids in self.prompts)
+        shared_tokens = sum(self.lcp)
+        return {
+            'num_prompts': len(self.prompts),
+            'total_tokens': total_tokens,
+            'shared_tokens': shared_tokens,
+            'prefill_tokens': total_tokens - shared_tokens,
+            'shared_prefix_ratio': shared_tokens / total_tokens if total_tokens else 0.0,
+        }
+
+
+def order_by_shared_prefix(prompt_token_ids: List[List[int]], min_shared_tokens: int = 16):
+    """
+    :return: (提交顺序的下标列表, 分组, 统计信息)
+    """
+    trie = PrefixTrie(prompt_token_ids)
+    groups = trie.groups(min_shared_tokens)
+    order = [index for group in groups for index in group]
+    stats = trie.stats()
+    stats['num_groups'] = len(groups)
+    print(f"{stats['num_prompts']} 条提示词分为 {stats['num_groups']} 组，"
+          f"共享前缀占比 {stats['shared_prefix_ratio']:.2%}（预填充 {stats['prefill_tokens']}/{stats['total_tokens']} token）")
+    return order, groups, stats
@@ -0,0 +1,107 @@
+# coding=utf-8
+"""
+@Desc  : 评测结果存储：追加写入的 JSONL，每条记录以 (sample_id, model) 为键
+         生成阶段写入 question/label/prediction，评分阶段对同一个键追加分数字段，
+         读取时按写入顺序合并同键记录（后写入的字段覆盖先写入的），Excel 只作为可选的最终导出
+"""
+import os
+import json
+
+
+class ResultStore:
+    KEY_FIELDS = ('sample_id', 'model')
+
+    def __init__(self, path: str) -> None:
+        """
+        :param path: JSONL 文件路径，不存在时在第一次写入时创建
+        """
+        self.path = path
+
+    def append(self, records, fsync: bool = False) -> int:
+        """
+        追加一批记录，每条记录必须包含 sample_id 和 model；每批写完后 flush，中途中断也不会丢掉已写入的批次
+        :param fsync: 为 True 时写完后落盘，机器掉电也不丢
+        :return: 写入条数
+        """
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        # 上次写入中断留下不完整的末行时先换行，避免与新记录拼在一起；
+        # 按字节检查末尾，末行可能断在多字节 UTF-8 字符中间，文本模式读取会抛 UnicodeDecodeError
+        torn = False
+        if os.path.exists(self.path):
+            with open(self.path, 'rb') as f:
+                f.seek(0, os.SEEK_END)
+                if f.tell() > 0:
+                    f.seek(-1, os.SEEK_END)
+                    torn = f.read(1) != b'\n'
+
+        count = 0
+        with open(self.path, 'a', encoding='utf-8') as f:
+            if torn:
+                f.write('\n')
+            for record in records:
+                missing = [field for field in self.KEY_FIELDS if field not in record]
+                if missing:
+                    raise ValueError(f"记录缺少键字段: {', '.join(missing)}")
+                f.write(json.dumps(record, ensure_ascii=False) + '\n')
+                count += 1
+            f.flush()
+            if fsync:
+                os.fsync(f.fileno())
+        return count
+
+    def iter_raw(self):
+        """
+        按写入顺序逐行读取原始记录，跳过中断写入造成的不完整行（可能断在多字节字符中间，按 replace 解码后解析失败跳过）
+        """
+        if not os.path.exists(self.path):
+            return
+        with open(self.path, 'r', encoding='utf-8', errors='replace') as f:
+            for line in f:
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    yield json.loads(line)
+                except json.JSONDecodeError:
+                    continue
+
+    def load(self, model=None):
+        """
+        合并同键记录
+        :param model: 指定时只返回该模型/检查点的记录
+        :return: 按 sample_id 首次出现顺序排列的记录列表
+        """
+        merged = {}
+        for record in self.iter_raw():
+            if model is not None and record['model'] != model:
+                continue
+            key = (record['sample_id'], record['model'])
+            if key in merged:
+                merged[key].update(record)
+            else:
+                merged[key] = dict(record)
+        return list(merged.values())
+
+    def completed_ids(self, model, field='prediction'):
+        """
+        已经写入 field 字段的 sample_id，用于断点续跑时跳过
+        """
+        return {record['sample_id'] for record in self.iter_raw()
+                if record['model'] == model and field in record}
+
+    def models(self):
+        return sorted({record['model'] for record in self.iter_raw()})
+
+    def export_excel(self, output_file, model=None, columns=None) -> None:
+        """
+        导出为 Excel（需要 pandas + openpyxl）
+        :param columns: 指定导出的列及顺序，默认导出全部字段
+        """
+        import pandas as pd
+
+        df = pd.DataFrame(self.load(model))
+        if columns is not None:
+            df = df[list(columns)]
+        df.to_excel(output_file, index=False)
@@ -0,0 +1,25 @@
+# coding=utf-8
+"""
+@Desc  : ResultStore 回归测试：写入中断后末行断在多字节字符中间，后续追加仍然正常
+"""
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from result_store import ResultStore
+
+
+def test_append_after_torn_non_ascii_tail(tmp_path):
+    path = tmp_path / 'results.jsonl'
+    store = ResultStore(str(path))
+    store.append([{'sample_id': 0, 'model': 'm', 'prediction': '完整'}])
+    # 模拟写入中断：末行不完整，且最后一个字符 "文" 只写了前两个字节
+    with open(path, 'ab') as f:
+        f.write('{"sample_id": 1, "model": "m", "prediction": "中文'.encode('utf-8')[:-1])
+
+    store.append([{'sample_id': 2, 'model': 'm', 'prediction': '续写'}])
+
+    records = store.load('m')
+    assert [record['sample_id'] for record in records] == [0, 2]
+    assert records[1]['prediction'] == '续写'
@@ -1,13 +1,16 @@
 from typing import Dict, List, Optional, Tuple, Union
-from transformers import AutoTokenizer, AutoModelForCausalLM, AutoModel
-from transformers.generation.utils import GenerationConfig
-from vllm import LLM, SamplingParams
-import torch.cuda as cuda  
-import json
+from transformers import AutoTokenizer
+import os
+import sys
 from tqdm import tqdm  # 进度条库
 import csv
-from openpyxl import Workbook
-import openpyxl
+
+from backends import GenerationBackend, create_backend
+from eval_dataset import iter_eval_samples
+from completion_cache import CachedBackend, CompletionCache, model_fingerprint
+from fim_prompts import FimPromptBuilder
+from prefix_order import order_by_shared_prefix
+from result_store import ResultStore
 
 class BaseModel:
     def __init__(self, path: str = '') -> None:
@@ -19,92 +22,129 @@ class BaseModel:
         pass
 
 class Qwen(BaseModel):
-    def __init__(self, path: str = '', is_vllm: bool = False) -> None:
+    def __init__(self, path: str = '', is_vllm: bool = False, backend: Optional[GenerationBackend] = None) -> None:
+        """
+        :param is_vllm: 未指定 backend 时，True 使用 vllm 后端，False 使用 transformers 后端
+        :param backend: 已创建好的生成后端（如 OpenAI 兼容服务、stub），指定时不再在本进程加载模型
+        """
         super().__init__(path)
         self.is_vllm = is_vllm
+        self.backend = backend
         self.load_model()
 
     def load_model(self) -> None:
         print('================ Loading model ================')
-        self.tokenizer = AutoTokenizer.from_pretrained(pretrained_model_name_or_path=self.path)
-        if not self.is_vllm:
-            self.model = AutoModelForCausalLM.from_pretrained(pretrained_model_name_or_path=self.path, 
-                                                            torch_dtype="auto",
-                                                            device_map="auto").eval()
-        else:
-            self.vllm_model = LLM(model=self.path, tensor_parallel_size=cuda.device_count(), dtype="float16", gpu_memory_utilization=0.8)
+        # stub 等后端没有对应的分词器时，只能使用 generate 直接传入渲染好的文本
+        self.tokenizer = AutoTokenizer.from_pretrained(pretrained_model_name_or_path=self.path) if self.path else None
+        if self.backend is None:
+            if not self.is_vllm:
+                self.backend = create_backend('hf', path=self.path, tokenizer=self.tokenizer)
+            else:
+                self.backend = create_backend('vllm', path=self.path)
         
         print('================ Model loaded ================')
+
+    def generate(self, prompts: List[str], **sampling) -> List[str]:
+        return self.backend.generate(prompts, **sampling)
+
+    def generate_tokens(self, prompt_token_ids: List[List[int]], **sampling) -> List[str]:
+        return self.backend.generate_tokens(prompt_token_ids, **sampling)
+
+    def fim_complete(self, questions: List[str], max_prompt_tokens: int = 2048,
+                     sampling_settings: Optional[Dict[str, dict]] = None) -> Dict[str, List[str]]:
+        """
+        原始 FIM 补全：不套 chat 模板，提示词按 token 预算截断后只分词一次，在每组采样参数间复用
+        :param sampling_settings: {设置名: 采样参数}，默认只做一次贪心解码
+        :return: {设置名: 生成结果列表}
+        """
+        sampling_settings = sampling_settings or {'greedy': {'temperature': 0, 'max_tokens': 512}}
+        prompt_ids = FimPromptBuilder(self.tokenizer, max_prompt_tokens=max_prompt_tokens).encode(questions)
+        # 共享前缀的提示词相邻提交，后端前缀缓存可以复用 KV；生成后还原为原顺序
+        order, _, self.prefix_stats = order_by_shared_prefix(prompt_ids)
+        ordered_ids = [prompt_ids[i] for i in order]
+        run_outputs = {}
+        for name, sampling in sampling_settings.items():
+            outputs = [None] * len(prompt_ids)
+            for i, text in zip(order, self.generate_tokens(ordered_ids, **sampling)):
+                outputs[i] = text
+            run_outputs[name] = outputs
+        return run_outputs
     
     def chat(self, messages:List[dict]) -> str:
         text = self.tokenizer.apply_chat_template(messages, tokenize=False, add_generation_prompt=True)
-        model_inputs = self.tokenizer([text], return_tensors='pt').to(self.model.device)
-        generated_ids = self.model.generate(**model_inputs, max_new_tokens=512)
-        generated_ids = [
-            output_ids[len(input_ids):] for input_ids, output_ids in zip(model_inputs.input_ids, generated_ids)
-        ]
-        response = self.tokenizer.batch_decode(generated_ids, skip_special_tokens=True)[0]
-        return response
+        return self.generate([text], max_tokens=512)[0]
     
-    def vllm_chat(self, messages:Union[List[Dict[str, str]], List[List[Dict[str, str]]]]) -> str:
+    def vllm_chat(self, messages:Union[List[Dict[str, str]], List[List[Dict[str, str]]]]) -> List[str]:
         text = self.tokenizer.apply_chat_template(messages, tokenize=False, add_generation_prompt=True, max_length=2048, truncation=True)
-        sampling_params = SamplingParams(temperature=0.7, top_p=0.8, repetition_penalty=1.05, max_tokens=512)
-        responses = self.vllm_model.generate(text, sampling_params)
-        return responses
+        if isinstance(text, str):
+            text = [text]
+        return self.generate(text, temperature=0.7, top_p=0.8, repetition_penalty=1.05, max_tokens=512)
     
-def extract_inputs(json_data,num_samples=10):
+def extract_inputs(samples):
+    """
+    :param samples: eval_dataset.iter_eval_samples 产出的 (sample_id, input, output)
+    """
+    sample_ids = []
     input_list = []
     label_list = []
-    for item in json_data:
-        input_list.append(item['input'])
-        label_list.append(item['output'])
-    return input_list[:num_samples],label_list[:num_samples]
+    for sample_id, question, label in samples:
+        sample_ids.append(sample_id)
+        input_list.append(question)
+        label_list.append(label)
+    return sample_ids,input_list,label_list
 
 if __name__ == "__main__":
     # 定义模型和初始消息
-    model = Qwen('/hy-tmp/hippo/models/Qwen2.5-Coder-7B', is_vllm=True)
-
-    # 初始化结果列表
-    querys = [] 
-    outputs = []
-
-    # 从文件中读取JSON数据
-    with open('/hy-tmp/hippo/data/sft_data/hippo_test_sft_data.json', 'r') as file:
-      json_data = json.load(file)
-
-    questions,label_list = extract_inputs(json_data,num_samples=2000)
-
-    # 遍历每个功效名词并生成 prompt
-    for q in tqdm(questions, desc="处理进度"):
-        # 将 prompt 添加到消息中
-        messages = [{'role': 'user', 'content': q}]
-        querys.append(messages)
-
-    responses = model.vllm_chat(querys)
-    for response in responses:
-        generated_text = response.outputs[0].text
-        outputs.append(generated_text)
-
-    data = [
-      ["问题", "标准答案", "base 预测答案"],
-    ]
-
-    for q,l,o in zip(questions, label_list, outputs):
-        data.append([q,l,o])
-
-    # 创建一个新的工作簿对象
-    workbook = Workbook()
-    # 获取默认的工作表
-    sheet = workbook.active
-
-    # 将数据逐行写入工作表中
-    for row in data:
-        sheet.append(row)
-
-    # 保存工作簿为Excel文件（这里指定了保存路径和文件名，可以根据实际需求修改）
-    workbook.save('/hy-tmp/hippo/hippo-coder/eval/hippo_eval_output.xlsx')
-
-    print("数据写入完成！")
+    model_path = sys.argv[3] if len(sys.argv) > 3 else '/hy-tmp/hippo/models/Qwen2.5-Coder-7B'
+    data_path = sys.argv[1] if len(sys.argv) > 1 else '/hy-tmp/hippo/data/sft_data/hippo_test_sft_data.json'
+    result_file = sys.argv[2] if len(sys.argv) > 2 else '/hy-tmp/hippo/hippo-coder/eval/hippo_eval_results.jsonl'
+    # 生成结果缓存，默认与结果文件放在同一目录
+    cache_file = sys.argv[4] if len(sys.argv) > 4 else os.path.join(os.path.dirname(os.path.abspath(result_file)),
+                                                                    'completion_cache.sqlite')
+    model_name = os.path.basename(model_path)
+    model = Qwen(model_path, is_vllm=True)
+    # 使用 OpenAI 兼容服务 / CPU 上的 stub 后端：
+    # model = Qwen(model_path, backend=create_backend('openai', base_url='http://127.0.0.1:8000/v1', model=model_name))
+    # model = Qwen(model_path, backend=create_backend('stub', seed=0))
+    # 生成结果缓存：只改评分、或与未变化的基座模型对比时不再重复生成，中断后从断点继续
+    model.backend = CachedBackend(model.backend, CompletionCache(cache_file),
+                                  model_id=model_fingerprint(model_path, hash_cache=f'{cache_file}.hashes.json'))
+
+    # raw_fim 为 True 时直接按 FIM 续写（推荐）；为 False 时沿用 chat 模板包装
+    raw_fim = True
+    sampling_settings = {
+        'greedy': {'temperature': 0, 'max_tokens': 512},
+        'sample': {'temperature': 0.7, 'top_p': 0.8, 'repetition_penalty': 1.05, 'max_tokens': 512},
+    }
+
+    # 流式读取评测数据，读够 num_samples 条即停止；多机评测时用 shard_index / num_shards 分片
+    samples = iter_eval_samples(data_path, num_samples=2000)
+    sample_ids,questions,label_list = extract_inputs(samples)
+
+    if raw_fim:
+        run_outputs = model.fim_complete(questions, max_prompt_tokens=2048, sampling_settings=sampling_settings)
+    else:
+        # 初始化结果列表
+        querys = [] 
+        # 遍历每个功效名词并生成 prompt
+        for q in tqdm(questions, desc="处理进度"):
+            # 将 prompt 添加到消息中
+            messages = [{'role': 'user', 'content': q}]
+            querys.append(messages)
+        run_outputs = {'chat': model.vllm_chat(querys)}
+
+    # 追加写入结果存储，键为 (sample_id, model)，model 为 "模型名@设置名"，评分阶段 eval03 直接读取
+    store = ResultStore(result_file)
+    for setting, outputs in run_outputs.items():
+        run_name = f'{model_name}@{setting}'
+        store.append({'sample_id': i, 'model': run_name, 'question': q, 'label': l, 'prediction': o}
+                     for i, q, l, o in zip(sample_ids, questions, label_list, outputs))
+
+    # 可选：导出 Excel 便于人工查看
+    # store.export_excel('/hy-tmp/hippo/hippo-coder/eval/hippo_eval_output.xlsx', model=f'{model_name}@greedy',
+    #                    columns=['question', 'label', 'prediction'])
+
+    print(f"数据写入完成！缓存命中 {model.backend.hits} 条，新生成 {model.backend.misses} 条")
 
     # # 打开文件，使用 'w' 模式表示写入（如果文件不存在则创建，如果存在则覆盖）
     # with open('/hy-tmp/hippo/hippo-coder/eval/hippo_eval_output.csv', 'w', newline='', encoding='utf-8') as csvfile:
@@ -0,0 +1,58 @@
+# coding=utf-8
+"""
+@Desc  : 文件内容哈希缓存：{绝对路径: [大小, mtime_ns, sha256]}，大小和修改时间不变时不重新读文件
+         流水线编排（orchestrator）计算阶段输入的哈希、评测（eval/completion_cache）计算模型权重指纹时共用
+"""
+import os
+import json
+import hashlib
+import threading
+
+
+class FileHashCache:
+    def __init__(self, path=None) -> None:
+        """
+        :param path: 持久化的 JSON 文件，为 None 时只在内存中缓存
+        """
+        self.path = path
+        self.entries = {}
+        self._lock = threading.Lock()
+        if path and os.path.exists(path):
+            try:
+                with open(path, 'r', encoding='utf-8') as f:
+                    self.entries = json.load(f)
+            except (OSError, ValueError):
+                self.entries = {}
+
+    def digest(self, file_path):
+        file_path = os.path.abspath(file_path)
+        stat = os.stat(file_path)
+        with self._lock:
+            entry = self.entries.get(file_path)
+        if entry and entry[0] == stat.st_size and entry[1] == stat.st_mtime_ns:
+            return entry[2]
+        sha = hashlib.sha256()
+        with open(file_path, 'rb') as f:
+            for block in iter(lambda: f.read(1 << 20), b''):
+                sha.update(block)
+        digest = sha.hexdigest()
+        with self._lock:
+            self.entries[file_path] = [stat.st_size, stat.st_mtime_ns, digest]
+        return digest
+
+    def save(self) -> None:
+        if not self.path:
+            return
+        with self._lock:
+            entries = {path: entry for path, entry in self.entries.items() if os.path.exists(path)}
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        write_json_atomic(self.path, entries)
+
+
+def write_json_atomic(path, data) -> None:
+    tmp_path = f'{path}.{os.getpid()}.{threading.get_ident()}.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(data, f, ensure_ascii=False, indent=1)
+    os.replace(tmp_path, path)
@@ -0,0 +1,175 @@
+# coding=utf-8
+"""
+@Desc  : hippo-coder 数据与评测流水线的阶段定义
+         00_req -> 01_download -> run.sh -> demo02 -> code_test_mod3_4 -> corpus_stats -> chunk_size_sampler
+         -> code_cut04_2 (训练集 / 评测集) -> tran (训练 SFT) / leakage_check -> tran (评测 SFT) -> vLLM_eval -> eval03
+         用法: python pipeline/hippo_pipeline.py --workspace <工作区> [目标阶段 ...] [--force 阶段 ...] [--dry-run]
+"""
+import os
+import sys
+import shutil
+import argparse
+
+from orchestrator import Pipeline, Stage, python_call
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+PIPELINE_DIR = os.path.join(REPO_ROOT, 'pipeline')
+PYTHON = sys.executable
+
+
+def repo_path(*parts):
+    return os.path.join(REPO_ROOT, *parts)
+
+
+# 逐个项目提取合并 Verilog 文件
+def extract_projects(repos_dir, output_dir):
+    """
+    demo02 把一个项目中同类后缀的文件合并为 merged{后缀}，这里对每个解压后的项目分别运行，
+    输出重命名为 {项目名}{后缀} 平铺到 output_dir，避免打分后复制到评测集 / 训练集时同名文件互相覆盖
+    """
+    sys.path.insert(0, repo_path('codeExtraction'))
+    from demo02 import VerilogFileProcessor
+
+    os.makedirs(output_dir, exist_ok=True)
+    for name in sorted(os.listdir(repos_dir)):
+        project_path = os.path.join(repos_dir, name)
+        if not os.path.isdir(project_path):
+            continue
+        project_output = os.path.join(output_dir, f'.{name}.tmp')
+        VerilogFileProcessor(project_path, project_output).run()
+        if os.path.isdir(project_output):
+            for merged in os.listdir(project_output):
+                ext = os.path.splitext(merged)[-1]
+                os.replace(os.path.join(project_output, merged), os.path.join(output_dir, f'{name}{ext}'))
+            shutil.rmtree(project_output)
+
+
+def build_pipeline(workspace, model_path='/hy-tmp/hippo/models/Qwen2.5-Coder-7B', model_name='Qwen2.5-Coder-7B',
+                   workers=None):
+    """
+    :param workspace: 工作区，所有中间结果和检查点都在这里
+    :param model_path: vLLM_eval 使用的模型
+    :param workers: code_cut04_2 的进程数
+    """
+    workspace = os.path.abspath(workspace)
+    workers = workers or os.cpu_count() or 1
+    # 本地检查点目录（权重、配置、分词器）作为 generate 的输入，同一路径下的检查点被替换后重新生成；
+    # 不是本地目录时（如 Hub 上的模型名）只有路径字符串进入检查点键
+    model_inputs = [os.path.abspath(model_path)] if os.path.isdir(model_path) else []
+
+    def ws(*parts):
+        return os.path.join(workspace, *parts)
+
+    def chunk_stage(name, input_folder):
+        # code_cut04_2 启动时 rmtree ./output3，每个切块阶段使用各自的运行目录
+        return Stage(name,
+                     python_call(repo_path('code_sys'), 'code_cut04_2', 'main', input_folder=ws(input_folder),
+                                 seed=0, workers=workers, syntax_aware=True,
+                                 size_sampler_path=ws('stats', 'chunk_size_sampler.json')),
+                     inputs=[repo_path('code_sys', 'code_cut04_2.py'), repo_path('code_sys', 'verilog_boundary.py'),
+                             repo_path('code_sys', 'chunk_size_sampler.py'),
+                             repo_path('code_sys', 'pipeline_metrics.py'),
+                             input_folder, 'stats/chunk_size_sampler.json'],
+                     outputs=[f'{name}/output3', f'{name}/error_files.log'],
+                     cwd=name)
+
+    def sft_stage(name, input_file, output_file, sample_size, spm_rate=0.5):
+        return Stage(name,
+                     python_call(repo_path('sft_data'), 'tran', 'transform_data', input_file=ws(input_file),
+                                 output_file=ws('sft', output_file), sample_size=sample_size, seed=0,
+                                 spm_rate=spm_rate),
+                     inputs=[repo_path('sft_data', 'tran.py'), repo_path('sft_data', 'fim_templates.py'), input_file],
+                     outputs=[f'sft/{output_file}'],
+                     cwd='sft')
+
+    stages = [
+        Stage('repo_list',
+              [PYTHON, repo_path('data_collection', '00_req.py'), ws('repo_lists', 'repos.json')],
+              inputs=[repo_path('data_collection', '00_req.py')],
+              outputs=['repo_lists/repos.json'],
+              cwd='repo_lists'),
+        # 01_download 跳过已下载的压缩包，保留旧输出做增量下载
+        Stage('download',
+              [PYTHON, repo_path('data_collection', '01_download.py'), ws('repo_lists', 'repos.json'), ws('zipfiles')],
+              inputs=[repo_path('data_collection', '01_download.py'), 'repo_lists/repos.json'],
+              outputs=['zipfiles'],
+              clean_outputs=False),
+        Stage('unzip',
+              ['bash', repo_path('data_collection', 'run.sh'), ws('zipfiles'), ws('repos')],
+              inputs=[repo_path('data_collection', 'run.sh'), 'zipfiles'],
+              outputs=['repos']),
+        Stage('extract',
+              python_call(PIPELINE_DIR, 'hippo_pipeline', 'extract_projects', repos_dir=ws('repos'),
+                          output_dir=ws('code-verilog')),
+              inputs=[repo_path('codeExtraction', 'demo02.py'), repo_path('pipeline', 'hippo_pipeline.py'), 'repos'],
+              outputs=['code-verilog']),
+        # code_test_mod3_4 读取 ./code-verilog，重建 ./Selected、./评测集、./训练集，CSV 写在输入目录中
+        Stage('score',
+              [PYTHON, repo_path('code_sys', 'code_test_mod3_4.py')],
+              inputs=[repo_path('code_sys', 'code_test_mod3_4.py'), repo_path('code_sys', 'pipeline_metrics.py'),
+                      'code-verilog'],
+              outputs=['Selected', '评测集', '训练集', 'code-verilog/verilog_analysis_results.csv']),
+        Stage('stats',
+              [PYTHON, repo_path('code_sys', 'corpus_stats.py'), ws('训练集')],
+              inputs=[repo_path('code_sys', 'corpus_stats.py'), '训练集'],
+              outputs=['stats/corpus_stats.json', 'stats/corpus_stats_files.npz'],
+              cwd='stats'),
+        Stage('chunk_sampler',
+              [PYTHON, repo_path('code_sys', 'chunk_size_sampler.py'), ws('stats', 'corpus_stats.json'),
+               ws('stats', 'chunk_size_sampler.json')],
+              inputs=[repo_path('code_sys', 'chunk_size_sampler.py'), 'stats/corpus_stats.json'],
+              outputs=['stats/chunk_size_sampler.json'],
+              cwd='stats'),
+        chunk_stage('chunk_train', '训练集'),
+        chunk_stage('chunk_eval', '评测集'),
+        sft_stage('sft_train', 'chunk_train/output3/task2/result2.jsonl', 'hippo_train_sft_data.jsonl', 12000),
+        # leakage_check 读取 prefix/middle/suffix 格式的切块数据，评测集去掉与训练集重合的样本后再转换
+        Stage('leakage',
+              [PYTHON, repo_path('sft_data', 'leakage_check.py'), ws('chunk_train', 'output3', 'task2', 'result2.jsonl'),
+               ws('chunk_eval', 'output3', 'task2', 'result2.jsonl')],
+              inputs=[repo_path('sft_data', 'leakage_check.py'), 'chunk_train/output3/task2/result2.jsonl',
+                      'chunk_eval/output3/task2/result2.jsonl'],
+              outputs=['leakage/leakage_report.jsonl', 'leakage/test_clean.jsonl'],
+              cwd='leakage'),
+        # 评测集只用 PSM 格式，与 vLLM_eval 的 FIM 提示词一致
+        sft_stage('sft_eval', 'leakage/test_clean.jsonl', 'hippo_test_sft_data.jsonl', 2000, spm_rate=0),
+        # 生成结果缓存放在工作区的 cache 目录，跨运行保留，不作为声明输出（否则重跑前会被清空）
+        Stage('generate',
+              [PYTHON, repo_path('eval', 'vLLM_eval.py'), ws('sft', 'hippo_test_sft_data.jsonl'),
+               ws('eval', 'hippo_eval_results.jsonl'), model_path, ws('cache', 'completion_cache.sqlite')],
+              inputs=[repo_path('eval', name) for name in ('vLLM_eval.py', 'backends.py', 'fim_prompts.py',
+                                                           'prefix_order.py', 'completion_cache.py',
+                                                           'eval_dataset.py', 'result_store.py')]
+                     + [repo_path('pipeline', 'file_hashes.py'), repo_path('sft_data', 'tran.py'),
+                        'sft/hippo_test_sft_data.jsonl'] + model_inputs,
+              outputs=['eval/hippo_eval_results.jsonl'],
+              cwd='eval'),
+        Stage('eval_scores',
+              [PYTHON, repo_path('eval', 'eval03.py'), ws('eval', 'hippo_eval_results.jsonl'), f'{model_name}@greedy',
+               ws('eval', 'hippo_eval_scores.jsonl')],
+              inputs=[repo_path('eval', 'eval03.py'), repo_path('eval', 'code_metrics.py'),
+                      repo_path('eval', 'result_store.py'), 'eval/hippo_eval_results.jsonl'],
+              outputs=['eval/hippo_eval_scores.jsonl'],
+              cwd='eval'),
+    ]
+    return Pipeline(workspace, stages)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='hippo-coder 流水线')
+    parser.add_argument('targets', nargs='*', help='要产出的阶段，默认全部（自动包含上游阶段）')
+    parser.add_argument('--workspace', default='pipeline_workspace')
+    parser.add_argument('--model-path', default='/hy-tmp/hippo/models/Qwen2.5-Coder-7B')
+    parser.add_argument('--jobs', type=int, default=4, help='最多同时运行的阶段数')
+    parser.add_argument('--force', nargs='*', default=[], help='无论检查点如何都重跑的阶段')
+    parser.add_argument('--dry-run', action='store_true', help='只列出需要重跑的阶段')
+    args = parser.parse_args()
+
+    pipeline = build_pipeline(args.workspace, model_path=args.model_path,
+                              model_name=os.path.basename(args.model_path.rstrip('/')))
+    if args.dry_run:
+        for name, action, reason in pipeline.plan(args.targets, args.force):
+            print(f"{name:<16} {action:<8} {reason}")
+    else:
+        status = pipeline.run(args.targets, args.force, jobs=args.jobs)
+        sys.exit(1 if any(state in ('failed', 'blocked') for state in status.values()) else 0)
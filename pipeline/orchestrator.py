@@ -0,0 +1,328 @@
+# coding=utf-8
+"""
+@Desc  : 流水线编排：把各个脚本建模为声明了输入 / 输出的阶段组成的 DAG
+         依赖关系由路径推导（某阶段的输入与另一阶段的输出重叠即依赖后者），
+         阶段的检查点键为 (命令, 工作目录, 环境变量, 全部输入的内容哈希) 的哈希，键不变且输出未被改动时跳过；
+         上游重跑但输出内容不变时，下游的键也不变，不会连锁重跑
+         互不依赖的阶段并发运行；每个阶段在自己的工作目录中以子进程运行，运行前清空声明的输出，
+         脚本启动时 rmtree 输出目录、写死相对路径也不会互相覆盖
+"""
+import os
+import sys
+import json
+import time
+import shutil
+import fnmatch
+import hashlib
+import threading
+import subprocess
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+from file_hashes import FileHashCache, write_json_atomic
+
+# 计算内容哈希时忽略的文件（缓存、字节码等不影响结果的文件）
+DEFAULT_IGNORE = ('__pycache__', '*.pyc', '*.bidx.json', '.pipeline')
+
+
+class Stage:
+    def __init__(self, name, command, inputs=(), outputs=(), cwd=None, env=None, deps=(), clean_outputs=True):
+        """
+        :param command: 子进程命令（参数列表）
+        :param inputs: 输入路径（文件或目录，相对路径相对于工作区），脚本本身也应列为输入，代码改动后自动重跑
+        :param outputs: 输出路径，同一路径只能由一个阶段输出
+        :param cwd: 运行目录（相对于工作区），默认为工作区根目录
+        :param env: 额外的环境变量
+        :param deps: 无法从路径推导的显式依赖（阶段名）
+        :param clean_outputs: 运行前是否删除已有输出；增量下载等需要保留旧输出的阶段设为 False
+        """
+        self.name = name
+        self.command = [str(arg) for arg in command]
+        self.inputs = list(inputs)
+        self.outputs = list(outputs)
+        self.cwd = cwd
+        self.env = dict(env or {})
+        self.deps = set(deps)
+        self.clean_outputs = clean_outputs
+
+
+def python_call(module_dir, module, function, **kwargs):
+    """
+    构造在子进程中调用 module.function(**kwargs) 的命令，用于只提供函数入口、__main__ 写死参数的脚本
+    """
+    code = (f"import sys, json; sys.path.insert(0, {module_dir!r}); "
+            f"from {module} import {function}; {function}(**json.loads(sys.argv[1]))")
+    return [sys.executable, '-c', code, json.dumps(kwargs, ensure_ascii=False, sort_keys=True)]
+
+
+def is_within(path, parent):
+    return path == parent or path.startswith(parent.rstrip(os.sep) + os.sep)
+
+
+def overlaps(a, b):
+    return is_within(a, b) or is_within(b, a)
+
+
+class Pipeline:
+    def __init__(self, workspace, stages, ignore=DEFAULT_IGNORE) -> None:
+        """
+        :param workspace: 工作区目录，阶段中的相对路径都相对于它；检查点保存在 {workspace}/.pipeline
+        :param stages: Stage 列表
+        :param ignore: 计算内容哈希时忽略的文件名模式
+        """
+        self.workspace = os.path.abspath(workspace)
+        self.state_dir = os.path.join(self.workspace, '.pipeline')
+        self.ignore = tuple(ignore)
+        self.stages = {}
+        for stage in stages:
+            if stage.name in self.stages:
+                raise ValueError(f"阶段重名: {stage.name}")
+            stage.inputs = [self.resolve(path) for path in stage.inputs]
+            stage.outputs = [self.resolve(path) for path in stage.outputs]
+            stage.cwd = self.resolve(stage.cwd or '.')
+            self.stages[stage.name] = stage
+
+        self.producers = {}
+        for stage in self.stages.values():
+            for output in stage.outputs:
+                if output in self.producers:
+                    raise ValueError(f"输出 {output} 同时由 {self.producers[output]} 和 {stage.name} 产生")
+                self.producers[output] = stage.name
+        self.deps = self.infer_deps()
+        self.order = self.topological_order()
+
+        os.makedirs(self.state_dir, exist_ok=True)
+        self.checkpoint_path = os.path.join(self.state_dir, 'checkpoints.json')
+        self.checkpoints = {}
+        if os.path.exists(self.checkpoint_path):
+            with open(self.checkpoint_path, 'r', encoding='utf-8') as f:
+                self.checkpoints = json.load(f)
+        self.hash_cache = FileHashCache(os.path.join(self.state_dir, 'file_hashes.json'))
+        self._lock = threading.Lock()
+
+    def resolve(self, path):
+        return os.path.normpath(os.path.join(self.workspace, path))
+
+    def owner_output(self, path):
+        """
+        包含 path 的最深一层声明输出，path 不属于任何阶段的输出时返回 None
+        """
+        owners = [output for output in self.producers if is_within(path, output)]
+        return max(owners, key=len) if owners else None
+
+    def foreign_outputs(self, path):
+        """
+        path 属于某阶段的输出目录时，其他阶段写在其中的输出（如打分阶段写在提取结果目录中的 CSV）
+        这些文件不计入 path 的内容哈希，读取 path 的阶段也不依赖写入它们的阶段
+        """
+        owner = self.owner_output(path)
+        if owner is None:
+            return []
+        return [output for output, producer in self.producers.items()
+                if output != path and is_within(output, path) and producer != self.producers[owner]]
+
+    def infer_deps(self):
+        deps = {}
+        for stage in self.stages.values():
+            deps[stage.name] = set(stage.deps)
+            for path in stage.inputs:
+                foreign = self.foreign_outputs(path)
+                for output, producer in self.producers.items():
+                    if producer == stage.name or output in foreign:
+                        continue
+                    if overlaps(path, output):
+                        deps[stage.name].add(producer)
+            unknown = deps[stage.name] - set(self.stages)
+            if unknown:
+                raise ValueError(f"阶段 {stage.name} 依赖了不存在的阶段: {', '.join(sorted(unknown))}")
+        return deps
+
+    def topological_order(self):
+        order = []
+        state = {}
+
+        def visit(name, path):
+            if state.get(name) == 'done':
+                return
+            if state.get(name) == 'visiting':
+                raise ValueError(f"阶段依赖存在环: {' -> '.join(path + [name])}")
+            state[name] = 'visiting'
+            for dep in sorted(self.deps[name]):
+                visit(dep, path + [name])
+            state[name] = 'done'
+            order.append(name)
+
+        for name in self.stages:
+            visit(name, [])
+        return order
+
+    def upstream(self, targets):
+        selected = set()
+        pending = list(targets)
+        while pending:
+            name = pending.pop()
+            if name not in self.stages:
+                raise ValueError(f"未知阶段: {name}")
+            if name not in selected:
+                selected.add(name)
+                pending.extend(self.deps[name])
+        return selected
+
+    # ------------------------------------------------------------------ 内容哈希
+    def is_ignored(self, name):
+        return any(fnmatch.fnmatch(name, pattern) for pattern in self.ignore)
+
+    def hash_path(self, path):
+        """
+        文件：内容哈希；目录：按相对路径排序后对 (相对路径, 文件哈希) 再做哈希；不存在：None
+        """
+        if os.path.isfile(path):
+            return self.hash_cache.digest(path)
+        if not os.path.isdir(path):
+            return None
+        nested_outputs = self.foreign_outputs(path)
+        sha = hashlib.sha256()
+        for root, dirs, files in os.walk(path):
+            dirs[:] = sorted(d for d in dirs if not self.is_ignored(d)
+                             and os.path.join(root, d) not in nested_outputs)
+            for name in sorted(files):
+                file_path = os.path.join(root, name)
+                if self.is_ignored(name) or file_path in nested_outputs:
+                    continue
+                sha.update(os.path.relpath(file_path, path).encode('utf-8') + b'\0')
+                sha.update(self.hash_cache.digest(file_path).encode('ascii') + b'\n')
+        return 'dir:' + sha.hexdigest()
+
+    def stage_key(self, stage):
+        inputs = {}
+        for path in stage.inputs:
+            digest = self.hash_path(path)
+            if digest is None:
+                raise FileNotFoundError(f"阶段 {stage.name} 的输入不存在: {path}")
+            inputs[os.path.relpath(path, self.workspace)] = digest
+        payload = {'command': stage.command, 'cwd': os.path.relpath(stage.cwd, self.workspace), 'env': stage.env,
+                   'inputs': inputs}
+        return hashlib.sha256(json.dumps(payload, sort_keys=True, ensure_ascii=False).encode('utf-8')).hexdigest()
+
+    def output_hashes(self, stage):
+        return {os.path.relpath(path, self.workspace): self.hash_path(path) for path in stage.outputs}
+
+    def is_up_to_date(self, stage, key):
+        checkpoint = self.checkpoints.get(stage.name)
+        if not checkpoint or checkpoint['key'] != key:
+            return False
+        # 输出被删除或被手工改动时重跑
+        return checkpoint['outputs'] == self.output_hashes(stage)
+
+    # ------------------------------------------------------------------ 运行
+    def run_stage(self, stage, key):
+        if stage.clean_outputs:
+            for path in stage.outputs:
+                if os.path.isdir(path):
+                    shutil.rmtree(path)
+                elif os.path.exists(path):
+                    os.remove(path)
+        os.makedirs(stage.cwd, exist_ok=True)
+        for path in stage.outputs:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+
+        log_dir = os.path.join(self.state_dir, 'logs')
+        os.makedirs(log_dir, exist_ok=True)
+        log_path = os.path.join(log_dir, f'{stage.name}.log')
+        env = {**os.environ, **stage.env}
+        start = time.perf_counter()
+        with open(log_path, 'w', encoding='utf-8') as log_file:
+            returncode = subprocess.run(stage.command, cwd=stage.cwd, env=env, stdout=log_file,
+                                        stderr=subprocess.STDOUT).returncode
+        seconds = time.perf_counter() - start
+        if returncode != 0:
+            raise RuntimeError(f"退出码 {returncode}，日志: {log_path}")
+
+        missing = [path for path in stage.outputs if not os.path.exists(path)]
+        if missing:
+            raise RuntimeError(f"运行结束后缺少输出: {', '.join(missing)}，日志: {log_path}")
+        with self._lock:
+            self.checkpoints[stage.name] = {'key': key, 'outputs': self.output_hashes(stage),
+                                            'seconds': round(seconds, 3),
+                                            'finished': time.strftime('%Y-%m-%d %H:%M:%S')}
+            write_json_atomic(self.checkpoint_path, self.checkpoints)
+        return seconds
+
+    def plan(self, targets=None, force=()):
+        """
+        不运行，只按当前输入判断哪些阶段需要重跑（上游需要重跑的阶段一律视为需要重跑）
+        :return: [(阶段名, 'run' / 'cached', 原因)]
+        """
+        selected = self.upstream(targets or self.stages)
+        stale = set()
+        result = []
+        for name in self.order:
+            if name not in selected:
+                continue
+            stage = self.stages[name]
+            if name in force:
+                reason = '强制重跑'
+            elif self.deps[name] & stale:
+                reason = f"上游需要重跑: {', '.join(sorted(self.deps[name] & stale))}"
+            else:
+                try:
+                    reason = None if self.is_up_to_date(stage, self.stage_key(stage)) else '输入或输出有变化'
+                except FileNotFoundError as e:
+                    reason = str(e)
+            if reason:
+                stale.add(name)
+            result.append((name, 'run' if reason else 'cached', reason or ''))
+        return result
+
+    def run(self, targets=None, force=(), jobs=4):
+        """
+        :param targets: 要产出的阶段，默认全部；会自动带上所有上游阶段
+        :param force: 无论检查点如何都重跑的阶段
+        :param jobs: 最多同时运行的阶段数
+        :return: {阶段名: 'ran' / 'cached' / 'failed' / 'blocked'}
+        """
+        selected = self.upstream(targets or self.stages)
+        pending = [name for name in self.order if name in selected]
+        status = {}
+        running = {}
+
+        def submit_ready(executor):
+            for name in list(pending):
+                deps = self.deps[name]
+                if any(status.get(dep) in ('failed', 'blocked') for dep in deps):
+                    status[name] = 'blocked'
+                    pending.remove(name)
+                    print(f"[跳过] {name}: 上游失败")
+                elif all(status.get(dep) in ('ran', 'cached') for dep in deps):
+                    pending.remove(name)
+                    running[executor.submit(self.execute, name, name in force)] = name
+
+        with ThreadPoolExecutor(max_workers=jobs) as executor:
+            submit_ready(executor)
+            while running:
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    name = running.pop(future)
+                    try:
+                        status[name] = future.result()
+                    except Exception as e:
+                        status[name] = 'failed'
+                        print(f"[失败] {name}: {e}")
+                submit_ready(executor)
+        self.hash_cache.save()
+
+        counts = {state: sum(1 for value in status.values() if value == state)
+                  for state in ('ran', 'cached', 'failed', 'blocked')}
+        print(f"运行 {counts['ran']} 个阶段，命中检查点 {counts['cached']} 个，"
+              f"失败 {counts['failed']} 个，因上游失败跳过 {counts['blocked']} 个")
+        return status
+
+    def execute(self, name, forced=False):
+        stage = self.stages[name]
+        key = self.stage_key(stage)
+        if not forced and self.is_up_to_date(stage, key):
+            print(f"[检查点] {name}")
+            return 'cached'
+        print(f"[运行] {name}")
+        seconds = self.run_stage(stage, key)
+        print(f"[完成] {name} {seconds:.1f}s")
+        return 'ran'
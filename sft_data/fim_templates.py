@@ -0,0 +1,70 @@
+# coding=utf-8
+"""
+FIM 提示词模板：不同模型的 FIM 特殊符号不同，统一在这里注册，
+同一份 prefix/middle/suffix 可以一次渲染出多种模型的格式
+PSM: <pre> prefix <suf> suffix <mid>   -> middle
+SPM: <pre> <suf> suffix <mid> prefix   -> middle （FIM 论文中的 SPM variant 2，与 data_cut_tzb.permute 一致）
+"""
+
+
+class FimTemplate:
+    def __init__(self, name, prefix_token, suffix_token, middle_token, token_ids=None) -> None:
+        """
+        :param name: 模板名
+        :param prefix_token / suffix_token / middle_token: 三个 FIM 特殊符号的文本
+        :param token_ids: 可选，{特殊符号文本: token id}，用于直接在 token id 上渲染
+        """
+        self.name = name
+        self.prefix_token = prefix_token
+        self.suffix_token = suffix_token
+        self.middle_token = middle_token
+        # 预先拼好固定片段，渲染时只做一次 join
+        self._spm_head = prefix_token + suffix_token
+        self.token_ids = None
+        if token_ids is not None:
+            self.bind_token_ids(token_ids)
+
+    def bind_token_ids(self, token_ids):
+        """
+        绑定分词器中的特殊符号 id，返回 self
+        """
+        self.token_ids = (token_ids[self.prefix_token], token_ids[self.suffix_token], token_ids[self.middle_token])
+        return self
+
+    def render(self, prefix, suffix, spm=False):
+        if spm:
+            return ''.join((self._spm_head, suffix, self.middle_token, prefix))
+        return ''.join((self.prefix_token, prefix, self.suffix_token, suffix, self.middle_token))
+
+    def render_ids(self, prefix_ids, suffix_ids, spm=False):
+        """
+        在 token id 上渲染，prefix_ids / suffix_ids 为 list，返回 list
+        """
+        if self.token_ids is None:
+            raise ValueError(f"模板 {self.name} 未绑定特殊符号 token id，请先调用 bind_token_ids")
+        prefix_id, suffix_id, middle_id = self.token_ids
+        if spm:
+            return [prefix_id, suffix_id, *suffix_ids, middle_id, *prefix_ids]
+        return [prefix_id, *prefix_ids, suffix_id, *suffix_ids, middle_id]
+
+
+FIM_TEMPLATES = {}
+
+
+def register_template(template):
+    FIM_TEMPLATES[template.name] = template
+    return template
+
+
+def get_template(name):
+    if name not in FIM_TEMPLATES:
+        raise KeyError(f"未注册的 FIM 模板: {name}，可选: {', '.join(FIM_TEMPLATES)}")
+    return FIM_TEMPLATES[name]
+
+
+register_template(FimTemplate('qwen', '<|fim_prefix|>', '<|fim_suffix|>', '<|fim_middle|>'))
+register_template(FimTemplate('starcoder', '<fim_prefix>', '<fim_suffix>', '<fim_middle>'))
+register_template(FimTemplate('deepseek', '<｜fim▁begin｜>', '<｜fim▁hole｜>', '<｜fim▁end｜>'))
+# code_sys/data_cut_tzb.py 中自定义 tiktoken 分词器使用的符号
+register_template(FimTemplate('hippo', '<fim-prefix>', '<fim-suffix>', '<fim-middle>',
+                              token_ids={'<fim-prefix>': 50300, '<fim-suffix>': 50500, '<fim-middle>': 50400}))
@@ -0,0 +1,172 @@
+# coding=utf-8
+"""
+训练集 / 评测集泄漏检查
+在训练集上构建 n-gram 哈希索引，流式扫描评测集每条数据的 prefix/middle/suffix，
+统计覆盖 middle 的 n-gram 在训练集中出现的比例，超过阈值的判定为泄漏（ABC 生成的网表高度相似，很容易出现）
+"""
+import re
+import sys
+import json
+import zlib
+import numpy as np
+from tqdm import tqdm
+
+from tran import iter_records
+
+TOKEN_PATTERN = re.compile(r'\w+|[^\w\s]')
+HASH_BASE = np.uint64(1099511628211)
+
+
+# 代码分词：标识符/数字为一个 token，其余符号各为一个 token，忽略空白
+def tokenize(text):
+    return TOKEN_PATTERN.findall(text)
+
+
+class NgramIndex:
+    def __init__(self, n: int = 10) -> None:
+        """
+        :param n: n-gram 长度（token 数）
+        """
+        self.n = n
+        self._token_hashes = {}  # token -> 稳定哈希，避免重复计算 crc32
+        self._pending = []  # 未压缩的单条记录 n-gram 哈希
+        self._batches = []  # 每批压缩后排好序的去重哈希，build 时一次合并
+        self.hashes = np.zeros(0, dtype=np.uint64)  # 排好序的去重 n-gram 哈希
+
+    def token_hashes(self, tokens):
+        cache = self._token_hashes
+        values = []
+        for token in tokens:
+            value = cache.get(token)
+            if value is None:
+                value = cache[token] = zlib.crc32(token.encode('utf-8')) | (len(token) << 32)
+            values.append(value)
+        return np.array(values, dtype=np.uint64)
+
+    def ngram_hashes(self, token_hashes):
+        """
+        多项式滚动哈希，在 uint64 上自然溢出取模；按位置向量化计算，每个 n-gram 一个整数
+        """
+        m = len(token_hashes) - self.n + 1
+        if m <= 0:
+            return np.zeros(0, dtype=np.uint64)
+        hashes = np.zeros(m, dtype=np.uint64)
+        for k in range(self.n):
+            hashes = hashes * HASH_BASE + token_hashes[k:k + m]
+        return hashes
+
+    def add(self, text) -> None:
+        self._pending.append(self.ngram_hashes(self.token_hashes(tokenize(text))))
+        # 积累到一定数量只对这一批去重，控制内存；不与已有索引合并，避免每批都对整个索引排序（总体平方复杂度）
+        if len(self._pending) >= 10000:
+            self._flush_pending()
+
+    def _flush_pending(self) -> None:
+        if self._pending:
+            self._batches.append(np.unique(np.concatenate(self._pending)))
+            self._pending = []
+
+    def build(self):
+        self._flush_pending()
+        if self._batches:
+            self.hashes = np.unique(np.concatenate([self.hashes, *self._batches]))
+            self._batches = []
+        return self
+
+    def contains(self, hashes):
+        if len(self.hashes) == 0 or len(hashes) == 0:
+            return np.zeros(len(hashes), dtype=bool)
+        idx = np.minimum(np.searchsorted(self.hashes, hashes), len(self.hashes) - 1)
+        return self.hashes[idx] == hashes
+
+    def save(self, path) -> None:
+        self.build()
+        np.save(path, self.hashes)
+
+    @classmethod
+    def load(cls, path, n=10):
+        index = cls(n)
+        index.hashes = np.load(path)
+        return index
+
+
+# 训练数据中每条记录的完整代码
+def record_text(item):
+    if 'code' in item:
+        return item['code']
+    return '\n'.join(item.get(key, '') for key in ('prefix', 'middle', 'suffix'))
+
+
+# 构建训练集索引
+def build_train_index(train_file, n=10):
+    index = NgramIndex(n)
+    for item in tqdm(iter_records(train_file), desc="构建训练集 n-gram 索引"):
+        index.add(record_text(item))
+    return index.build()
+
+
+# 计算一条评测数据与训练集的重合度
+def overlap_ratios(index, item):
+    """
+    prefix / suffix 分别计算自身 n-gram 的重合比例；
+    middle 使用所有覆盖到 middle 的 n-gram（可以跨到 prefix 尾部和 suffix 头部），
+    这样短于 n 个 token 的 middle 也能检查
+    """
+    prefix_tokens = tokenize(item.get('prefix', ''))
+    middle_tokens = tokenize(item.get('middle', ''))
+    suffix_tokens = tokenize(item.get('suffix', ''))
+
+    def ratio(hashes):
+        return float(index.contains(hashes).mean()) if len(hashes) else 0.0
+
+    all_hashes = index.ngram_hashes(index.token_hashes(prefix_tokens + middle_tokens + suffix_tokens))
+    middle_start = len(prefix_tokens)
+    middle_end = middle_start + len(middle_tokens)
+    first = max(0, middle_start - index.n + 1)
+    last = min(len(all_hashes), middle_end)
+
+    return {
+        'prefix': ratio(index.ngram_hashes(index.token_hashes(prefix_tokens))),
+        'middle': ratio(all_hashes[first:last]) if middle_tokens else 0.0,
+        'suffix': ratio(index.ngram_hashes(index.token_hashes(suffix_tokens))),
+    }
+
+
+# 流式扫描评测集
+def check_leakage(index, eval_file, report_file, clean_file=None, threshold=0.5):
+    """
+    :param report_file: 泄漏数据的报告（JSONL，包含 block_id、file_name 和各部分重合比例）
+    :param clean_file: 指定时把未泄漏的评测数据写出为 JSONL
+    :param threshold: middle 重合比例不低于该值时判定为泄漏
+    """
+    total = 0
+    leaked = 0
+    clean_out = open(clean_file, 'w', encoding='utf-8') if clean_file else None
+    try:
+        with open(report_file, 'w', encoding='utf-8') as report_out:
+            for item in tqdm(iter_records(eval_file), desc="扫描评测集"):
+                total += 1
+                ratios = overlap_ratios(index, item)
+                if ratios['middle'] >= threshold:
+                    leaked += 1
+                    report_out.write(json.dumps({
+                        'block_id': item.get('block_id'),
+                        'file_name': item.get('file_name'),
+                        'overlap': ratios,
+                    }, ensure_ascii=False) + '\n')
+                elif clean_out is not None:
+                    clean_out.write(json.dumps(item, ensure_ascii=False) + '\n')
+    finally:
+        if clean_out is not None:
+            clean_out.close()
+
+    print(f"评测集共 {total} 条，疑似泄漏 {leaked} 条（{leaked / (total or 1):.2%}），报告已写入 {report_file}")
+    return leaked, total
+
+
+if __name__ == "__main__":
+    train_file = sys.argv[1] if len(sys.argv) > 1 else "train.jsonl"
+    eval_file = sys.argv[2] if len(sys.argv) > 2 else "test.jsonl"
+
+    train_index = build_train_index(train_file, n=10)
+    check_leakage(train_index, eval_file, "leakage_report.jsonl", clean_file="test_clean.jsonl")
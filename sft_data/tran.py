@@ -37,46 +37,164 @@
 ```
 """
 
+import os
 import json
 import random
 
+from fim_templates import get_template
 
-def transform_data(input_file, output_file):
-    result = []
-    with open(input_file, 'r') as f:
-        data = f.read().strip().split('\n\n')  # 按两个换行符分割每个原始数据块
-        if len(data) >= 12000:
-            data = data[:12000]  # 抽取12000条数据
-        for item_str in data:
-            item = json.loads(item_str)
-            # 以50%的概率决定output的取值方式
-            if random.random() < 0.5:
-                new_item = {
-                    "instruction": "",
-                    "input": f"<|fim_prefix|>{item['prefix']}<|fim_suffix|>{item['suffix']}<|fim_middle|>",
-                    "output": item['middle']
-                }
-            else:
-                new_item = {
-                    "instruction": "",
-                    "input": f"<|fim_prefix|>{item['prefix']}<|fim_suffix|>{item['suffix']}<|fim_middle|>",
-                    "output": item['middle']
-                }
-            result.append(new_item)
-
-    print(f"共处理 {len(result)} 条数据")
-    with open(output_file, 'w') as f_out:
-        json.dump(result, f_out, indent=2)
+
+# 流式读取切块/掩码数据
+def iter_records(input_file, chunk_size=1 << 20):
+    """
+    逐条读取文件中的 JSON 对象，兼容 code_cut04_2 输出的“格式化 JSON + 空行分隔”、普通 JSONL，
+    以及顶层为数组的 JSON（如 hippo_test_sft_data.json，逐个产出数组元素），
+    每次只读入 chunk_size 个字符，内存占用与文件大小无关
+    """
+    decoder = json.JSONDecoder()
+    buffer = ''
+    in_array = None
+    with open(input_file, 'r', encoding='utf-8') as f:
+        while True:
+            chunk = f.read(chunk_size)
+            buffer += chunk
+            pos = 0
+            while True:
+                # 跳过对象之间的空白，顶层为数组时同时跳过括号和逗号
+                while pos < len(buffer) and (buffer[pos].isspace() or (in_array and buffer[pos] in ',]')):
+                    pos += 1
+                if pos >= len(buffer):
+                    break
+                if in_array is None:
+                    in_array = buffer[pos] == '['
+                    if in_array:
+                        pos += 1
+                    continue
+                try:
+                    item, pos = decoder.raw_decode(buffer, pos)
+                except json.JSONDecodeError:
+                    if not chunk:
+                        raise  # 文件已读完仍无法解析，说明数据本身有误
+                    break  # 对象还没读完整，继续读下一块
+                yield item
+            buffer = buffer[pos:]
+            if not chunk:
+                break
+
+
+# 转化为 SFT 格式
+def to_sft_records(item, templates, rng=random, spm_rate=0.5):
+    """
+    用每个模板各渲染一条 SFT 数据，同一条数据在所有模板中使用相同的 PSM/SPM 选择
+    :param templates: fim_templates.FimTemplate 列表
+    :return: 与 templates 一一对应的 SFT 数据列表
+    """
+    # 以 spm_rate 的概率使用 SPM 格式，否则使用 PSM 格式
+    spm = rng.random() < spm_rate
+    return [
+        {
+            "instruction": "",
+            "input": template.render(item['prefix'], item['suffix'], spm=spm),
+            "output": item['middle']
+        }
+        for template in templates
+    ]
+
+
+# 蓄水池抽样，从流中等概率抽取 sample_size 条
+def reservoir_sample(records, sample_size, rng=random):
+    reservoir = []
+    for i, record in enumerate(records):
+        if i < sample_size:
+            reservoir.append(record)
+        else:
+            j = rng.randint(0, i)
+            if j < sample_size:
+                reservoir[j] = record
+    return reservoir
+
+
+class ShardedJsonlWriter:
+    def __init__(self, output_file, shard_size=None) -> None:
+        """
+        按 JSONL 逐条写出，shard_size 不为 None 时每 shard_size 条切换到下一个分片文件：
+        output_file 为 data.jsonl 时分片依次为 data-00000.jsonl、data-00001.jsonl ...
+        """
+        self.output_file = output_file
+        self.shard_size = shard_size
+        self.count = 0
+        self.paths = []
+        self._file = None
+
+    def _shard_path(self, shard_index):
+        if self.shard_size is None:
+            return self.output_file
+        stem, ext = os.path.splitext(self.output_file)
+        return f"{stem}-{shard_index:05d}{ext or '.jsonl'}"
+
+    def write(self, record) -> None:
+        if self._file is None or (self.shard_size and self.count % self.shard_size == 0):
+            self.close()
+            path = self._shard_path(len(self.paths))
+            self.paths.append(path)
+            self._file = open(path, 'w', encoding='utf-8')
+        self._file.write(json.dumps(record, ensure_ascii=False) + '\n')
+        self.count += 1
+
+    def close(self) -> None:
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+
+def transform_data(input_file, output_file, sample_size=None, shard_size=None, seed=None, template_names=('qwen',),
+                   spm_rate=0.5):
+    """
+    流式转换：逐条读取切块/掩码数据，逐条写出 JSONL 格式的 SFT 数据
+    :param sample_size: 指定时用蓄水池抽样等概率抽取固定条数，否则全部转换
+    :param shard_size: 指定时按条数切分为多个输出文件
+    :param seed: 随机种子，用于抽样和 PSM/SPM 的选择
+    :param template_names: fim_templates 中注册的模板名，一次读取同时生成多种模型格式；
+                           多个模板时输出文件名为 <output_file 去掉后缀>.<模板名><后缀>
+    :param spm_rate: 使用 SPM 格式的概率
+    """
+    rng = random.Random(seed)
+    templates = [get_template(name) for name in template_names]
+    records = iter_records(input_file)
+    if sample_size is not None:
+        records = reservoir_sample(records, sample_size, rng)
+
+    stem, ext = os.path.splitext(output_file)
+    writers = [
+        ShardedJsonlWriter(output_file if len(templates) == 1 else f"{stem}.{template.name}{ext}", shard_size)
+        for template in templates
+    ]
+    try:
+        for item in records:
+            for writer, record in zip(writers, to_sft_records(item, templates, rng, spm_rate)):
+                writer.write(record)
+    finally:
+        for writer in writers:
+            writer.close()
+
+    for writer in writers:
+        print(f"共处理 {writer.count} 条数据，输出文件: {', '.join(writer.paths)}")
 
 
 if __name__ == "__main__":
     # n = 12000
     # input_file = r"F:\hippo-coder-best\hippo-coder\data\train.jsonl"
-    # output_file = "hippo_train_sft_data.txt"
+    # output_file = "hippo_train_sft_data.jsonl"
 
     # 数据量
     n = 2000
     input_file = r"F:\hippo-coder-best\hippo-coder\data\test.jsonl"
-    output_file = "hippo_test_sft_data.txt"
+    output_file = "hippo_test_sft_data.jsonl"
 
-    transform_data(input_file, output_file)
\ No newline at end of file
+    transform_data(input_file, output_file, sample_size=n, seed=0)